@@ -6,19 +6,119 @@ create table users(
   , default_currency_code    varchar(10)
 );
 
+-- Partitioned by month of lcl_dttm; rows of a month without a partition go to transactions_default
+-- until create_transactions_partitions() gives them one. The primary key has to include the
+-- partition key, so it is (transaction_id, lcl_dttm); transaction_id is a random uuid either way.
 create table transactions(
-  transaction_id               uuid                  primary key                           not null
-  , lcl_dttm                   timestamp             default (now() at time zone 'utc')
+  transaction_id               uuid                  not null
+  , lcl_dttm                   timestamp             not null    default (now() at time zone 'utc')
   , entity_type                varchar(50)
   , category                   varchar(50)
-  , user_uuid                  varchar(50)
+  , user_uuid                  uuid
   , amount_lcy                 numeric
   , currency_code              varchar(10)
   , place                      varchar(100)
   , description                varchar(100)
   , expected_transaction_id    uuid
+  , primary key (transaction_id, lcl_dttm)
+) partition by range (lcl_dttm);
+
+create table transactions_default partition of transactions default;
+
+create index transactions_user_dttm_idx on transactions (user_uuid, lcl_dttm);
+-- Rows arrive roughly in lcl_dttm order, so a BRIN index serves time range scans across users at a fraction of a btree's size
+create index transactions_dttm_brin_idx on transactions using brin (lcl_dttm);
+
+-- Creates the partition of transactions for the month of month_start unless it exists,
+-- moving that month's rows out of transactions_default. Returns whether it created one.
+create or replace function create_transactions_partition(month_start date) returns boolean
+language plpgsql as $$
+declare
+  range_start     date := date_trunc('month', month_start);
+  range_end       date := date_trunc('month', month_start) + interval '1 month';
+  partition_name  text := 'transactions_' || to_char(month_start, 'YYYY_MM');
+begin
+  if to_regclass(partition_name) is not null then
+    return false;
+  end if;
+  -- Attaching a table (rather than creating a partition) lets the default partition still hold the month's rows
+  execute format('create table %I (like transactions including defaults)', partition_name);
+  execute format(
+    'with moved as (delete from transactions_default where lcl_dttm >= %L and lcl_dttm < %L returning *) '
+    || 'insert into %I select * from moved',
+    range_start, range_end, partition_name
+  );
+  execute format(
+    'alter table transactions attach partition %I for values from (%L) to (%L)',
+    partition_name, range_start, range_end
+  );
+  return true;
+end
+$$;
+
+-- Partitions for the current month, months_ahead months after it and every month with rows in
+-- transactions_default (e.g. imported history). Run periodically by the bot; returns the number created.
+create or replace function create_transactions_partitions(months_ahead int) returns int
+language plpgsql as $$
+declare
+  current_month  date := date_trunc('month', now() at time zone 'utc');
+  month_start    date;
+  created        int := 0;
+begin
+  for month_start in
+    select generate_series(current_month, current_month + make_interval(months => months_ahead), interval '1 month')::date
+    union
+    select distinct date_trunc('month', lcl_dttm)::date from transactions_default
+    order by 1
+  loop
+    if create_transactions_partition(month_start) then
+      created := created + 1;
+    end if;
+  end loop;
+  return created;
+end
+$$;
+
+select create_transactions_partitions(3);
+
+-- Per user/month/category/currency totals, maintained by the application on every insert/delete
+create table monthly_rollups(
+  user_uuid          uuid           not null
+  , month_start      date           not null
+  , category         varchar(50)    not null    default ''
+  , currency_code    varchar(10)    not null    default ''
+  , total_amount     numeric        not null    default 0
+  , txn_count        int            not null    default 0
+  , primary key (user_uuid, month_start, category, currency_code)
+);
+
+-- Monthly spending limits set with /budget; spending is read from monthly_rollups in currency_code
+create table budgets(
+  user_uuid         uuid           not null
+  , category        varchar(50)    not null
+  , currency_code   varchar(10)    not null
+  , amount_limit    numeric        not null
+  , primary key (user_uuid, category)
+);
+
+-- Recurring expectations (rent, subscriptions, salary) defined by users with /recurring
+create table recurring_transactions(
+  recurring_uuid        uuid           primary key
+  , user_uuid           uuid           not null
+  , category            varchar(50)    not null
+  , amount_lcy          numeric        not null
+  , currency_code       varchar(10)
+  , period              interval       not null
+  , start_date          date           not null
+  , match_window_days   int            not null    default 3
+  , amount_tolerance    numeric        not null    default 0.1
+  , active              boolean        not null    default true
 );
 
+create index recurring_transactions_user_idx on recurring_transactions (user_uuid);
+
+-- Occurrences of recurring_transactions, materialized ahead of their due date (lcl_dttm).
+-- An occurrence is matched once a transaction points at it via transactions.expected_transaction_id.
 create table expected_transactions(
   expected_transaction_uuid    uuid          primary key
   , lcl_dttm                   timestamp       default (now() at time zone 'utc')
@@ -26,11 +126,47 @@ create table expected_transactions(
   , category                   varchar(50)
   , place                      varchar(100)
   , description                varchar(100)
-  , user_uuid                  varchar(50)
+  , user_uuid                  uuid
   , amount_lcy                 numeric
   , currency_code              varchar(10)
+  , recurring_uuid             uuid
+  , unique (recurring_uuid, lcl_dttm)
 );
 
+create index expected_transactions_user_dttm_idx on expected_transactions (user_uuid, lcl_dttm);
+create index transactions_expected_idx on transactions (expected_transaction_id) where expected_transaction_id is not null;
+
+-- Bot state kept across restarts by utils.persistence.PostgresPersistence
+create table bot_user_data(
+  user_id      bigint         not null
+  , key        varchar(100)   not null
+  , value      text           not null    -- JSON
+  , primary key (user_id, key)
+);
+
+-- States of unfinished conversations (signup, statement import); key is the JSON conversation key
+create table bot_conversations(
+  name         varchar(50)    not null
+  , key        varchar(100)   not null
+  , state      text           not null    -- JSON
+  , primary key (name, key)
+);
+
+-- Files of database/migrations/ applied to this database, see telegram-bot/scripts/migrate.py.
+-- This file already has the effect of all of them; list every new migration here as well.
+create table schema_migrations(
+  version       int             primary key
+  , name        varchar(100)    not null
+  , applied_at  timestamp       not null    default (now() at time zone 'utc')
+);
+
+insert into schema_migrations (version, name) values
+  (1, '001_monthly_rollups.sql')
+  , (2, '002_recurring_transactions.sql')
+  , (3, '003_bot_persistence.sql')
+  , (4, '004_budgets.sql')
+  , (5, '005_partition_transactions.sql');
+
 create table currencies(
   currency_num_code    int            primary key
   , currency_code      varchar(10)
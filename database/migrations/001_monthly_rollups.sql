@@ -0,0 +1,28 @@
+-- Reporting support for databases created before monthly_rollups existed.
+-- Fresh databases get the same objects from init_tables.sql.
+
+create index if not exists transactions_user_dttm_idx on transactions (user_uuid, lcl_dttm);
+
+create table if not exists monthly_rollups(
+  user_uuid          varchar(50)    not null
+  , month_start      date           not null
+  , category         varchar(50)    not null    default ''
+  , currency_code    varchar(10)    not null    default ''
+  , total_amount     numeric        not null    default 0
+  , txn_count        int            not null    default 0
+  , primary key (user_uuid, month_start, category, currency_code)
+);
+
+-- Backfill from the existing history
+insert into monthly_rollups (user_uuid, month_start, category, currency_code, total_amount, txn_count)
+select
+  user_uuid
+  , date_trunc('month', lcl_dttm)::date
+  , coalesce(category, '')
+  , coalesce(currency_code, '')
+  , coalesce(sum(amount_lcy), 0)
+  , count(*)
+from transactions
+where user_uuid is not null
+group by 1, 2, 3, 4
+on conflict (user_uuid, month_start, category, currency_code) do nothing;
@@ -0,0 +1,24 @@
+-- Recurring expectations for databases created before recurring_transactions existed.
+-- Fresh databases get the same objects from init_tables.sql.
+
+create table if not exists recurring_transactions(
+  recurring_uuid        uuid           primary key
+  , user_uuid           varchar(50)    not null
+  , category            varchar(50)    not null
+  , amount_lcy          numeric        not null
+  , currency_code       varchar(10)
+  , period              interval       not null
+  , start_date          date           not null
+  , match_window_days   int            not null    default 3
+  , amount_tolerance    numeric        not null    default 0.1
+  , active              boolean        not null    default true
+);
+
+create index if not exists recurring_transactions_user_idx on recurring_transactions (user_uuid);
+
+alter table expected_transactions add column if not exists recurring_uuid uuid;
+alter table expected_transactions drop constraint if exists expected_transactions_recurring_uuid_lcl_dttm_key;
+alter table expected_transactions add constraint expected_transactions_recurring_uuid_lcl_dttm_key unique (recurring_uuid, lcl_dttm);
+
+create index if not exists expected_transactions_user_dttm_idx on expected_transactions (user_uuid, lcl_dttm);
+create index if not exists transactions_expected_idx on transactions (expected_transaction_id) where expected_transaction_id is not null;
@@ -0,0 +1,18 @@
+-- Conversation and user_data persistence for databases created before these tables existed.
+-- Fresh databases get the same objects from init_tables.sql.
+
+-- Bot state kept across restarts by utils.persistence.PostgresPersistence
+create table if not exists bot_user_data(
+  user_id      bigint         not null
+  , key        varchar(100)   not null
+  , value      text           not null    -- JSON
+  , primary key (user_id, key)
+);
+
+-- States of unfinished conversations (signup, statement import); key is the JSON conversation key
+create table if not exists bot_conversations(
+  name         varchar(50)    not null
+  , key        varchar(100)   not null
+  , state      text           not null    -- JSON
+  , primary key (name, key)
+);
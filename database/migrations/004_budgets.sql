@@ -0,0 +1,11 @@
+-- Budgets for databases created before the table existed.
+-- Fresh databases get the same table from init_tables.sql.
+
+-- Monthly spending limits set with /budget; spending is read from monthly_rollups in currency_code
+create table if not exists budgets(
+  user_uuid         varchar(50)    not null
+  , category        varchar(50)    not null
+  , currency_code   varchar(10)    not null
+  , amount_limit    numeric        not null
+  , primary key (user_uuid, category)
+);
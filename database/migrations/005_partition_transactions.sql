@@ -0,0 +1,107 @@
+-- Monthly partitions for transactions and uuid user_uuid columns, for databases created before them.
+-- Fresh databases get the same objects from init_tables.sql.
+-- Rewrites transactions (and the tables with a user_uuid), so stop the bot while
+-- telegram-bot/scripts/migrate.py applies it; it runs in a single transaction.
+
+alter table monthly_rollups alter column user_uuid type uuid using user_uuid::uuid;
+alter table budgets alter column user_uuid type uuid using user_uuid::uuid;
+alter table recurring_transactions alter column user_uuid type uuid using user_uuid::uuid;
+alter table expected_transactions alter column user_uuid type uuid using user_uuid::uuid;
+
+alter table transactions rename to transactions_unpartitioned;
+alter table transactions_unpartitioned rename constraint transactions_pkey to transactions_unpartitioned_pkey;
+drop index if exists transactions_user_dttm_idx;
+drop index if exists transactions_expected_idx;
+
+-- Partitioned by month of lcl_dttm; rows of a month without a partition go to transactions_default
+-- until create_transactions_partitions() gives them one. The primary key has to include the
+-- partition key, so it is (transaction_id, lcl_dttm); transaction_id is a random uuid either way.
+create table transactions(
+  transaction_id               uuid                  not null
+  , lcl_dttm                   timestamp             not null    default (now() at time zone 'utc')
+  , entity_type                varchar(50)
+  , category                   varchar(50)
+  , user_uuid                  uuid
+  , amount_lcy                 numeric
+  , currency_code              varchar(10)
+  , place                      varchar(100)
+  , description                varchar(100)
+  , expected_transaction_id    uuid
+  , primary key (transaction_id, lcl_dttm)
+) partition by range (lcl_dttm);
+
+create table transactions_default partition of transactions default;
+
+create index transactions_user_dttm_idx on transactions (user_uuid, lcl_dttm);
+-- Rows arrive roughly in lcl_dttm order, so a BRIN index serves time range scans across users at a fraction of a btree's size
+create index transactions_dttm_brin_idx on transactions using brin (lcl_dttm);
+
+-- Creates the partition of transactions for the month of month_start unless it exists,
+-- moving that month's rows out of transactions_default. Returns whether it created one.
+create or replace function create_transactions_partition(month_start date) returns boolean
+language plpgsql as $$
+declare
+  range_start     date := date_trunc('month', month_start);
+  range_end       date := date_trunc('month', month_start) + interval '1 month';
+  partition_name  text := 'transactions_' || to_char(month_start, 'YYYY_MM');
+begin
+  if to_regclass(partition_name) is not null then
+    return false;
+  end if;
+  -- Attaching a table (rather than creating a partition) lets the default partition still hold the month's rows
+  execute format('create table %I (like transactions including defaults)', partition_name);
+  execute format(
+    'with moved as (delete from transactions_default where lcl_dttm >= %L and lcl_dttm < %L returning *) '
+    || 'insert into %I select * from moved',
+    range_start, range_end, partition_name
+  );
+  execute format(
+    'alter table transactions attach partition %I for values from (%L) to (%L)',
+    partition_name, range_start, range_end
+  );
+  return true;
+end
+$$;
+
+-- Partitions for the current month, months_ahead months after it and every month with rows in
+-- transactions_default (e.g. imported history). Run periodically by the bot; returns the number created.
+create or replace function create_transactions_partitions(months_ahead int) returns int
+language plpgsql as $$
+declare
+  current_month  date := date_trunc('month', now() at time zone 'utc');
+  month_start    date;
+  created        int := 0;
+begin
+  for month_start in
+    select generate_series(current_month, current_month + make_interval(months => months_ahead), interval '1 month')::date
+    union
+    select distinct date_trunc('month', lcl_dttm)::date from transactions_default
+    order by 1
+  loop
+    if create_transactions_partition(month_start) then
+      created := created + 1;
+    end if;
+  end loop;
+  return created;
+end
+$$;
+
+create index transactions_expected_idx on transactions (expected_transaction_id) where expected_transaction_id is not null;
+
+-- Partitions for every month with history first, so the copy does not go through transactions_default
+select create_transactions_partition(month_start)
+from (select distinct date_trunc('month', lcl_dttm)::date as month_start from transactions_unpartitioned) months
+where month_start is not null;
+select create_transactions_partitions(3);
+
+-- lcl_dttm is now not null; the bot has always set it
+insert into transactions (
+  transaction_id, lcl_dttm, entity_type, category, user_uuid, amount_lcy, currency_code, place, description
+  , expected_transaction_id
+)
+select
+  transaction_id, lcl_dttm, entity_type, category, user_uuid::uuid, amount_lcy, currency_code, place, description
+  , expected_transaction_id
+from transactions_unpartitioned;
+
+drop table transactions_unpartitioned;
@@ -28,6 +28,12 @@ ssh $REMOTE_USER@$REMOTE_HOST << EOF
     # Rebuild and restart the Docker containers
     docker-compose down
     docker-compose build --no-cache
+
+    # Apply pending database migrations before the new bot starts
+    docker-compose up -d db
+    until docker-compose exec -T db pg_isready -q; do sleep 1; done
+    docker-compose run --rm bot python telegram-bot/scripts/migrate.py
+
     docker-compose up -d
     
     # Check if the containers are running
@@ -0,0 +1,100 @@
+"""
+Lookup benchmark for the per-user category index.
+
+Fills a CategoryIndex with N synthetic categories (common words, random words
+and word pairs, the shape of a long-lived user's history), then times resolve() and suggest()
+for exact hits, case/whitespace variants, typos and prefixes the way
+CategoryService.normalize() calls them. Each lookup is timed as the best of
+--repeat runs, so scheduler hiccups do not show up as slow lookups. Fails when
+the p99 of any lookup kind exceeds --max-ms.
+
+Usage: python telegram-bot/benchmarks/bench_categories.py [--categories N] [--lookups N] [--repeat N] [--max-ms MS]
+"""
+import argparse
+import os
+import random
+import string
+import sys
+import time
+from typing import Callable, List
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from models.category_index import CategoryIndex  # noqa: E402
+
+
+WORDS = (
+    'food', 'groceries', 'rent', 'taxi', 'coffee', 'lunch', 'dinner', 'books', 'cinema', 'gym',
+    'pharmacy', 'electricity', 'internet', 'phone', 'gifts', 'travel', 'hotel', 'fuel', 'parking', 'clothes',
+)
+
+
+def make_categories(count: int, rng: random.Random) -> List[str]:
+    categories = list(WORDS)
+    while len(categories) < count:
+        word = ''.join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(4, 12)))
+        categories.append(f'{rng.choice(WORDS)} {word}' if rng.random() < 0.5 else word)
+    return categories[:count]
+
+
+def typo(word: str, rng: random.Random) -> str:
+    i = rng.randrange(len(word))
+    edit = rng.choice(('swap', 'drop', 'double'))
+    if edit == 'swap' and i + 1 < len(word):
+        return word[:i] + word[i + 1] + word[i] + word[i + 2:]
+    if edit == 'drop' and len(word) > 3:
+        return word[:i] + word[i + 1:]
+    return word[:i] + word[i] + word[i:]
+
+
+def time_lookups(fn: Callable[[str], object], queries: List[str], repeat: int) -> List[float]:
+    timings = []
+    for q in queries:
+        best = float('inf')
+        for _ in range(repeat):
+            started = time.perf_counter()
+            fn(q)
+            best = min(best, time.perf_counter() - started)
+        timings.append(best)
+    return sorted(timings)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--categories', type=int, default=5000)
+    parser.add_argument('--lookups', type=int, default=2000)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--max-ms', type=float, default=1.0)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    categories = make_categories(args.categories, rng)
+    index = CategoryIndex()
+    started = time.perf_counter()
+    for category in categories:
+        index.add(category, rng.randint(1, 50))
+    print(f'Indexed {len(index)} categories in {(time.perf_counter() - started) * 1000:.1f} ms')
+
+    sample = [rng.choice(categories) for _ in range(args.lookups)]
+    kinds = {
+        'exact': (index.resolve, sample),
+        'variant': (index.resolve, [f'  {c.upper()} ' for c in sample]),
+        'typo': (index.suggest, [typo(c, rng) for c in sample]),
+        'prefix': (index.suggest, [c[:max(2, len(c) // 2)].strip() for c in sample]),
+    }
+
+    failed = False
+    print(f'{"kind":<8} {"p50 us":>8} {"p99 us":>8} {"max us":>8}')
+    for kind, (fn, queries) in kinds.items():
+        timings = time_lookups(fn, queries, args.repeat)
+        p50, p99 = timings[len(timings) // 2], timings[int(len(timings) * 0.99)]
+        print(f'{kind:<8} {p50 * 1e6:8.1f} {p99 * 1e6:8.1f} {timings[-1] * 1e6:8.1f}')
+        if p99 * 1000 > args.max_ms:
+            print(f'FAIL: {kind} p99 {p99 * 1000:.2f} ms exceeds {args.max_ms:.2f} ms')
+            failed = True
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,331 @@
+"""
+End-to-end load test of the bot's handlers against a local Postgres.
+
+Builds synthetic Telegram updates (signups, valid and invalid transaction
+messages, mixed date formats, multi-entry messages), feeds them through the real
+Application built by main.build_application() and captures every outgoing Bot
+API call with a fake transport, so nothing leaves the machine. Reports
+messages/sec, reply latency percentiles per message kind and SQL statements per
+message.
+
+The database is a throwaway one created from database/init_tables.sql, either on
+the server given by PG_HOST/PG_PORT/PG_USER/PG_PASSWORD (default: local socket,
+user postgres) or, with --pg-bin, in a temporary cluster started with initdb and
+pg_ctl from that directory (Postgres refuses to run those as root).
+
+Usage: python telegram-bot/benchmarks/bench_e2e.py [--users N] [--messages N] [--pg-bin DIR]
+"""
+import argparse
+import asyncio
+import collections
+import contextlib
+import datetime
+import json
+import os
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Deque, Dict, Iterator, List, Optional, Tuple
+
+import asyncpg
+from sqlalchemy import event
+from telegram import Update
+from telegram.request import BaseRequest, RequestData
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+# A spool of its own, so a run never replays (or leaves behind) another process's transactions
+SPOOL_DIR = tempfile.mkdtemp(prefix='bench_e2e_')
+os.environ.setdefault('TXN_SPOOL_PATH', os.path.join(SPOOL_DIR, 'transactions.spool'))
+# Measure the handlers, not Telegram's flood limits: no rate limits, and one reply per update so
+# every sendMessage answers exactly one pending update
+os.environ.setdefault('OUTBOX_GLOBAL_RATE', '100000')
+os.environ.setdefault('OUTBOX_CHAT_RATE', '100000')
+os.environ.setdefault('OUTBOX_COALESCE', 'false')
+
+from main import build_application  # noqa: E402
+
+SCHEMA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'database', 'init_tables.sql')
+BOT_TOKEN = '123456:e2e-bench'
+FIRST_CHAT_ID = 500000
+
+
+def _transaction_messages(rng: random.Random) -> List[Tuple[str, str]]:
+    """One (kind, text) of every shape users send; the date formats exercise both parser tiers."""
+    today = datetime.date.today()
+    amount = rng.randint(1, 500)
+    return [
+        ('plain', f'{amount} groceries'),
+        ('plain', f'{amount}.50 EUR coffee'),
+        ('relative', f'yesterday {amount} taxi'),
+        ('relative', f'friday {amount} cinema'),
+        ('explicit', f'{today.isoformat()} {amount} rent'),
+        ('explicit', f'{today.day}.{today.month:02d}.{today.year} {amount} lunch'),
+        ('fallback', f'3 days ago {amount} books'),
+        ('multi', f'{amount} bread\n{amount + 1} milk; 12 eggs'),
+        ('invalid', 'hello there'),
+        ('invalid', 'abc food'),
+    ]
+
+
+def build_script(users: int, messages: int, seed: int) -> List[Tuple[int, str, str]]:
+    """(chat_id, kind, text) in arrival order: every user signs up, then users take turns sending."""
+    rng = random.Random(seed)
+    per_user = []
+    for i in range(users):
+        chat_id = FIRST_CHAT_ID + i
+        script = [(chat_id, 'signup', '/signup'), (chat_id, 'signup', 'USD')]
+        for _ in range(messages):
+            kind, text = rng.choice(_transaction_messages(rng))
+            script.append((chat_id, kind, text))
+        per_user.append(script)
+    return [step for turn in zip(*per_user) for step in turn]
+
+
+def make_update(update_id: int, chat_id: int, text: str) -> Dict[str, Any]:
+    message = {
+        'message_id': update_id,
+        'date': int(time.time()),
+        'chat': {'id': chat_id, 'type': 'private'},
+        'from': {'id': chat_id, 'is_bot': False, 'first_name': 'Bench', 'username': f'bench_{chat_id}'},
+        'text': text,
+    }
+    if text.startswith('/'):
+        message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+    return {'update_id': update_id, 'message': message}
+
+
+class FakeBotApi(BaseRequest):
+    """Bot API transport that answers locally and matches each sendMessage to the oldest pending update of its chat."""
+
+    def __init__(self) -> None:
+        self.pending: Dict[int, Deque[Tuple[str, float]]] = collections.defaultdict(collections.deque)
+        self.latencies: Dict[str, List[float]] = collections.defaultdict(list)
+        self.calls: Dict[str, int] = collections.Counter()
+        self.error_replies = 0
+        self.replies = 0
+        self.expected = 0
+        self.done = asyncio.Event()
+        self._message_id = 0
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    def expect(self, chat_id: int, kind: str) -> None:
+        self.pending[chat_id].append((kind, time.perf_counter()))
+        self.expected += 1
+
+    async def do_request(
+        self,
+        url: str,
+        method: str,
+        request_data: Optional[RequestData] = None,
+        read_timeout: Any = None,
+        write_timeout: Any = None,
+        connect_timeout: Any = None,
+        pool_timeout: Any = None,
+    ) -> Tuple[int, bytes]:
+        endpoint = url.rsplit('/', 1)[-1]
+        params = request_data.parameters if request_data else {}
+        self.calls[endpoint] += 1
+
+        if endpoint == 'getMe':
+            result: Any = {'id': 1, 'is_bot': True, 'first_name': 'Bench', 'username': 'bench_bot'}
+        elif endpoint in ('sendMessage', 'editMessageText', 'sendDocument'):
+            chat_id = int(params['chat_id'])
+            self._message_id += 1
+            result = {
+                'message_id': self._message_id,
+                'date': int(time.time()),
+                'chat': {'id': chat_id, 'type': 'private'},
+                'text': params.get('text', ''),
+            }
+            if endpoint == 'sendMessage':
+                self._record_reply(chat_id, str(params.get('text', '')))
+        else:
+            result = True
+        return 200, json.dumps({'ok': True, 'result': result}).encode()
+
+    def _record_reply(self, chat_id: int, text: str) -> None:
+        pending = self.pending.get(chat_id)
+        if not pending:
+            return
+        kind, sent_at = pending.popleft()
+        self.latencies[kind].append(time.perf_counter() - sent_at)
+        self.replies += 1
+        if text.startswith('Sorry'):
+            self.error_replies += 1
+        if self.replies >= self.expected:
+            self.done.set()
+
+
+@contextlib.contextmanager
+def temporary_cluster(pg_bin: str) -> Iterator[Dict[str, Any]]:
+    """initdb + pg_ctl start in a temp dir, reachable only through a Unix socket in that dir."""
+    data_dir = tempfile.mkdtemp(prefix='bench_pg_')
+    initdb = os.path.join(pg_bin, 'initdb')
+    pg_ctl = os.path.join(pg_bin, 'pg_ctl')
+    subprocess.run(
+        [initdb, '-D', data_dir, '-U', 'postgres', '-A', 'trust', '--no-sync'],
+        check=True, capture_output=True,
+    )
+    options = f"-c listen_addresses='' -k {data_dir} -c fsync=off -c synchronous_commit=off"
+    subprocess.run(
+        [pg_ctl, '-D', data_dir, '-o', options, '-l', os.path.join(data_dir, 'server.log'), '-w', 'start'],
+        check=True, capture_output=True,
+    )
+    try:
+        yield {'host': data_dir, 'port': 5432, 'user': 'postgres', 'password': None}
+    finally:
+        subprocess.run([pg_ctl, '-D', data_dir, '-m', 'fast', 'stop'], capture_output=True)
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+async def create_database(server: Dict[str, Any], name: str) -> None:
+    admin = await asyncpg.connect(database='postgres', **server)
+    try:
+        await admin.execute(f'DROP DATABASE IF EXISTS {name}')
+        await admin.execute(f'CREATE DATABASE {name}')
+    finally:
+        await admin.close()
+    conn = await asyncpg.connect(database=name, **server)
+    try:
+        with open(SCHEMA_PATH, encoding='utf-8') as f:
+            await conn.execute(f.read())
+    finally:
+        await conn.close()
+
+
+async def drop_database(server: Dict[str, Any], name: str) -> None:
+    admin = await asyncpg.connect(database='postgres', **server)
+    try:
+        await admin.execute(f'DROP DATABASE IF EXISTS {name}')
+    finally:
+        await admin.close()
+
+
+async def count_rows(server: Dict[str, Any], name: str) -> Dict[str, int]:
+    conn = await asyncpg.connect(database=name, **server)
+    try:
+        return {
+            table: await conn.fetchval(f'SELECT count(*) FROM {table}')
+            for table in ('users', 'transactions', 'monthly_rollups')
+        }
+    finally:
+        await conn.close()
+
+
+def _percentile(ordered: List[float], q: float) -> float:
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+async def run(server: Dict[str, Any], args: argparse.Namespace) -> int:
+    db_name = f'bench_e2e_{os.getpid()}'
+    await create_database(server, db_name)
+
+    cred = {
+        'tg_bot_token': BOT_TOKEN,
+        'pg_user': server['user'],
+        'pg_password': server['password'],
+        'pg_host': server['host'],
+        'pg_port': server['port'],
+        'pg_database': db_name,
+    }
+    api = FakeBotApi()
+    application = build_application(cred, request=api)
+
+    statements = 0
+
+    def count_statement(*_: Any) -> None:
+        nonlocal statements
+        statements += 1
+
+    event.listen(application.bot_data['db'].engine.sync_engine, 'before_cursor_execute', count_statement)
+
+    script = build_script(args.users, args.messages, args.seed)
+    try:
+        await application.initialize()
+        await application.post_init(application)
+        if 'warm_up_task' in application.bot_data:
+            await application.bot_data['warm_up_task']
+        await application.start()
+
+        statements = 0
+        started = time.perf_counter()
+        for update_id, (chat_id, kind, text) in enumerate(script, start=1):
+            api.expect(chat_id, kind)
+            await application.update_queue.put(Update.de_json(make_update(update_id, chat_id, text), application.bot))
+        try:
+            await asyncio.wait_for(api.done.wait(), args.timeout)
+        except asyncio.TimeoutError:
+            print(f'Timed out after {args.timeout:.0f}s with {api.replies}/{api.expected} replies')
+        elapsed = time.perf_counter() - started
+        run_statements = statements
+
+        # Same order as Application.run_polling: post_stop() flushes the outbox,
+        # shutdown() flushes persistence before post_shutdown closes the pool
+        await application.stop()
+        await application.post_stop(application)
+        await application.shutdown()
+        await application.post_shutdown(application)
+
+        rows = await count_rows(server, db_name)
+    finally:
+        if not args.keep_db:
+            await drop_database(server, db_name)
+        shutil.rmtree(SPOOL_DIR, ignore_errors=True)
+
+    print(f'users={args.users} messages={len(script)} replies={api.replies} error_replies={api.error_replies}')
+    print(f'elapsed={elapsed:.2f}s throughput={api.replies / elapsed:.1f} msg/s')
+    print(f'SQL statements: {run_statements} ({run_statements / max(1, api.replies):.2f} per message)')
+    print(f'{"kind":<10} {"count":>6} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8} {"max ms":>8}')
+    all_latencies = []
+    for kind, values in sorted(api.latencies.items()):
+        ordered = sorted(values)
+        all_latencies += ordered
+        print(
+            f'{kind:<10} {len(ordered):>6} {statistics.median(ordered) * 1000:8.1f} '
+            f'{_percentile(ordered, 0.95) * 1000:8.1f} {_percentile(ordered, 0.99) * 1000:8.1f} '
+            f'{ordered[-1] * 1000:8.1f}'
+        )
+    all_latencies.sort()
+    if all_latencies:
+        print(
+            f'{"all":<10} {len(all_latencies):>6} {statistics.median(all_latencies) * 1000:8.1f} '
+            f'{_percentile(all_latencies, 0.95) * 1000:8.1f} {_percentile(all_latencies, 0.99) * 1000:8.1f} '
+            f'{all_latencies[-1] * 1000:8.1f}'
+        )
+    print(f'Rows written: {rows}')
+    return 0 if api.replies == api.expected and api.error_replies == 0 else 1
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--messages', type=int, default=20, help='transaction messages per user after signup')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--timeout', type=float, default=300)
+    parser.add_argument('--pg-bin', help='directory with initdb/pg_ctl to start a temporary cluster')
+    parser.add_argument('--keep-db', action='store_true', help='do not drop the benchmark database')
+    args = parser.parse_args()
+
+    if args.pg_bin:
+        with temporary_cluster(args.pg_bin) as server:
+            return asyncio.run(run(server, args))
+    server = {
+        'host': os.environ.get('PG_HOST', '/var/run/postgresql'),
+        'port': int(os.environ.get('PG_PORT', 5432)),
+        'user': os.environ.get('PG_USER', 'postgres'),
+        'password': os.environ.get('PG_PASSWORD') or None,
+    }
+    return asyncio.run(run(server, args))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,125 @@
+"""
+Parse benchmark for Transaction.from_message.
+
+Runs the tiered parser and the dateparser-only reference over a corpus of
+real-looking messages, reports messages/sec and latency percentiles for both,
+and fails if the tiered parser disagrees with the reference.
+
+Usage: python telegram-bot/benchmarks/bench_parser.py [--rounds N] [--corpus PATH]
+"""
+import argparse
+import datetime
+import os
+import sys
+import time
+from typing import List, Optional
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from models.date_parser import AMOUNT_RE, parse_fast, parse_slow  # noqa: E402
+from models.transaction import Transaction  # noqa: E402
+
+
+DEFAULT_CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'parser_corpus.txt')
+
+# Relative dates ("today", messages without a date) resolve against now()
+DTTM_TOLERANCE = datetime.timedelta(seconds=60)
+
+
+class ReferenceTransaction(Transaction):
+    """Transaction parsed with the original dateparser-only strategy."""
+    _parse_dttm_from_msg = staticmethod(parse_slow)
+
+
+def load_corpus(path: str) -> List[str]:
+    with open(path, encoding='utf-8') as f:
+        return [line.rstrip('\n') for line in f if line.strip() and not line.startswith('#')]
+
+
+def same_result(a: Optional[Transaction], b: Optional[Transaction]) -> bool:
+    if a is None or b is None:
+        return a is b
+    return (
+        a.amount_lcy == b.amount_lcy
+        and a.currency_code == b.currency_code
+        and a.category == b.category
+        and abs(a.lcl_dttm - b.lcl_dttm) <= DTTM_TOLERANCE
+    )
+
+
+def is_legacy_amount_as_date(msg: str) -> bool:
+    """The reference lets dateparser read a leading bare amount ("5 coffee") as a day of month."""
+    first = msg.split(None, 1)[0].rstrip(',.;') if msg.strip() else ''
+    return bool(AMOUNT_RE.match(first)) and parse_fast(msg) == (None, 0) and parse_slow(msg)[1] > 0
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def run(parse, corpus: List[str], rounds: int) -> List[float]:
+    latencies = []
+    for _ in range(rounds):
+        for msg in corpus:
+            started = time.perf_counter()
+            parse(msg, default_currency='EUR')
+            latencies.append(time.perf_counter() - started)
+    return latencies
+
+
+def report(name: str, latencies: List[float]) -> None:
+    total = sum(latencies)
+    print(
+        f'{name:<10} {len(latencies) / total:>12,.0f} msg/s'
+        f'   p50 {percentile(latencies, 50) * 1e6:>9,.1f} us'
+        f'   p99 {percentile(latencies, 99) * 1e6:>9,.1f} us'
+        f'   max {max(latencies) * 1e6:>9,.1f} us'
+    )
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rounds', type=int, default=20)
+    parser.add_argument('--corpus', default=DEFAULT_CORPUS)
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus)
+
+    mismatches = []
+    legacy_divergences = []
+    for msg in corpus:
+        fast = Transaction.from_message(msg, default_currency='EUR')
+        reference = ReferenceTransaction.from_message(msg, default_currency='EUR')
+        if not same_result(fast, reference):
+            if is_legacy_amount_as_date(msg):
+                legacy_divergences.append(msg)
+            else:
+                mismatches.append((msg, fast, reference))
+
+    # Warm-up so dateparser's lazy locale loading is not billed to the first round
+    run(ReferenceTransaction.from_message, corpus, 1)
+
+    fallbacks = sum(1 for msg in corpus if parse_fast(msg) is None)
+    print(f'{len(corpus)} messages x {args.rounds} rounds, {fallbacks} need the dateparser fallback')
+    report('tiered', run(Transaction.from_message, corpus, args.rounds))
+    report('reference', run(ReferenceTransaction.from_message, corpus, args.rounds))
+
+    if legacy_divergences:
+        print(f'\n{len(legacy_divergences)} message(s) where the reference read a leading amount as a date:')
+        for msg in legacy_divergences:
+            print(f'  {msg!r}')
+
+    if mismatches:
+        print(f'\nFAIL: {len(mismatches)} message(s) parsed differently:')
+        for msg, fast, reference in mismatches:
+            print(f'  {msg!r}\n    tiered:    {fast}\n    reference: {reference}')
+        return 1
+
+    print('\nOK: tiered parser matches the reference')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
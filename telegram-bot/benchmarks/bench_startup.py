@@ -0,0 +1,72 @@
+"""
+Startup import-time report for the bot.
+
+Imports main.py in a fresh interpreter under `python -X importtime`, prints the
+slowest modules by cumulative import time and fails when the total exceeds
+--max-ms or when a module that should load lazily is imported at startup.
+
+Usage: python telegram-bot/benchmarks/bench_startup.py [--rounds N] [--top N] [--max-ms MS]
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+from typing import List, Tuple
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+
+# Heavy modules only needed on specific code paths (scripts, fallback parsing, import/export)
+LAZY_MODULES = ('pandas', 'psycopg2', 'dateparser', 'openpyxl', 'pyarrow')
+
+IMPORTTIME_RE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$')
+
+
+def profile_once() -> List[Tuple[str, int, int, int]]:
+    """Return (module, depth, self_us, cumulative_us) for every module main.py imports."""
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import main'],
+        cwd=SRC_DIR, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f'importing main failed:\n{proc.stderr[-2000:]}')
+    modules = []
+    for line in proc.stderr.splitlines():
+        m = IMPORTTIME_RE.match(line)
+        if m:
+            self_us, cumulative_us, indent, name = m.groups()
+            modules.append((name, len(indent) // 2, int(self_us), int(cumulative_us)))
+    return modules
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rounds', type=int, default=3, help='fresh interpreters; the fastest one is reported')
+    parser.add_argument('--top', type=int, default=15)
+    parser.add_argument('--max-ms', type=float, default=1200)
+    args = parser.parse_args()
+
+    runs = [profile_once() for _ in range(args.rounds)]
+    totals = [sum(cumulative for _, depth, _, cumulative in run if depth == 0) for run in runs]
+    best = runs[totals.index(min(totals))]
+    total_ms = min(totals) / 1000
+
+    print(f'{"cumulative ms":>14} {"self ms":>8}  module')
+    slowest = sorted(best, key=lambda m: m[3], reverse=True)[:args.top]
+    for name, depth, self_us, cumulative_us in slowest:
+        print(f'{cumulative_us / 1000:14.1f} {self_us / 1000:8.1f}  {"  " * depth}{name}')
+    print(f'Total import time: {total_ms:.0f} ms over {len(best)} modules (best of {args.rounds})')
+
+    failed = False
+    eager = sorted({name.split('.')[0] for name, *_ in best} & set(LAZY_MODULES))
+    if eager:
+        print(f'FAIL: imported at startup but expected to load lazily: {", ".join(eager)}')
+        failed = True
+    if total_ms > args.max_ms:
+        print(f'FAIL: total import time {total_ms:.0f} ms exceeds {args.max_ms:.0f} ms')
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,249 @@
+"""
+Local stand-in for the Telegram Bot API, to compare polling and webhook throughput on one machine.
+
+It serves the Bot API methods the bot calls (getMe, getUpdates, setWebhook,
+sendMessage, ...), feeds it synthetic transaction messages from --users chats and
+times each update until the bot's reply to that chat arrives.
+
+    # polling: the bot pulls the updates with getUpdates
+    python telegram-bot/scripts/fake_telegram.py --mode polling --updates 5000
+    TG_API_BASE_URL=http://127.0.0.1:8081/bot RUN_MODE=polling python telegram-bot/src/main.py
+
+    # webhook: updates are pushed to the URL and secret the bot registers with setWebhook
+    python telegram-bot/scripts/fake_telegram.py --mode webhook --updates 5000
+    TG_API_BASE_URL=http://127.0.0.1:8081/bot RUN_MODE=webhook WEBHOOK_URL=http://127.0.0.1:8443 \\
+        python telegram-bot/src/main.py
+
+Start the bot against its usual database; any TG_BOT_TOKEN works. Updates are
+released once the bot has connected, and a summary is printed when every update
+got a reply or --timeout expires. Set OUTBOX_GLOBAL_RATE=100000 OUTBOX_CHAT_RATE=100000
+OUTBOX_COALESCE=false for the bot, so every update gets a reply of its own without the
+flood limits setting the pace.
+"""
+import argparse
+import asyncio
+import collections
+import itertools
+import json
+import statistics
+import time
+from typing import Any, Deque, Dict, List, Optional
+
+import httpx
+import tornado.web
+
+SAMPLE_MESSAGES = (
+    '100 food',
+    '25.5 coffee',
+    'yesterday 300 taxi',
+    '2025-09-07 1200 rent',
+    '8.09.2025 45 books',
+    '15 lunch\n4 tea',
+)
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+
+class FakeTelegram:
+    def __init__(self, updates: int, users: int, rate: Optional[float]) -> None:
+        self.total = updates
+        self.users = users
+        self.rate = rate
+        self.updates: List[Dict[str, Any]] = []  # released updates, update_id == position
+        self.new_updates = asyncio.Event()
+        self.connected = asyncio.Event()
+        self.done = asyncio.Event()
+        self.webhook_url: Optional[str] = None
+        self.webhook_secret: Optional[str] = None
+        self.pending: Dict[int, Deque[float]] = collections.defaultdict(collections.deque)
+        self.latencies: List[float] = []
+        self.replies = 0
+        self.rejected = 0
+        self.message_ids = itertools.count(1)
+        self.started_at = 0.0
+        self.finished_at = 0.0
+
+    def make_update(self, update_id: int) -> Dict[str, Any]:
+        chat_id = 100000 + update_id % self.users
+        return {
+            'update_id': update_id,
+            'message': {
+                'message_id': update_id + 1,
+                'date': int(time.time()),
+                'chat': {'id': chat_id, 'type': 'private'},
+                'from': {'id': chat_id, 'is_bot': False, 'first_name': 'Load', 'username': f'load_{chat_id}'},
+                'text': SAMPLE_MESSAGES[update_id % len(SAMPLE_MESSAGES)],
+            },
+        }
+
+    async def release(self):
+        """Yield updates as they are released: all at once, or at --rate per second."""
+        self.started_at = time.perf_counter()
+        for update_id in range(self.total):
+            if self.rate:
+                delay = self.started_at + update_id / self.rate - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            update = self.make_update(update_id)
+            self.pending[update['message']['chat']['id']].append(time.perf_counter())
+            self.updates.append(update)
+            self.new_updates.set()
+            yield update
+
+    def record_reply(self, chat_id: int) -> None:
+        sent = self.pending.get(chat_id)
+        if sent:
+            self.latencies.append(time.perf_counter() - sent.popleft())
+            self.replies += 1
+            if self.replies >= self.total:
+                self.finished_at = time.perf_counter()
+                self.done.set()
+
+    async def run_polling(self) -> None:
+        async for _ in self.release():
+            # Let getUpdates handlers pick up what is there before releasing more
+            await asyncio.sleep(0)
+
+    async def run_webhook(self, concurrency: int) -> None:
+        async with httpx.AsyncClient(timeout=30, limits=httpx.Limits(max_connections=concurrency)) as client:
+            # Secret-token validation: a wrong header must be refused before any update is sent
+            probe = await client.post(self.webhook_url, json=self.make_update(-1), headers={SECRET_HEADER: 'wrong'})
+            print(f'Wrong secret token -> HTTP {probe.status_code}')
+
+            queue: asyncio.Queue = asyncio.Queue(maxsize=concurrency * 2)
+
+            async def push() -> None:
+                while True:
+                    update = await queue.get()
+                    try:
+                        response = await client.post(
+                            self.webhook_url, json=update, headers={SECRET_HEADER: self.webhook_secret or ''}
+                        )
+                        if response.status_code != 200:
+                            self.rejected += 1
+                    except httpx.HTTPError:
+                        self.rejected += 1
+                    finally:
+                        queue.task_done()
+
+            workers = [asyncio.create_task(push()) for _ in range(concurrency)]
+            async for update in self.release():
+                await queue.put(update)
+            await queue.join()
+            for worker in workers:
+                worker.cancel()
+
+    def summary(self, mode: str) -> str:
+        end = self.finished_at or time.perf_counter()
+        elapsed = end - self.started_at
+        lines = [
+            f'mode={mode} updates={self.total} users={self.users} replies={self.replies} rejected={self.rejected}',
+            f'elapsed={elapsed:.2f}s throughput={self.replies / elapsed if elapsed else 0:.1f} updates/s',
+        ]
+        if self.latencies:
+            ordered = sorted(self.latencies)
+            p99 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))]
+            lines.append(
+                f'latency ms: p50={statistics.median(ordered) * 1000:.1f} '
+                f'p99={p99 * 1000:.1f} max={ordered[-1] * 1000:.1f}'
+            )
+        return '\n'.join(lines)
+
+
+class BotApiHandler(tornado.web.RequestHandler):
+    def initialize(self, fake: FakeTelegram) -> None:
+        self.fake = fake
+
+    def params(self) -> Dict[str, Any]:
+        if self.request.headers.get('Content-Type', '').startswith('application/json'):
+            return json.loads(self.request.body or b'{}')
+        # PTB sends form fields with non-string values JSON-encoded
+        params = {}
+        for name in self.request.body_arguments:
+            value = self.get_body_argument(name)
+            try:
+                params[name] = json.loads(value)
+            except ValueError:
+                params[name] = value
+        return params
+
+    def reply(self, result: Any) -> None:
+        self.set_header('Content-Type', 'application/json')
+        self.finish(json.dumps({'ok': True, 'result': result}))
+
+    async def post(self, token: str, method: str) -> None:
+        params = self.params()
+        method = method.lower()
+        fake = self.fake
+
+        if method == 'getme':
+            self.reply({'id': 1, 'is_bot': True, 'first_name': 'Fake', 'username': 'fake_bot'})
+        elif method == 'getupdates':
+            fake.connected.set()
+            offset = int(params.get('offset') or 0)
+            limit = int(params.get('limit') or 100)
+            timeout = float(params.get('timeout') or 0)
+            if offset >= len(fake.updates) and timeout:
+                fake.new_updates.clear()
+                try:
+                    await asyncio.wait_for(fake.new_updates.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+            self.reply(fake.updates[offset:offset + limit])
+        elif method == 'setwebhook':
+            fake.webhook_url = params.get('url')
+            fake.webhook_secret = params.get('secret_token')
+            fake.connected.set()
+            self.reply(True)
+        elif method in ('sendmessage', 'editmessagetext', 'senddocument'):
+            chat_id = int(params.get('chat_id', 0))
+            if method == 'sendmessage':
+                fake.record_reply(chat_id)
+            self.reply({
+                'message_id': next(fake.message_ids),
+                'date': int(time.time()),
+                'chat': {'id': chat_id, 'type': 'private'},
+                'text': params.get('text', ''),
+            })
+        else:
+            self.reply(True)
+
+    get = post
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--mode', choices=('polling', 'webhook'), required=True)
+    parser.add_argument('--updates', type=int, default=2000)
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--rate', type=float, default=None, help='updates per second (default: all at once)')
+    parser.add_argument('--concurrency', type=int, default=40, help='parallel webhook requests')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--timeout', type=float, default=300)
+    args = parser.parse_args()
+
+    fake = FakeTelegram(args.updates, args.users, args.rate)
+    app = tornado.web.Application([(r'/bot([^/]+)/(\w+)', BotApiHandler, {'fake': fake})])
+    server = app.listen(args.port, address='127.0.0.1')
+    print(f'Bot API stand-in on http://127.0.0.1:{args.port}/bot, waiting for the bot to connect')
+
+    await fake.connected.wait()
+    if args.mode == 'webhook':
+        while fake.webhook_url is None:
+            await asyncio.sleep(0.1)
+        # run_webhook registers the URL before its server is accepting connections
+        await asyncio.sleep(1)
+        print(f'Pushing to {fake.webhook_url}')
+        sender = fake.run_webhook(args.concurrency)
+    else:
+        sender = fake.run_polling()
+
+    try:
+        await asyncio.wait_for(asyncio.gather(sender, fake.done.wait()), args.timeout)
+    except asyncio.TimeoutError:
+        print(f'Timed out after {args.timeout:.0f}s')
+    print(fake.summary(args.mode))
+    server.stop()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,104 @@
+"""
+Bulk-load exchange-rate history from a local CSV file into exchange_rates.
+
+Expected header: from_currency,to_currency,buyrate,sellrate,valid_from,valid_to
+Currencies may be alphabetic (USD) or ISO numeric (840) codes; alphabetic ones
+are resolved through the currencies table. valid_to and one of the two rates may
+be empty. Timestamps are UTC in ISO format.
+
+Usage: python telegram-bot/scripts/load_exchange_rates.py rates.csv [--chunk-size N]
+
+The running bot picks new intervals up on its next refresh (RATES_REFRESH_INTERVAL);
+history older than what it already holds is only seen after a restart.
+"""
+import argparse
+import csv
+import datetime
+import io
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from utils.db import Postgres  # noqa: E402
+
+
+COLUMNS = ('from_currency_code', 'to_currency_code', 'buyrate', 'sellrate', 'utc_valid_from_dttm', 'utc_valid_to_dttm')
+COPY_SQL = f"COPY exchange_rates ({', '.join(COLUMNS)}) FROM STDIN WITH (FORMAT csv)"
+
+
+def resolve_code(code: str, codes: dict) -> int:
+    code = code.strip().upper()
+    if code.isdigit():
+        return int(code)
+    if code not in codes:
+        raise ValueError(f'unknown currency {code!r}, add it to the currencies table first')
+    return codes[code]
+
+
+def parse_timestamp(value: str) -> str:
+    value = value.strip()
+    return datetime.datetime.fromisoformat(value).isoformat(sep=' ') if value else ''
+
+
+def parse_rate(value: str) -> str:
+    value = value.strip().replace(',', '.')
+    return str(float(value)) if value else ''
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('path')
+    parser.add_argument('--chunk-size', type=int, default=50000)
+    args = parser.parse_args()
+
+    db = Postgres()
+    codes = {
+        row.currency_code.upper(): row.currency_num_code
+        for row in db.fetch_df('SELECT currency_num_code, currency_code FROM currencies').itertuples()
+    }
+
+    loaded = 0
+    connection = db.engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        with open(args.path, newline='', encoding='utf-8-sig') as f:
+            reader = csv.DictReader(f)
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            pending = 0
+            for line_no, row in enumerate(reader, start=2):
+                try:
+                    writer.writerow((
+                        resolve_code(row['from_currency'], codes),
+                        resolve_code(row['to_currency'], codes),
+                        parse_rate(row.get('buyrate') or ''),
+                        parse_rate(row.get('sellrate') or ''),
+                        parse_timestamp(row['valid_from']),
+                        parse_timestamp(row.get('valid_to') or ''),
+                    ))
+                except (KeyError, ValueError) as e:
+                    raise SystemExit(f'{args.path}:{line_no}: {e}')
+                pending += 1
+                if pending >= args.chunk_size:
+                    buffer.seek(0)
+                    cursor.copy_expert(COPY_SQL, buffer)
+                    loaded += pending
+                    buffer.seek(0)
+                    buffer.truncate()
+                    pending = 0
+                    print(f'{loaded} rows copied', file=sys.stderr)
+            if pending:
+                buffer.seek(0)
+                cursor.copy_expert(COPY_SQL, buffer)
+                loaded += pending
+        connection.commit()
+    finally:
+        connection.close()
+
+    print(f'Loaded {loaded} exchange rate rows from {args.path}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
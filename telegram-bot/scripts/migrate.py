@@ -0,0 +1,93 @@
+"""
+Apply the migrations in database/migrations/ that the database has not run yet.
+
+Migrations are NNN_name.sql files applied in version order. Each one runs in its own
+transaction together with recording its version in schema_migrations, so a failed
+migration leaves nothing behind and can be fixed and re-run. Databases created from
+init_tables.sql already list every migration; older ones get schema_migrations on the
+first run, and as migrations 001-004 only create what is missing, all are applied.
+
+Usage: python telegram-bot/scripts/migrate.py [--dir database/migrations] [--list]
+"""
+import argparse
+import os
+import re
+import sys
+import time
+from typing import List, Tuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from sqlalchemy import text  # noqa: E402
+
+from utils.db import Postgres  # noqa: E402
+
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'database', 'migrations')
+FILENAME_RE = re.compile(r'^(\d+)_\w+\.sql$')
+
+SCHEMA_MIGRATIONS_SQL = """
+CREATE TABLE IF NOT EXISTS schema_migrations(
+  version       int             PRIMARY KEY
+  , name        varchar(100)    NOT NULL
+  , applied_at  timestamp       NOT NULL    DEFAULT (now() AT TIME ZONE 'utc')
+)
+"""
+
+
+def find_migrations(directory: str) -> List[Tuple[int, str]]:
+    """(version, file name) of the migration files in directory, in version order."""
+    migrations = {}
+    for name in os.listdir(directory):
+        m = FILENAME_RE.match(name)
+        if m is None:
+            continue
+        version = int(m.group(1))
+        if version in migrations:
+            raise ValueError(f'migrations {migrations[version]} and {name} share version {version}')
+        migrations[version] = name
+    return sorted(migrations.items())
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--dir', default=MIGRATIONS_DIR, help='directory of NNN_name.sql files')
+    parser.add_argument('--list', action='store_true', help='only show which migrations are applied')
+    args = parser.parse_args()
+
+    migrations = find_migrations(args.dir)
+    db = Postgres()
+    with db.engine.begin() as connection:
+        connection.execute(text(SCHEMA_MIGRATIONS_SQL))
+        applied = {row.version for row in connection.execute(text('SELECT version FROM schema_migrations'))}
+
+    pending = [(version, name) for version, name in migrations if version not in applied]
+    if args.list:
+        for version, name in migrations:
+            print(f"{'applied' if version in applied else 'pending'}  {name}")
+        return 0
+    if not pending:
+        print(f'Database is up to date ({len(applied)} migrations applied)')
+        return 0
+
+    for version, name in pending:
+        with open(os.path.join(args.dir, name), encoding='utf-8') as f:
+            sql = f.read()
+        started = time.perf_counter()
+        with db.engine.begin() as connection:
+            # The driver's own cursor runs the whole file: several statements, function bodies, literal %
+            cursor = connection.connection.cursor()
+            try:
+                cursor.execute(sql)
+            finally:
+                cursor.close()
+            connection.execute(
+                text('INSERT INTO schema_migrations (version, name) VALUES (:version, :name)'),
+                {'version': version, 'name': name}
+            )
+        print(f'Applied {name} in {time.perf_counter() - started:.1f}s')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,105 @@
+import logging
+from typing import List, Optional, Tuple
+
+from telegram import Update
+from telegram.ext import ContextTypes
+
+from commands.reports import _format_amount, _get_user_row
+from models.budget_service import BudgetAlert, BudgetService
+from models.category_index import CategoryService
+from models.transaction import Transaction
+from utils.metrics import instrument_handler
+from utils.outbox import reply
+
+
+USAGE_TEXT = (
+    'Usage:\n'
+    '/budget - this month\'s spending against your budgets\n'
+    '/budget <category> <monthly limit> - set a budget in your default currency\n'
+    '/budget <category> off - remove a budget\n'
+    'Example: /budget groceries 400'
+)
+
+MAX_CATEGORY_LENGTH = 50
+
+
+def format_alert(alert: BudgetAlert) -> str:
+    budget = alert.budget
+    state = 'over' if alert.spent > budget.amount_limit else f'at {alert.spent / budget.amount_limit:.0%} of'
+    return (
+        f'Budget alert: {budget.category} is {state} its {_format_amount(budget.amount_limit)} '
+        f'{budget.currency_code} limit for {alert.month_start.strftime("%B %Y")} '
+        f'({_format_amount(alert.spent)} spent)'
+    )
+
+
+def _parse_args(args: List[str]) -> Optional[Tuple[str, Optional[float]]]:
+    """(category, limit) from /budget arguments; limit is None for 'off'."""
+    if len(args) < 2:
+        return None
+    category = ' '.join(args[:-1])
+    if len(category) > MAX_CATEGORY_LENGTH:
+        return None
+    if args[-1].lower() == 'off':
+        return category, None
+    try:
+        amount = Transaction.parse_amount(args[-1])
+    except ValueError:
+        return None
+    return (category, amount) if amount > 0 else None
+
+
+@instrument_handler
+async def budget_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Monthly budgets: /budget, /budget <category> <limit>, /budget <category> off"""
+    chat_id = update.effective_chat.id
+    user_row = await _get_user_row(update, context)
+    if user_row is None:
+        return
+    user_uuid = str(user_row['user_uuid'])
+    budget_service: BudgetService = context.bot_data['budget_service']
+
+    if not context.args:
+        budgets = budget_service.budgets(user_uuid)
+        if not budgets:
+            text = 'No budgets yet.\n\n' + USAGE_TEXT
+        else:
+            lines = ['Budgets this month:']
+            lines += [
+                f'{budget.category}: {_format_amount(spent)} of {_format_amount(budget.amount_limit)} '
+                f'{budget.currency_code} ({spent / budget.amount_limit:.0%})'
+                for budget, spent in budgets
+            ]
+            text = '\n'.join(lines)
+        reply(context, chat_id=chat_id, text=text)
+        return
+
+    parsed = _parse_args(context.args)
+    if parsed is None:
+        reply(context, chat_id=chat_id, text=USAGE_TEXT)
+        return
+    category, amount = parsed
+    try:
+        if amount is None:
+            removed = await budget_service.remove(user_uuid, category)
+            text = f'Budget for {category} removed.' if removed else f'No budget for {category}.'
+        else:
+            category_service: CategoryService = context.bot_data['category_service']
+            # Budgets use the spelling the user's transactions are stored under
+            category, _ = await category_service.normalize(user_uuid, category)
+            budget = await budget_service.set_limit(
+                user_uuid, category, user_row['default_currency_code'], amount
+            )
+            spent = budget_service.spent(user_uuid, budget.category)
+            text = (
+                f'Budget set: {budget.category} {_format_amount(budget.amount_limit)} {budget.currency_code} '
+                f'a month ({_format_amount(spent)} spent so far this month).'
+            )
+        reply(context, chat_id=chat_id, text=text)
+    except Exception as e:
+        logging.error(f'Error in budget_command: {e}')
+        reply(
+            context,
+            chat_id=chat_id,
+            text='Sorry, there was an error updating your budget. Please try again later.'
+        )
@@ -0,0 +1,121 @@
+import asyncio
+import datetime
+import logging
+import os
+import pathlib
+import re
+import tempfile
+from typing import Optional
+from telegram import Update
+from telegram.ext import ContextTypes
+
+from config.settings import EXPORT_CHUNK_SIZE, EXPORT_MAX_FILE_SIZE
+from models.transaction_repository import EXPORT_COLUMNS, TransactionRepository
+from models.user_repository import UserRepository
+from utils.export_writer import EXPORT_WRITERS
+from utils.metrics import instrument_handler
+from utils.outbox import Outbox, reply
+
+
+DATE_ARG_RE = re.compile(r'^\d{4}-\d{2}-\d{2}$')
+
+USAGE_TEXT = (
+    'Usage: /export [csv|parquet] [from YYYY-MM-DD] [to YYYY-MM-DD] [category]\n'
+    'Examples:\n'
+    '/export\n'
+    '/export 2025-01-01 2025-03-31\n'
+    '/export parquet 2025-01-01 food'
+)
+
+
+def _parse_export_args(args):
+    """Split /export arguments into (format, since, until, category); raises ValueError on bad dates."""
+    fmt = 'csv'
+    dates = []
+    words = []
+    for arg in args:
+        if arg.lower() in EXPORT_WRITERS and not dates and not words:
+            fmt = arg.lower()
+        elif DATE_ARG_RE.match(arg) and len(dates) < 2 and not words:
+            dates.append(datetime.date.fromisoformat(arg))
+        else:
+            words.append(arg)
+    since = dates[0] if dates else None
+    until = dates[1] if len(dates) > 1 else None
+    category: Optional[str] = ' '.join(words) or None
+    return fmt, since, until, category
+
+
+@instrument_handler
+async def export_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Stream the user's transactions into a CSV/Parquet file and send it as a document"""
+    chat_id = update.effective_chat.id
+    try:
+        fmt, since, until, category = _parse_export_args(context.args or [])
+    except ValueError:
+        reply(context, chat_id=chat_id, text=USAGE_TEXT)
+        return
+
+    user_repo: UserRepository = context.bot_data['user_repo']
+    user_row = await user_repo.get_by_telegram(update.message.from_user.username)
+    if not user_row:
+        reply(
+            context,
+            chat_id=chat_id,
+            text='Please sign up first using /signup command'
+        )
+        return
+
+    txn_repo: TransactionRepository = context.bot_data['txn_repo']
+    writer_cls = EXPORT_WRITERS[fmt]
+    fd, path = tempfile.mkstemp(suffix=writer_cls.extension)
+    os.close(fd)
+    try:
+        try:
+            writer = writer_cls(path, EXPORT_COLUMNS)
+        except ImportError:
+            reply(context, chat_id=chat_id, text=f'{fmt} export is not available, try /export csv')
+            return
+
+        loop = asyncio.get_running_loop()
+        rows = 0
+        try:
+            async for chunk in txn_repo.stream_for_user(
+                str(user_row['user_uuid']), since, until, category, chunk_size=EXPORT_CHUNK_SIZE
+            ):
+                await loop.run_in_executor(None, writer.write, chunk)
+                rows += len(chunk)
+        finally:
+            writer.close()
+
+        if rows == 0:
+            reply(context, chat_id=chat_id, text='No transactions match this export.')
+            return
+        if os.path.getsize(path) > EXPORT_MAX_FILE_SIZE:
+            reply(
+                context,
+                chat_id=chat_id,
+                text='The export is too large to send. Please narrow it down with a date range or category.'
+            )
+            return
+
+        file_name = f'transactions_{datetime.date.today().isoformat()}{writer_cls.extension}'
+        outbox: Outbox = context.bot_data['outbox']
+        # Waited for, as the file is removed afterwards
+        sent = await outbox.send_document(
+            chat_id,
+            pathlib.Path(path),
+            filename=file_name,
+            caption=f'{rows} transactions'
+        )
+        if sent is None:
+            reply(context, chat_id=chat_id, text='Sorry, the export could not be sent. Please try again later.')
+    except Exception as e:
+        logging.error(f"Error in export_command: {str(e)}")
+        reply(
+            context,
+            chat_id=chat_id,
+            text='Sorry, there was an error exporting your transactions. Please try again later.'
+        )
+    finally:
+        os.remove(path)
@@ -0,0 +1,169 @@
+import datetime
+import logging
+from typing import List, Optional, Tuple
+
+from telegram import Update
+from telegram.ext import ContextTypes
+
+from config.settings import EXPECTED_AMOUNT_TOLERANCE, EXPECTED_HORIZON_DAYS, EXPECTED_MATCH_WINDOW_DAYS
+from commands.reports import _format_amount, _get_user_row
+from models.expectation_service import ExpectationService
+from models.recurring_repository import PERIOD_NAMES, PERIODS, RecurringRepository
+from models.transaction import Transaction
+from utils.metrics import instrument_handler
+from utils.outbox import reply
+
+
+USAGE_TEXT = (
+    'Usage:\n'
+    '/recurring - list your recurring transactions\n'
+    '/recurring add <weekly|monthly|yearly> <first date YYYY-MM-DD> <amount> [currency_code] <category>\n'
+    '/recurring stop <number from the list>\n'
+    'Example: /recurring add monthly 2025-01-01 1200 EUR rent'
+)
+
+
+def _parse_add_args(args: List[str], default_currency: str) -> Optional[Tuple[str, datetime.date, float, str, str]]:
+    """
+    (period, start_date, amount, currency_code, category) from /recurring add arguments, or None
+    if they do not follow the usage. Raises ValueError if the rule could not be stored.
+    """
+    if len(args) < 4 or args[0].lower() not in PERIODS:
+        return None
+    try:
+        start_date = datetime.date.fromisoformat(args[1])
+        amount = Transaction.parse_amount(args[2])
+    except ValueError:
+        return None
+    rest = args[3:]
+    currency = default_currency
+    if len(rest) >= 2 and len(rest[0]) == 3 and rest[0].isalpha():
+        currency = rest[0].upper()
+        rest = rest[1:]
+    category = ' '.join(rest)
+    # recurring_transactions has the same column limits as transactions
+    problem = Transaction(amount_lcy=amount, currency_code=currency, category=category).storage_error()
+    if problem is not None:
+        raise ValueError(problem)
+    if amount <= 0:
+        raise ValueError('amount must be positive')
+    return args[0].lower(), start_date, amount, currency, category
+
+
+async def _list_rules(update: Update, context: ContextTypes.DEFAULT_TYPE, user_uuid: str) -> None:
+    recurring_repo: RecurringRepository = context.bot_data['recurring_repo']
+    rules = await recurring_repo.list_rules(user_uuid)
+    if not rules:
+        text = 'No recurring transactions yet.\n\n' + USAGE_TEXT
+    else:
+        lines = ['Your recurring transactions:']
+        lines += [
+            f'{i}. {PERIOD_NAMES.get(rule["period"], rule["period"])} from {rule["start_date"].isoformat()}: '
+            f'{_format_amount(rule["amount_lcy"])} {rule["currency_code"]} {rule["category"]}'
+            for i, rule in enumerate(rules, start=1)
+        ]
+        lines.append('\nUse /expected to see what is due.')
+        text = '\n'.join(lines)
+    reply(context, chat_id=update.effective_chat.id, text=text)
+
+
+@instrument_handler
+async def recurring_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """List, add and stop recurring transactions: /recurring [add ...|stop <n>]"""
+    chat_id = update.effective_chat.id
+    user_row = await _get_user_row(update, context)
+    if user_row is None:
+        return
+    user_uuid = str(user_row['user_uuid'])
+    args = context.args or []
+
+    if not args:
+        await _list_rules(update, context, user_uuid)
+        return
+
+    recurring_repo: RecurringRepository = context.bot_data['recurring_repo']
+    expectation_service: ExpectationService = context.bot_data['expectation_service']
+    action = args[0].lower()
+    try:
+        if action == 'add':
+            try:
+                parsed = _parse_add_args(args[1:], user_row['default_currency_code'])
+            except ValueError as e:
+                reply(context, chat_id=chat_id, text=f'Could not add the recurring transaction: {e}.')
+                return
+            if parsed is None:
+                reply(context, chat_id=chat_id, text=USAGE_TEXT)
+                return
+            period, start_date, amount, currency, category = parsed
+            recurring_uuid = await recurring_repo.add_rule(
+                user_uuid, category, amount, currency, period, start_date,
+                EXPECTED_MATCH_WINDOW_DAYS, EXPECTED_AMOUNT_TOLERANCE
+            )
+            created = await expectation_service.materialize(recurring_uuid)
+            reply(
+                context,
+                chat_id=chat_id,
+                text=f'Recurring transaction added: {period} {_format_amount(amount)} {currency} {category}, '
+                     f'starting {start_date.isoformat()} ({created} due in the next {EXPECTED_HORIZON_DAYS} days).'
+            )
+        elif action == 'stop' and len(args) == 2 and args[1].isdigit():
+            rules = await recurring_repo.list_rules(user_uuid)
+            number = int(args[1])
+            if not 1 <= number <= len(rules):
+                reply(context, chat_id=chat_id, text='No such recurring transaction, see /recurring')
+                return
+            rule = rules[number - 1]
+            await expectation_service.deactivate(user_uuid, str(rule['recurring_uuid']))
+            reply(
+                context,
+                chat_id=chat_id,
+                text=f'Stopped: {_format_amount(rule["amount_lcy"])} {rule["currency_code"]} {rule["category"]}'
+            )
+        else:
+            reply(context, chat_id=chat_id, text=USAGE_TEXT)
+    except Exception as e:
+        logging.error(f'Error in recurring_command: {e}')
+        reply(
+            context,
+            chat_id=chat_id,
+            text='Sorry, there was an error updating your recurring transactions. Please try again later.'
+        )
+
+
+@instrument_handler
+async def expected_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Unmatched expected transactions: overdue ones and those due soon"""
+    user_row = await _get_user_row(update, context)
+    if user_row is None:
+        return
+
+    recurring_repo: RecurringRepository = context.bot_data['recurring_repo']
+    now = datetime.datetime.now()
+    rows = await recurring_repo.unmatched_for_user(
+        str(user_row['user_uuid']), now + datetime.timedelta(days=EXPECTED_HORIZON_DAYS)
+    )
+    overdue = []
+    upcoming = []
+    # Rows come newest first; show both lists in due order
+    for row in reversed(rows):
+        line = (
+            f'{row["lcl_dttm"].strftime("%Y-%m-%d")} {_format_amount(row["amount_lcy"])} '
+            f'{row["currency_code"]} {row["category"]}'
+        )
+        if row['lcl_dttm'] + datetime.timedelta(days=row['match_window_days']) < now:
+            overdue.append(line)
+        else:
+            upcoming.append(line)
+
+    if not rows:
+        text = 'Nothing expected. Add recurring transactions with /recurring add.'
+    else:
+        lines = []
+        if overdue:
+            lines += ['Overdue (no matching transaction yet):'] + overdue
+        if upcoming:
+            if lines:
+                lines.append('')
+            lines += [f'Due in the next {EXPECTED_HORIZON_DAYS} days:'] + upcoming
+        text = '\n'.join(lines)
+    reply(context, chat_id=update.effective_chat.id, text=text)
@@ -0,0 +1,175 @@
+import datetime
+import re
+from itertools import groupby
+from typing import List, Optional
+
+import numpy as np
+from telegram import Update
+from telegram.ext import ContextTypes
+
+from models.rate_service import RateService
+from models.report_repository import ReportRepository
+from models.user_repository import UserRepository
+from utils.metrics import instrument_handler
+from utils.outbox import reply
+
+
+# Months shown by /report
+REPORT_MONTHS = 6
+
+MONTH_ARG_PATTERNS = [
+    (re.compile(r'^(\d{4})-(\d{1,2})$'), lambda m: (int(m.group(1)), int(m.group(2)))),   # 2025-03
+    (re.compile(r'^(\d{1,2})\.(\d{4})$'), lambda m: (int(m.group(2)), int(m.group(1)))),  # 03.2025
+]
+
+
+def _month_start(day: datetime.date) -> datetime.date:
+    return day.replace(day=1)
+
+
+def _shift_months(month_start: datetime.date, months: int) -> datetime.date:
+    index = month_start.year * 12 + month_start.month - 1 + months
+    return datetime.date(index // 12, index % 12 + 1, 1)
+
+
+def _parse_month_arg(arg: str) -> Optional[datetime.date]:
+    for pattern, extract in MONTH_ARG_PATTERNS:
+        m = pattern.match(arg)
+        if m:
+            year, month = extract(m)
+            if 1 <= month <= 12:
+                return datetime.date(year, month, 1)
+    return None
+
+
+def _format_amount(amount) -> str:
+    return f'{amount:,.2f}'
+
+
+def _converted_total(
+    rate_service: RateService, rows: List[dict], to_code: str, month: datetime.date
+) -> Optional[float]:
+    """
+    Sum of rollup rows in to_code, or None if there is nothing to convert or a rate is missing.
+    Rollups have no per-transaction timestamps, so the rate from the middle of the month is used.
+    """
+    if not to_code or all(row['currency_code'] == to_code for row in rows):
+        return None
+    at = min(datetime.datetime.combine(month, datetime.time()) + datetime.timedelta(days=14), datetime.datetime.utcnow())
+    converted = rate_service.convert(
+        [float(row['total_amount']) for row in rows],
+        [row['currency_code'] for row in rows],
+        to_code,
+        at
+    )
+    if np.isnan(converted).any():
+        return None
+    return float(converted.sum())
+
+
+async def _get_user_row(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Optional[dict]:
+    user_repo: UserRepository = context.bot_data['user_repo']
+    user_row = await user_repo.get_by_telegram(update.message.from_user.username)
+    if not user_row:
+        reply(
+            context,
+            chat_id=update.effective_chat.id,
+            text='Please sign up first using /signup command'
+        )
+        return None
+    return user_row
+
+
+@instrument_handler
+async def report_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Totals per month for the last REPORT_MONTHS months"""
+    user_row = await _get_user_row(update, context)
+    if user_row is None:
+        return
+
+    report_repo: ReportRepository = context.bot_data['report_repo']
+    since = _shift_months(_month_start(datetime.date.today()), -(REPORT_MONTHS - 1))
+    rows = await report_repo.monthly_totals(str(user_row['user_uuid']), since)
+
+    if not rows:
+        text = 'No transactions in the last months yet.'
+    else:
+        rate_service: RateService = context.bot_data['rate_service']
+        default_currency = user_row['default_currency_code']
+        lines = [f'Spending over the last {REPORT_MONTHS} months:']
+        for month, month_rows in groupby(rows, key=lambda row: row['month_start']):
+            month_rows = list(month_rows)
+            for row in month_rows:
+                lines.append(
+                    f'{month.strftime("%Y-%m")}: {_format_amount(row["total_amount"])} '
+                    f'{row["currency_code"]} ({row["txn_count"]} transactions)'
+                )
+            converted = _converted_total(rate_service, month_rows, default_currency, month)
+            if converted is not None:
+                lines.append(f'{month.strftime("%Y-%m")}: ≈ {_format_amount(converted)} {default_currency} in total')
+        lines.append('\nUse /month [YYYY-MM] for a breakdown by category.')
+        text = '\n'.join(lines)
+    reply(context, chat_id=update.effective_chat.id, text=text)
+
+
+@instrument_handler
+async def month_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Category breakdown of one month: /month or /month 2025-03"""
+    month = _month_start(datetime.date.today())
+    if context.args:
+        month = _parse_month_arg(context.args[0])
+        if month is None:
+            reply(
+                context,
+                chat_id=update.effective_chat.id,
+                text='Usage: /month [YYYY-MM], e.g. /month 2025-03'
+            )
+            return
+
+    user_row = await _get_user_row(update, context)
+    if user_row is None:
+        return
+
+    report_repo: ReportRepository = context.bot_data['report_repo']
+    rows = await report_repo.month_by_category(str(user_row['user_uuid']), month)
+
+    if not rows:
+        text = f'No transactions in {month.strftime("%Y-%m")}.'
+    else:
+        lines = [f'{month.strftime("%B %Y")}:']
+        totals = {}
+        for row in rows:
+            currency = row['currency_code']
+            totals[currency] = totals.get(currency, 0) + row['total_amount']
+            lines.append(f'{row["category"] or "(no category)"}: {_format_amount(row["total_amount"])} {currency}')
+        lines.append('')
+        lines += [f'Total: {_format_amount(total)} {currency}' for currency, total in totals.items()]
+        default_currency = user_row['default_currency_code']
+        converted = _converted_total(context.bot_data['rate_service'], rows, default_currency, month)
+        if converted is not None:
+            lines.append(f'≈ {_format_amount(converted)} {default_currency} in total')
+        text = '\n'.join(lines)
+    reply(context, chat_id=update.effective_chat.id, text=text)
+
+
+@instrument_handler
+async def categories_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """All categories the user has spent in, with totals"""
+    user_row = await _get_user_row(update, context)
+    if user_row is None:
+        return
+
+    report_repo: ReportRepository = context.bot_data['report_repo']
+    rows = await report_repo.categories(str(user_row['user_uuid']))
+
+    if not rows:
+        text = 'No categories yet. Send a transaction like "100 food" to start.'
+    else:
+        lines = ['Your categories:']
+        lines += [
+            f'{row["category"] or "(no category)"}: {_format_amount(row["total_amount"])} '
+            f'{row["currency_code"]} ({row["txn_count"]} transactions)'
+            for row in rows
+        ]
+        text = '\n'.join(lines)
+    reply(context, chat_id=update.effective_chat.id, text=text)
@@ -2,24 +2,23 @@ import uuid
 from telegram import Update, ReplyKeyboardMarkup, ReplyKeyboardRemove
 from telegram.ext import ContextTypes, ConversationHandler
 
-from config.settings import CHOOSING_CURRENCY, VALID_CURRENCIES, get_credentials
+from config.settings import CHOOSING_CURRENCY, VALID_CURRENCIES
 from models.user_repository import UserRepository
 from models.user import User
-from utils.db import Postgres
-
-
-cred = get_credentials()
+from utils.metrics import instrument_handler
+from utils.outbox import reply
 
 
+@instrument_handler
 async def signup_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    db = Postgres(credentials=cred)
-    user_repo = UserRepository(db)
+    user_repo: UserRepository = context.bot_data['user_repo']
     username = update.message.from_user.username
     
     # Check if user already exists
-    existing = user_repo.get_by_telegram(username)
+    existing = await user_repo.get_by_telegram(username)
     if existing:
-        await context.bot.send_message(
+        reply(
+            context,
             chat_id=update.effective_chat.id,
             text='You are already registered!'
         )
@@ -28,7 +27,8 @@ async def signup_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Create keyboard with currency options
     reply_keyboard = [[currency] for currency in VALID_CURRENCIES]
     
-    await context.bot.send_message(
+    reply(
+        context,
         chat_id=update.effective_chat.id,
         text='Please choose your default currency:',
         reply_markup=ReplyKeyboardMarkup(
@@ -45,11 +45,13 @@ async def signup_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     return CHOOSING_CURRENCY
 
 
+@instrument_handler
 async def handle_currency_choice(update: Update, context: ContextTypes.DEFAULT_TYPE):
     chosen_currency = update.message.text
     
     if chosen_currency not in VALID_CURRENCIES:
-        await context.bot.send_message(
+        reply(
+            context,
             chat_id=update.effective_chat.id,
             text=f'Please choose a valid currency: {", ".join(VALID_CURRENCIES)}',
             reply_markup=ReplyKeyboardMarkup(
@@ -59,8 +61,7 @@ async def handle_currency_choice(update: Update, context: ContextTypes.DEFAULT_T
         )
         return CHOOSING_CURRENCY
     
-    db = Postgres(credentials=cred)
-    user_repo = UserRepository(db)
+    user_repo: UserRepository = context.bot_data['user_repo']
 
     new_user = User.from_signup(
         user_uuid=context.user_data['user_uuid'],
@@ -68,15 +69,17 @@ async def handle_currency_choice(update: Update, context: ContextTypes.DEFAULT_T
         currency_code=chosen_currency
     )
 
-    inserted = user_repo.insert(new_user)
+    inserted = await user_repo.insert(new_user)
     if inserted:
-        await context.bot.send_message(
+        reply(
+            context,
             chat_id=update.effective_chat.id,
             text=f'Successfully registered! Your default currency is set to {chosen_currency}.',
             reply_markup=ReplyKeyboardRemove()
         )
     else:
-        await context.bot.send_message(
+        reply(
+            context,
             chat_id=update.effective_chat.id,
             text='Sorry, there was an error during registration. Please try again later.',
             reply_markup=ReplyKeyboardRemove()
@@ -85,8 +88,10 @@ async def handle_currency_choice(update: Update, context: ContextTypes.DEFAULT_T
     return ConversationHandler.END
 
 
+@instrument_handler
 async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    await context.bot.send_message(
+    reply(
+        context,
         chat_id=update.effective_chat.id,
         text='Signup cancelled.',
         reply_markup=ReplyKeyboardRemove()
@@ -2,27 +2,25 @@ import logging
 from telegram import Update
 from telegram.ext import ContextTypes
 
-from utils.db import Postgres
-from config.settings import get_credentials
-
-
-cred = get_credentials()
+from models.user_repository import UserRepository
+from utils.metrics import instrument_handler
+from utils.outbox import reply
 
 
+@instrument_handler
 async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    db = Postgres(credentials=cred)
+    user_repo: UserRepository = context.bot_data['user_repo']
     logging.info(update.message.from_user.username)
-    df = db.fetch_df(
-        "SELECT 1 FROM users WHERE telegram_account = :username",
-        {"username": update.message.from_user.username}
-    )
-    if df.shape[0] == 0:
-        await context.bot.send_message(
+    user_row = await user_repo.get_by_telegram(update.message.from_user.username)
+    if user_row is None:
+        reply(
+            context,
             chat_id=update.effective_chat.id, 
             text='Greetings human, to sign-up use /signup command'
         )
     else:
-        await context.bot.send_message(
+        reply(
+            context,
             chat_id=update.effective_chat.id, 
             text='Greetings human, you are signed up and ready to go!'
         )
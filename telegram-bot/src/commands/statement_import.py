@@ -0,0 +1,142 @@
+import logging
+import os
+import tempfile
+import time
+from telegram import Update
+from telegram.ext import ContextTypes, ConversationHandler
+
+from config.settings import AWAITING_STATEMENT, IMPORT_MAX_FILE_SIZE
+from models.statement_import import ImportSummary, StatementImporter
+from models.user_repository import UserRepository
+from utils.metrics import instrument_handler
+from utils.outbox import Outbox, reply
+from utils.statement_reader import SUPPORTED_EXTENSIONS
+
+
+# Minimum seconds between progress edits, to stay clear of Telegram's edit limits
+PROGRESS_INTERVAL = 3.0
+
+
+def _format_summary(summary: ImportSummary) -> str:
+    lines = [
+        'Import finished.',
+        f'Rows read: {summary.rows}',
+        f'Imported: {summary.imported}',
+        f'Skipped as duplicates: {summary.duplicates}',
+        f'Invalid rows: {summary.invalid}',
+    ]
+    if summary.errors:
+        lines += ['', 'First problems:'] + summary.errors
+    return '\n'.join(lines)
+
+
+@instrument_handler
+async def import_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user_repo: UserRepository = context.bot_data['user_repo']
+    user_row = await user_repo.get_by_telegram(update.message.from_user.username)
+    if not user_row:
+        reply(
+            context,
+            chat_id=update.effective_chat.id,
+            text='Please sign up first using /signup command'
+        )
+        return ConversationHandler.END
+
+    # "/import all" keeps rows that look like already stored transactions
+    context.user_data['import_dedupe'] = 'all' not in [arg.lower() for arg in context.args or []]
+    reply(
+        context,
+        chat_id=update.effective_chat.id,
+        text='Send me your bank statement as a CSV or XLSX document.\n'
+             'It needs a date and an amount column; currency and category/description are optional.\n'
+             'Rows matching a transaction you already have (same date and time, amount, currency and category) '
+             'are skipped; use /import all to keep them.\n'
+             'Use /cancel to stop.'
+    )
+    return AWAITING_STATEMENT
+
+
+@instrument_handler
+async def handle_statement_document(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Download the uploaded statement and stream it into the transactions table"""
+    chat_id = update.effective_chat.id
+    document = update.message.document
+    extension = os.path.splitext(document.file_name or '')[1].lower()
+
+    if extension not in SUPPORTED_EXTENSIONS:
+        reply(
+            context,
+            chat_id=chat_id,
+            text=f'Please send a {" or ".join(e.lstrip(".").upper() for e in SUPPORTED_EXTENSIONS)} file.'
+        )
+        return AWAITING_STATEMENT
+    if document.file_size and document.file_size > IMPORT_MAX_FILE_SIZE:
+        reply(
+            context,
+            chat_id=chat_id,
+            text=f'The file is too large, the limit is {IMPORT_MAX_FILE_SIZE // (1024 * 1024)} MB.'
+        )
+        return ConversationHandler.END
+
+    user_repo: UserRepository = context.bot_data['user_repo']
+    user_row = await user_repo.get_by_telegram(update.message.from_user.username)
+    importer = StatementImporter(
+        context.bot_data['txn_repo'],
+        user_uuid=str(user_row['user_uuid']),
+        default_currency=user_row['default_currency_code'],
+        dedupe=context.user_data.pop('import_dedupe', True),
+    )
+
+    outbox: Outbox = context.bot_data['outbox']
+    status = await outbox.send(chat_id, 'Importing…')
+    last_update = time.monotonic()
+
+    def show(text: str) -> None:
+        # Queued like every reply; if the status message was not delivered, the text comes as a new one
+        if status is not None:
+            outbox.edit_text(chat_id, status.message_id, text)
+        else:
+            outbox.send(chat_id, text)
+
+    async def report_progress(summary: ImportSummary) -> None:
+        nonlocal last_update
+        if status is None or time.monotonic() - last_update < PROGRESS_INTERVAL:
+            return
+        last_update = time.monotonic()
+        show(f'Importing… {summary.rows} rows processed, {summary.imported} imported')
+
+    fd, path = tempfile.mkstemp(suffix=extension)
+    os.close(fd)
+    try:
+        telegram_file = await document.get_file()
+        await telegram_file.download_to_drive(path)
+        summary = await importer.run(path, progress=report_progress)
+        show(_format_summary(summary))
+    except ValueError as e:
+        show(f'Could not import the file: {e}')
+    except Exception as e:
+        logging.error(f"Error in handle_statement_document: {str(e)}")
+        show('Sorry, there was an error importing your statement. Please try again later.')
+    finally:
+        os.remove(path)
+
+    # COPY bypasses the rollup listeners; chunks committed before an error count too
+    try:
+        await context.bot_data['budget_service'].refresh_user(importer.user_uuid)
+    except Exception as e:
+        logging.error(f"Error refreshing budgets after import: {str(e)}")
+    # Imported rows may bring new categories; the index is rebuilt on the next lookup
+    context.bot_data['category_service'].invalidate(importer.user_uuid)
+
+    return ConversationHandler.END
+
+
+@instrument_handler
+async def cancel_import(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    context.user_data.pop('import_dedupe', None)
+    reply(
+        context,
+        chat_id=update.effective_chat.id,
+        text='Import cancelled.'
+    )
+    return ConversationHandler.END
@@ -1,28 +1,132 @@
 import logging
-from telegram import Update
+from typing import List, Optional
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
+from telegram.constants import MessageLimit
 from telegram.ext import ContextTypes
 
-from config.settings import get_credentials
+from commands.budget import format_alert
+from models.budget_service import BudgetService
+from models.category_index import CategoryService
+from models.expectation_service import ExpectationService
 from models.transaction import Transaction
+from models.transaction_buffer import TransactionBuffer
 from models.transaction_repository import TransactionRepository
 from models.user_repository import UserRepository
-from utils.db import Postgres
+from utils.metrics import instrument_handler
+from utils.outbox import Outbox, reply
 
 
-cred = get_credentials()
+INVALID_FORMAT_TEXT = (
+    'Invalid format. Use: [date] amount [currency_code] category\n'
+    'Examples:\n'
+    '25.03.2024 100 USD Groceries\n'
+    '100 food (uses your default currency)'
+)
 
+# Callback data of the category suggestion buttons: cat:<transaction_id>:<category>
+CATEGORY_CALLBACK_PREFIX = 'cat:'
+MAX_CALLBACK_DATA = 64  # bytes, Bot API limit
+SUGGESTION_PROMPT = '\n\nNew category. Did you mean one of these?'
 
+
+def _format_line(t: Transaction) -> str:
+    return f'{t.lcl_dttm.strftime("%Y-%m-%d")} {t.amount_lcy} {t.currency_code} {t.category}'
+
+
+def _fit_message(lines: List[str]) -> str:
+    """Join reply lines, cutting the tail so the text stays within Telegram's message limit."""
+    text = '\n'.join(lines)
+    limit = MessageLimit.MAX_TEXT_LENGTH
+    if len(text) <= limit:
+        return text
+    return text[:limit - 2].rsplit('\n', 1)[0] + '\n…'
+
+
+def _suggestion_keyboard(transaction_id: str, suggestions: List[str]) -> Optional[InlineKeyboardMarkup]:
+    """One button per suggested category; categories too long for callback data are left out."""
+    buttons = []
+    for category in suggestions:
+        data = f'{CATEGORY_CALLBACK_PREFIX}{transaction_id}:{category}'
+        if len(data.encode('utf-8')) <= MAX_CALLBACK_DATA:
+            buttons.append(InlineKeyboardButton(category, callback_data=data))
+    return InlineKeyboardMarkup([buttons]) if buttons else None
+
+
+async def handle_entries(update: Update, context: ContextTypes.DEFAULT_TYPE, entries: List[str], user_row: dict):
+    """Parse a multi-entry message and store every valid line together"""
+    txn_buffer: TransactionBuffer = context.bot_data['txn_buffer']
+    expectation_service: ExpectationService = context.bot_data['expectation_service']
+    category_service: CategoryService = context.bot_data['category_service']
+    budget_service: BudgetService = context.bot_data['budget_service']
+    chat_id = update.effective_chat.id
+
+    parsed = await Transaction.afrom_entries(
+        entries,
+        default_currency=user_row['default_currency_code'],
+        pool=context.bot_data['parser_pool']
+    )
+
+    valid = []
+    errors = []
+    for line_no, (entry, transaction) in enumerate(zip(entries, parsed), start=1):
+        if transaction is None:
+            errors.append(f'Line {line_no}: {entry}')
+        else:
+            transaction.user_uuid = str(user_row['user_uuid'])
+            transaction.category, _ = await category_service.normalize(transaction.user_uuid, transaction.category)
+            problem = transaction.storage_error()
+            if problem is not None:
+                errors.append(f'Line {line_no}: {entry} ({problem})')
+                continue
+            valid.append(transaction)
+
+    if not valid:
+        reply(
+            context,
+            chat_id=chat_id,
+            text=_fit_message([INVALID_FORMAT_TEXT, '', 'Could not parse:'] + errors),
+            coalesce=True
+        )
+        return
+
+    matches = [expectation_service.match(t) for t in valid]
+    try:
+        saved = await txn_buffer.submit_many(valid)
+    except Exception as e:
+        logging.error(f"Error saving {len(valid)} transactions: {e}")
+        saved = False
+    if not saved:
+        for t, expectation in zip(valid, matches):
+            expectation_service.release(t, expectation)
+        reply(
+            context,
+            chat_id=chat_id,
+            text='Sorry, there was an error saving your transactions. Please try again later.'
+        )
+        return
+    category_service.record(str(user_row['user_uuid']), [t.category for t in valid])
+
+    lines = [f'Saved {len(valid)} of {len(entries)} transactions:']
+    lines += [_format_line(t) + (' (expected)' if t.expected_transaction_id else '') for t in valid]
+    if errors:
+        lines += ['', 'Could not parse:'] + errors
+    # Alerts go first so a long reply cannot cut them off
+    alerts = [format_alert(alert) for alert in budget_service.pop_alerts(str(user_row['user_uuid']))]
+    if alerts:
+        lines = alerts + [''] + lines
+    reply(context, chat_id=chat_id, text=_fit_message(lines), coalesce=True)
+
+
+@instrument_handler
 async def handle_transaction(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle transaction messages from users"""
-    db = Postgres(credentials=cred)
-    user_repo = UserRepository(db)
-    txn_repo = TransactionRepository(db)
+    user_repo: UserRepository = context.bot_data['user_repo']
+    txn_buffer: TransactionBuffer = context.bot_data['txn_buffer']
+    expectation_service: ExpectationService = context.bot_data['expectation_service']
+    category_service: CategoryService = context.bot_data['category_service']
+    budget_service: BudgetService = context.bot_data['budget_service']
     
     try:
-        logging.info(f"Update object: {update}")
-        logging.info(f"Message: {update.message}")
-        logging.info(f"From user: {update.message.from_user}")
-        
         chat_id = update.effective_chat.id
         
         username = None
@@ -32,53 +136,118 @@ async def handle_transaction(update: Update, context: ContextTypes.DEFAULT_TYPE)
             username = update.effective_user.username
             
         if not username:
-            await context.bot.send_message(
+            reply(
+                context,
                 chat_id=chat_id,
                 text='Sorry, I could not identify you. Please make sure you have a username set in Telegram.'
             )
             return
             
-        user_row = user_repo.get_by_telegram(username)
+        user_row = await user_repo.get_by_telegram(username)
         
         if not user_row:
-            await context.bot.send_message(
+            reply(
+                context,
                 chat_id=chat_id,
                 text='Please sign up first using /signup command'
             )
             return
 
+        entries = Transaction.split_entries(update.message.text)
+        if len(entries) > 1:
+            await handle_entries(update, context, entries, user_row)
+            return
+
         default_currency = user_row['default_currency_code']
-        transaction = Transaction.from_message(update.message.text, default_currency=default_currency)
+        transaction = await Transaction.afrom_message(
+            update.message.text,
+            default_currency=default_currency,
+            pool=context.bot_data['parser_pool']
+        )
         if not transaction:
-            await context.bot.send_message(
+            reply(
+                context,
                 chat_id=chat_id,
-                text='Invalid format. Use: [date] amount [currency_code] category\n'
-                     'Examples:\n'
-                     '25.03.2024 100 USD Groceries\n'
-                     '100 food (uses your default currency)'
+                text=INVALID_FORMAT_TEXT,
+                coalesce=True
             )
             return
 
-        transaction.user_uuid = user_row['user_uuid']
+        transaction.user_uuid = str(user_row['user_uuid'])
+        # Known categories are stored in the user's usual spelling; unknown ones get suggestions
+        transaction.category, suggestions = await category_service.normalize(
+            transaction.user_uuid, transaction.category
+        )
+        problem = transaction.storage_error()
+        if problem is not None:
+            reply(context, chat_id=chat_id, text=f'Could not save the transaction: {problem}.', coalesce=True)
+            return
+        # Claimed before saving so a concurrent message cannot match the same expectation
+        expectation = expectation_service.match(transaction)
         
-        if txn_repo.insert(transaction):
-            await context.bot.send_message(
-                chat_id=chat_id,
-                text=f'Transaction saved successfully!\n'
-                     f'Amount: {transaction.amount_lcy} {transaction.currency_code}\n'
-                     f'Category: {transaction.category}\n'
-                     f'Date: {transaction.lcl_dttm.strftime("%Y-%m-%d %H:%M:%S")}'
+        if await txn_buffer.submit(transaction):
+            category_service.record(transaction.user_uuid, [transaction.category])
+            text = (
+                f'Transaction saved successfully!\n'
+                f'Amount: {transaction.amount_lcy} {transaction.currency_code}\n'
+                f'Category: {transaction.category}\n'
+                f'Date: {transaction.lcl_dttm.strftime("%Y-%m-%d %H:%M:%S")}'
             )
+            if expectation is not None:
+                text += f'\nMatches the expected {transaction.category} due {expectation.lcl_dttm.strftime("%Y-%m-%d")}'
+            # Filled in by the rollup listener while the insert ran, no extra query
+            for alert in budget_service.pop_alerts(transaction.user_uuid):
+                text += f'\n\n{format_alert(alert)}'
+            keyboard = _suggestion_keyboard(transaction.transaction_id, suggestions)
+            if keyboard is not None:
+                text += SUGGESTION_PROMPT
+            # Confirmations without suggestion buttons may be merged with others queued for the chat
+            reply(context, chat_id=chat_id, text=text, reply_markup=keyboard, coalesce=True)
         else:
-            await context.bot.send_message(
+            expectation_service.release(transaction, expectation)
+            reply(
+                context,
                 chat_id=chat_id,
                 text='Sorry, there was an error saving your transaction. Please try again later.'
             )
     except Exception as e:
         logging.error(f"Error in handle_transaction: {str(e)}")
-        await context.bot.send_message(
+        reply(
+            context,
             chat_id=update.effective_chat.id,
             text='Sorry, there was an error processing your transaction. Please try again later.'
         )
 
 
+@instrument_handler
+async def handle_category_choice(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Apply a category picked from the suggestion buttons of a saved transaction"""
+    query = update.callback_query
+    user_repo: UserRepository = context.bot_data['user_repo']
+    txn_repo: TransactionRepository = context.bot_data['txn_repo']
+    category_service: CategoryService = context.bot_data['category_service']
+    budget_service: BudgetService = context.bot_data['budget_service']
+    outbox: Outbox = context.bot_data['outbox']
+
+    try:
+        _, transaction_id, category = query.data.split(':', 2)
+        user_row = await user_repo.get_by_telegram(query.from_user.username)
+        if not user_row:
+            await query.answer('Please sign up first using /signup command')
+            return
+        user_uuid = str(user_row['user_uuid'])
+        if await txn_repo.recategorize(transaction_id, user_uuid, category):
+            # The typed category may have no transactions left; reload the index from the rollups
+            category_service.invalidate(user_uuid)
+            await query.answer(f'Category changed to {category}')
+            text = query.message.text.split(SUGGESTION_PROMPT.strip())[0].rstrip()
+            alerts = ''.join(f'\n\n{format_alert(alert)}' for alert in budget_service.pop_alerts(user_uuid))
+            outbox.edit_text(
+                query.message.chat_id, query.message.message_id, f'{text}\n\nCategory changed to {category}{alerts}'
+            )
+        else:
+            await query.answer('Nothing to change')
+            outbox.edit_reply_markup(query.message.chat_id, query.message.message_id)
+    except Exception as e:
+        logging.error(f"Error in handle_category_choice: {str(e)}")
+        await query.answer('Sorry, the category could not be changed. Please try again later.')
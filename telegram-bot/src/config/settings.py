@@ -3,8 +3,122 @@ import logging
 
 # Global settings
 CHOOSING_CURRENCY = 1
+AWAITING_STATEMENT = 2
 VALID_CURRENCIES = ['EUR', 'USD', 'RUB']
 
+# Database connection pool settings (shared by the whole application)
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 5))
+DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 10))
+DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 1800))  # seconds, -1 disables
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 30))
+DB_POOL_PRE_PING = os.environ.get('DB_POOL_PRE_PING', 'true').lower() in ('1', 'true', 'yes')
+# Prepared statements kept per asyncpg connection; the helpers send one statement text per table/column set
+DB_STATEMENT_CACHE_SIZE = int(os.environ.get('DB_STATEMENT_CACHE_SIZE', 256))
+
+# Update processing: different users are handled concurrently, one user's updates in order.
+# Keep DB_POOL_SIZE + DB_MAX_OVERFLOW close to MAX_CONCURRENT_UPDATES.
+MAX_CONCURRENT_UPDATES = int(os.environ.get('MAX_CONCURRENT_UPDATES', 64))
+BOT_CONNECTION_POOL_SIZE = int(os.environ.get('BOT_CONNECTION_POOL_SIZE', 32))  # outgoing Bot API requests
+
+# Write-behind batching of transaction inserts
+TXN_BATCH_SIZE = int(os.environ.get('TXN_BATCH_SIZE', 50))
+TXN_BATCH_MAX_DELAY = float(os.environ.get('TXN_BATCH_MAX_DELAY', 0.05))  # seconds
+
+# Durable local spool for accepted transactions, off unless a path is set (docker-compose.yml puts it
+# on the bot_data volume at /app/data/transactions.spool). A transaction is appended to the spool
+# first and acknowledged once it is spooled; a background drainer moves spooled rows into Postgres.
+# TXN_ACK_TIMEOUT > 0 also waits up to that long for the insert, so budget alerts it triggers are
+# part of the same reply rather than the next one.
+# TXN_SPOOL_FSYNC: 'always' (before acknowledging), 'interval' (every TXN_SPOOL_FSYNC_INTERVAL) or 'never'
+TXN_SPOOL_PATH = os.environ.get('TXN_SPOOL_PATH', '')
+TXN_SPOOL_FSYNC = os.environ.get('TXN_SPOOL_FSYNC', 'always')
+TXN_SPOOL_FSYNC_INTERVAL = float(os.environ.get('TXN_SPOOL_FSYNC_INTERVAL', 1.0))  # seconds
+TXN_SPOOL_COMPACT_BYTES = int(os.environ.get('TXN_SPOOL_COMPACT_BYTES', 4 * 1024 * 1024))  # drained bytes
+TXN_ACK_TIMEOUT = float(os.environ.get('TXN_ACK_TIMEOUT', 0))  # seconds, 0 to not wait
+TXN_DRAIN_TIMEOUT = float(os.environ.get('TXN_DRAIN_TIMEOUT', 30))  # seconds per insert
+TXN_DRAIN_RETRY_MAX = float(os.environ.get('TXN_DRAIN_RETRY_MAX', 30))  # seconds between retries, at most
+
+# transactions is partitioned by month; partitions are created this many months ahead, and
+# for months that landed in the default partition (e.g. imported history), every TXN_PARTITION_INTERVAL
+TXN_PARTITION_MONTHS_AHEAD = int(os.environ.get('TXN_PARTITION_MONTHS_AHEAD', 3))
+TXN_PARTITION_INTERVAL = float(os.environ.get('TXN_PARTITION_INTERVAL', 6 * 3600))  # seconds
+
+# Outgoing replies go through a queue (utils.outbox.Outbox) that stays within Telegram's flood limits:
+# about 30 messages/s overall and 1/s per chat, with short bursts allowed. Queued confirmations to the
+# same chat are merged into one message when OUTBOX_COALESCE is on.
+OUTBOX_GLOBAL_RATE = float(os.environ.get('OUTBOX_GLOBAL_RATE', 30))  # messages per second
+OUTBOX_CHAT_RATE = float(os.environ.get('OUTBOX_CHAT_RATE', 1))  # messages per second per chat
+OUTBOX_CHAT_BURST = int(os.environ.get('OUTBOX_CHAT_BURST', 3))  # messages a quiet chat may get at once
+OUTBOX_COALESCE = os.environ.get('OUTBOX_COALESCE', 'true').lower() in ('1', 'true', 'yes')
+OUTBOX_MAX_RETRIES = int(os.environ.get('OUTBOX_MAX_RETRIES', 3))  # network errors; 429s are always retried
+OUTBOX_DRAIN_TIMEOUT = float(os.environ.get('OUTBOX_DRAIN_TIMEOUT', 10))  # seconds to flush at shutdown
+
+# In-process cache of user rows looked up by Telegram account
+USER_CACHE_SIZE = int(os.environ.get('USER_CACHE_SIZE', 10000))
+USER_CACHE_TTL = float(os.environ.get('USER_CACHE_TTL', 300))  # seconds
+USER_CACHE_NEGATIVE_TTL = float(os.environ.get('USER_CACHE_NEGATIVE_TTL', 10))  # seconds
+
+# Worker pool for the dateparser fallback of the transaction parser
+PARSER_POOL_KIND = os.environ.get('PARSER_POOL_KIND', 'process')  # 'process' or 'thread'
+PARSER_POOL_WORKERS = int(os.environ.get('PARSER_POOL_WORKERS', 2))
+PARSER_POOL_MAX_PENDING = int(os.environ.get('PARSER_POOL_MAX_PENDING', 32))
+PARSER_POOL_TIMEOUT = float(os.environ.get('PARSER_POOL_TIMEOUT', 2.0))  # seconds per message
+# Spawn the workers and load dateparser in the background once the bot is running
+PARSER_WARM_UP = os.environ.get('PARSER_WARM_UP', 'true').lower() in ('1', 'true', 'yes')
+
+# Multi-entry messages: one transaction per line, optionally also split on ';'
+MULTI_ENTRY_SPLIT_SEMICOLON = os.environ.get('MULTI_ENTRY_SPLIT_SEMICOLON', 'true').lower() in ('1', 'true', 'yes')
+
+# Statement import (/import): rows per COPY chunk and the largest accepted upload
+IMPORT_CHUNK_SIZE = int(os.environ.get('IMPORT_CHUNK_SIZE', 5000))
+IMPORT_MAX_FILE_SIZE = int(os.environ.get('IMPORT_MAX_FILE_SIZE', 20 * 1024 * 1024))  # bytes, Bot API download limit
+
+# Ledger export (/export): rows fetched per server-side cursor round trip and the largest file sent
+EXPORT_CHUNK_SIZE = int(os.environ.get('EXPORT_CHUNK_SIZE', 2000))
+EXPORT_MAX_FILE_SIZE = int(os.environ.get('EXPORT_MAX_FILE_SIZE', 50 * 1024 * 1024))  # bytes, Bot API upload limit
+
+# Exchange rates are kept in memory and re-read from exchange_rates periodically
+RATES_REFRESH_INTERVAL = float(os.environ.get('RATES_REFRESH_INTERVAL', 300))  # seconds
+
+# Monthly budgets (/budget): an alert is sent when spending crosses each of these shares of the limit
+BUDGET_ALERT_THRESHOLDS = tuple(
+    float(share) for share in os.environ.get('BUDGET_ALERT_THRESHOLDS', '0.8,1.0').split(',')
+)
+
+# Conversation state and user_data in Postgres: written every PERSISTENCE_UPDATE_INTERVAL seconds,
+# loaded per user on first use, at most PERSISTENCE_MAX_LOADED_USERS users kept in memory
+PERSISTENCE_UPDATE_INTERVAL = float(os.environ.get('PERSISTENCE_UPDATE_INTERVAL', 5))  # seconds
+PERSISTENCE_MAX_LOADED_USERS = int(os.environ.get('PERSISTENCE_MAX_LOADED_USERS', 10000))
+
+# Per-user category index used to normalize and suggest categories (LRU with expiry)
+CATEGORY_INDEX_CACHE_SIZE = int(os.environ.get('CATEGORY_INDEX_CACHE_SIZE', 5000))  # users
+CATEGORY_INDEX_TTL = float(os.environ.get('CATEGORY_INDEX_TTL', 1800))  # seconds
+CATEGORY_SUGGESTIONS = int(os.environ.get('CATEGORY_SUGGESTIONS', 3))  # inline buttons per reply
+
+# Recurring expectations: occurrences are materialized from EXPECTED_LOOKBACK_DAYS ago up to
+# EXPECTED_HORIZON_DAYS ahead and kept in memory for matching incoming transactions
+EXPECTED_HORIZON_DAYS = int(os.environ.get('EXPECTED_HORIZON_DAYS', 35))
+EXPECTED_LOOKBACK_DAYS = int(os.environ.get('EXPECTED_LOOKBACK_DAYS', 7))
+EXPECTED_MATCH_WINDOW_DAYS = int(os.environ.get('EXPECTED_MATCH_WINDOW_DAYS', 3))  # default for new rules
+EXPECTED_AMOUNT_TOLERANCE = float(os.environ.get('EXPECTED_AMOUNT_TOLERANCE', 0.1))  # share of the amount
+EXPECTED_MATERIALIZE_INTERVAL = float(os.environ.get('EXPECTED_MATERIALIZE_INTERVAL', 3600))  # seconds
+
+# How updates reach the bot: 'polling' (getUpdates) or 'webhook' (embedded HTTP server)
+RUN_MODE = os.environ.get('RUN_MODE', 'polling').lower()
+WEBHOOK_URL = os.environ.get('WEBHOOK_URL', '')  # public base URL Telegram posts to, e.g. https://bot.example.com
+WEBHOOK_LISTEN = os.environ.get('WEBHOOK_LISTEN', '0.0.0.0')
+WEBHOOK_PORT = int(os.environ.get('WEBHOOK_PORT', 8443))
+WEBHOOK_PATH = os.environ.get('WEBHOOK_PATH', 'telegram')
+WEBHOOK_SECRET = os.environ.get('WEBHOOK_SECRET', '')  # checked against X-Telegram-Bot-Api-Secret-Token
+WEBHOOK_MAX_CONNECTIONS = int(os.environ.get('WEBHOOK_MAX_CONNECTIONS', 40))
+# Bot API endpoint override, e.g. a local stand-in server (http://127.0.0.1:8081/bot)
+TG_API_BASE_URL = os.environ.get('TG_API_BASE_URL', '')
+
+# Prometheus /metrics endpoint (0 disables it) and the share of updates logged in full
+METRICS_PORT = int(os.environ.get('METRICS_PORT', 9108))
+METRICS_ADDR = os.environ.get('METRICS_ADDR', '0.0.0.0')
+UPDATE_LOG_SAMPLE_RATE = float(os.environ.get('UPDATE_LOG_SAMPLE_RATE', 0.0))  # 0..1
+
 # Get credentials from environment variables
 def get_credentials():
     required_keys = ['TG_BOT_TOKEN', 'PG_USER', 'PG_PASSWORD', 'PG_HOST', 'PG_DATABASE']
@@ -15,6 +129,7 @@ def get_credentials():
             'pg_user': os.environ['PG_USER'],
             'pg_password': os.environ['PG_PASSWORD'],
             'pg_host': os.environ['PG_HOST'],
+            'pg_port': os.environ.get('PG_PORT'),  # optional, defaults to 5432
             'pg_database': os.environ['PG_DATABASE']
         }
     else: 
@@ -1,91 +1,313 @@
-import json
-import uuid
-import datetime
-import logging
-import os
-import psycopg2 as pg
-import pandas as pd
 import asyncio
+import logging
+import secrets
+import time
+from typing import Dict, Optional
 
-from os.path import expanduser
-from telegram import Update, ReplyKeyboardMarkup, ReplyKeyboardRemove
+from telegram import Update
 from telegram.ext import (
-    ApplicationBuilder, 
-    CommandHandler, 
-    ContextTypes,
+    ApplicationBuilder,
+    CallbackQueryHandler,
+    CommandHandler,
     ConversationHandler,
     MessageHandler,
+    TypeHandler,
     filters,
     Application,
-    Defaults
 )
-from sqlalchemy import create_engine, URL, text
+from telegram.request import BaseRequest
 
-from config.settings import get_credentials, CHOOSING_CURRENCY, VALID_CURRENCIES
+from config.settings import (
+    get_credentials,
+    AWAITING_STATEMENT,
+    CHOOSING_CURRENCY,
+    USER_CACHE_SIZE,
+    USER_CACHE_TTL,
+    USER_CACHE_NEGATIVE_TTL,
+    MAX_CONCURRENT_UPDATES,
+    BOT_CONNECTION_POOL_SIZE,
+    RUN_MODE,
+    WEBHOOK_URL,
+    WEBHOOK_LISTEN,
+    WEBHOOK_PORT,
+    WEBHOOK_PATH,
+    WEBHOOK_SECRET,
+    WEBHOOK_MAX_CONNECTIONS,
+    TG_API_BASE_URL,
+    PARSER_WARM_UP,
+    TXN_SPOOL_PATH,
+    TXN_PARTITION_MONTHS_AHEAD,
+    TXN_PARTITION_INTERVAL,
+)
 from commands.start import start_command
+from commands.budget import budget_command
 from commands.signup import signup_command, handle_currency_choice, cancel
-from commands.transactions import handle_transaction
-from utils.db import Postgres
+from commands.transactions import CATEGORY_CALLBACK_PREFIX, handle_category_choice, handle_transaction
+from commands.export import export_command
+from commands.reports import report_command, month_command, categories_command
+from commands.recurring import recurring_command, expected_command
+from commands.statement_import import import_command, handle_statement_document, cancel_import
+from models.budget_repository import BudgetRepository
+from models.budget_service import BudgetService
+from models.category_index import CategoryService
+from models.date_parser import PARSE_COUNTS, warm_up
+from models.expectation_service import ExpectationService
+from models.rate_service import RateService
+from models.recurring_repository import RecurringRepository
+from models.report_repository import ReportRepository
+from models.transaction_buffer import TransactionBuffer
+from models.transaction_repository import TransactionRepository
+from models.transaction_spool import TransactionSpool
+from models.user_repository import UserRepository
+from utils.cache import TTLCache
+from utils.metrics import STATS, log_update_sample, start_metrics_server
+from utils.outbox import Outbox
+from utils.persistence import PostgresPersistence
+from utils.spool import Spool
+from utils.update_processor import PerUserUpdateProcessor
+from utils.workers import WorkerPool
+from utils.db import AsyncPostgres, get_async_engine, dispose_async_engine
 
 logging.basicConfig(
     format = '%(asctime)s - %(name)s - %(levelname)s - %(message)s',
     level = logging.INFO
 )
 
-# Get credentials
-cred = get_credentials()
 
-### Removed Postgres class from here; using utils.db.Postgres
+async def warm_up_parser(parser_pool: WorkerPool) -> None:
+    started = time.perf_counter()
+    # Workers import dateparser and load its locale data in their initializer
+    await asyncio.gather(*(asyncio.wrap_future(f) for f in parser_pool.start()))
+    logging.info(f'Parser workers warmed up in {time.perf_counter() - started:.2f}s')
 
-# Commands moved to commands/ package
 
-if __name__ == '__main__':
+async def maintain_partitions(txn_repo: TransactionRepository) -> None:
+    """Keep monthly transactions partitions ahead of time and split rows out of the default partition."""
+    while True:
+        try:
+            created = await txn_repo.create_partitions(TXN_PARTITION_MONTHS_AHEAD)
+            if created:
+                logging.info(f'Created {created} transactions partitions')
+        except Exception as e:
+            logging.error(f'Error creating transactions partitions: {e}')
+        await asyncio.sleep(TXN_PARTITION_INTERVAL)
 
-    # defaults = Defaults(
-    #     block=False,
-    #     timeout=30
-    # )
 
-    application = (
+async def post_init(application: Application) -> None:
+    # /metrics is served from another thread; the services' stats are read on this loop
+    STATS.bind(asyncio.get_running_loop())
+    application.bot_data['outbox'].start()
+    txn_buffer = application.bot_data['txn_buffer']
+    if isinstance(txn_buffer, TransactionSpool):
+        # Before any update is handled, so replayed transactions are drained first
+        logging.info(f'Transaction spool opened, {await txn_buffer.start()} transactions to replay')
+    rate_service: RateService = application.bot_data['rate_service']
+    try:
+        logging.info(f'Loaded {await rate_service.refresh(full=True)} exchange rate intervals')
+    except Exception as e:
+        logging.error(f'Error loading exchange rates: {e}')
+    application.bot_data['rate_refresh_task'] = asyncio.create_task(rate_service.run_periodic_refresh())
+    expectation_service: ExpectationService = application.bot_data['expectation_service']
+    try:
+        logging.info(f'Loaded {await expectation_service.load()} open expected transactions')
+    except Exception as e:
+        logging.error(f'Error loading expected transactions: {e}')
+    application.bot_data['materialize_task'] = asyncio.create_task(expectation_service.run_periodic_materialize())
+    application.bot_data['partition_task'] = asyncio.create_task(
+        maintain_partitions(application.bot_data['txn_repo'])
+    )
+    try:
+        logging.info(f"Loaded {await application.bot_data['budget_service'].load()} budgets")
+    except Exception as e:
+        logging.error(f'Error loading budgets: {e}')
+    if PARSER_WARM_UP:
+        # Runs while polling/webhook starts; messages before it finishes just take the slow first parse
+        application.bot_data['warm_up_task'] = asyncio.create_task(
+            warm_up_parser(application.bot_data['parser_pool'])
+        )
+
+
+async def post_stop(application: Application) -> None:
+    # Replies still queued are sent while the bot's HTTP client is up
+    await application.bot_data['outbox'].close()
+
+
+async def post_shutdown(application: Application) -> None:
+    application.bot_data['rate_refresh_task'].cancel()
+    application.bot_data['materialize_task'].cancel()
+    application.bot_data['partition_task'].cancel()
+    if 'warm_up_task' in application.bot_data:
+        application.bot_data['warm_up_task'].cancel()
+    # Persist buffered (or drain spooled) transactions before the pool goes away
+    await application.bot_data['txn_buffer'].close()
+    await dispose_async_engine()
+    application.bot_data['parser_pool'].shutdown()
+    logging.info(f"Date prefix parsing (inline vs fallback): {PARSE_COUNTS}")
+    logging.info(f"User cache stats: {application.bot_data['user_repo'].cache.stats()}")
+
+
+def build_application(cred: Dict[str, str], request: Optional[BaseRequest] = None) -> Application:
+    """
+    Wire the shared services and handlers into an Application.
+    request replaces the HTTP transport to the Bot API (the load-test harness passes a fake one).
+    """
+    # One pooled asyncpg engine for the whole process, shared by every handler
+    db = AsyncPostgres(engine=get_async_engine(cred))
+    persistence = PostgresPersistence(db)
+    builder = (
         ApplicationBuilder()
         .token(cred['tg_bot_token'])
-        # .defaults(defaults)
-        .get_updates_read_timeout(42)
-        .get_updates_write_timeout(42)
-        .get_updates_connection_pool_size(1)
-        .connect_timeout(30)
-        .pool_timeout(30)
-        .build()
+        .persistence(persistence)
+        # Concurrent across users, sequential per user
+        .concurrent_updates(PerUserUpdateProcessor(MAX_CONCURRENT_UPDATES))
+        .post_init(post_init)
+        .post_stop(post_stop)
+        .post_shutdown(post_shutdown)
+    )
+    if request is not None:
+        builder = builder.request(request).get_updates_request(request)
+    else:
+        builder = (
+            builder
+            .connection_pool_size(BOT_CONNECTION_POOL_SIZE)
+            .get_updates_read_timeout(42)
+            .get_updates_write_timeout(42)
+            .get_updates_connection_pool_size(1)
+            .connect_timeout(30)
+            .pool_timeout(30)
+        )
+    if TG_API_BASE_URL:
+        builder = builder.base_url(TG_API_BASE_URL)
+    application = builder.build()
+    # Lets the persistence evict idle users' data from the Application
+    persistence.application = application
+
+    application.bot_data['db'] = db
+    # Handlers queue their replies here instead of awaiting send_message
+    application.bot_data['outbox'] = Outbox(application.bot)
+    txn_repo = TransactionRepository(db)
+    application.bot_data['txn_repo'] = txn_repo
+    if TXN_SPOOL_PATH:
+        application.bot_data['txn_buffer'] = TransactionSpool(txn_repo, Spool(TXN_SPOOL_PATH))
+        STATS.add('txn_spool', application.bot_data['txn_buffer'].stats, counters=TransactionSpool.COUNTERS)
+    else:
+        application.bot_data['txn_buffer'] = TransactionBuffer(txn_repo)
+    report_repo = ReportRepository(db)
+    application.bot_data['report_repo'] = report_repo
+    application.bot_data['category_service'] = CategoryService(report_repo)
+    application.bot_data['rate_service'] = RateService(db)
+    recurring_repo = RecurringRepository(db)
+    application.bot_data['recurring_repo'] = recurring_repo
+    application.bot_data['expectation_service'] = ExpectationService(recurring_repo)
+    budget_service = BudgetService(BudgetRepository(db))
+    application.bot_data['budget_service'] = budget_service
+    # Budget spending follows the rollup totals every transaction write returns
+    txn_repo.rollup_listeners.append(budget_service.apply)
+    parser_pool = WorkerPool(initializer=warm_up)
+    application.bot_data['parser_pool'] = parser_pool
+    application.bot_data['user_repo'] = UserRepository(
+        db,
+        cache=TTLCache(USER_CACHE_SIZE, USER_CACHE_TTL, negative_ttl=USER_CACHE_NEGATIVE_TTL)
     )
 
-    logging.info('Application started')
-    
+    # Read from the shared services whenever /metrics is scraped
+    STATS.add('parser_pool', parser_pool.stats, counters=WorkerPool.COUNTERS)
+    STATS.add('user_cache', application.bot_data['user_repo'].cache.stats, counters=TTLCache.COUNTERS)
+    STATS.add('date_prefix_parses', lambda: dict(PARSE_COUNTS), counters=PARSE_COUNTS.keys())
+    STATS.add('db_pool', lambda: {
+        'size': db.engine.pool.size(),
+        'checked_out': db.engine.pool.checkedout(),
+        'overflow': db.engine.pool.overflow(),
+    })
+    STATS.add('category_index', application.bot_data['category_service'].stats, counters=TTLCache.COUNTERS)
+    STATS.add('expectations', application.bot_data['expectation_service'].stats)
+    STATS.add('budgets', budget_service.stats)
+    STATS.add('persistence', persistence.stats, counters=PostgresPersistence.COUNTERS)
+    STATS.add('outbox', application.bot_data['outbox'].stats, counters=Outbox.COUNTERS)
+    STATS.add('update_processor', lambda: {'active_keys': application.update_processor.active_keys})
+
     # Create conversation handler for signup process
     signup_conv_handler = ConversationHandler(
         entry_points=[CommandHandler('signup', signup_command)],
         states={
             CHOOSING_CURRENCY: [MessageHandler(filters.TEXT & ~filters.COMMAND, handle_currency_choice)]
         },
-        fallbacks=[CommandHandler('cancel', cancel)]
+        fallbacks=[CommandHandler('cancel', cancel)],
+        # State survives restarts (PostgresPersistence)
+        name='signup',
+        persistent=True
     )
     
+    # Statement import: /import, then the CSV/XLSX document
+    import_conv_handler = ConversationHandler(
+        entry_points=[CommandHandler('import', import_command)],
+        states={
+            AWAITING_STATEMENT: [MessageHandler(filters.Document.ALL, handle_statement_document)]
+        },
+        fallbacks=[CommandHandler('cancel', cancel_import)],
+        name='statement_import',
+        persistent=True
+    )
+
     # Add handlers
     start_handler = CommandHandler('start', start_command)
     transaction_handler = MessageHandler(filters.TEXT & ~filters.COMMAND, handle_transaction)
     
+    # Runs before every other handler group; logs a sample of updates (UPDATE_LOG_SAMPLE_RATE)
+    application.add_handler(TypeHandler(Update, log_update_sample), group=-1)
     application.add_handler(start_handler)
+    application.add_handler(CommandHandler('report', report_command))
+    application.add_handler(CommandHandler('month', month_command))
+    application.add_handler(CommandHandler('categories', categories_command))
+    application.add_handler(CommandHandler('export', export_command))
+    application.add_handler(CommandHandler('recurring', recurring_command))
+    application.add_handler(CommandHandler('expected', expected_command))
+    application.add_handler(CommandHandler('budget', budget_command))
     application.add_handler(signup_conv_handler)
+    application.add_handler(import_conv_handler)
     application.add_handler(transaction_handler)
-    
+    application.add_handler(CallbackQueryHandler(handle_category_choice, pattern=f'^{CATEGORY_CALLBACK_PREFIX}'))
+    return application
+
+
+if __name__ == '__main__':
+
+    if RUN_MODE not in ('polling', 'webhook'):
+        raise ValueError(f"RUN_MODE must be 'polling' or 'webhook', got {RUN_MODE!r}")
+    if RUN_MODE == 'webhook' and not WEBHOOK_URL:
+        raise ValueError('WEBHOOK_URL is required when RUN_MODE=webhook')
+
+    # Get credentials
+    cred = get_credentials()
+    application = build_application(cred)
+    start_metrics_server()
+    logging.info('Application started')
+
+    # In both modes Application.stop() waits for in-flight handlers before post_shutdown runs
+    allowed_updates = ["message", "callback_query"]
     try:
-        logging.info('Starting polling')
-        application.run_polling(
-            drop_pending_updates=True,  # Ignore updates that arrived while bot was offline
-            allowed_updates=["message", "callback_query"],  # Specify which updates to handle
-            poll_interval=1.0,  # Time between polling requests
-            timeout=30  # How long to wait for response from Telegram
-        )
+        if RUN_MODE == 'webhook':
+            # Without a configured secret a fresh one is registered on every start
+            secret_token = WEBHOOK_SECRET or secrets.token_urlsafe(32)
+            logging.info(f'Starting webhook server on {WEBHOOK_LISTEN}:{WEBHOOK_PORT}/{WEBHOOK_PATH}')
+            application.run_webhook(
+                listen=WEBHOOK_LISTEN,
+                port=WEBHOOK_PORT,
+                url_path=WEBHOOK_PATH,
+                webhook_url=f"{WEBHOOK_URL.rstrip('/')}/{WEBHOOK_PATH}",
+                secret_token=secret_token,  # requests without the matching header get 403
+                allowed_updates=allowed_updates,
+                drop_pending_updates=True,
+                max_connections=WEBHOOK_MAX_CONNECTIONS
+            )
+        else:
+            logging.info('Starting polling')
+            application.run_polling(
+                drop_pending_updates=True,  # Ignore updates that arrived while bot was offline
+                allowed_updates=allowed_updates,  # Specify which updates to handle
+                poll_interval=1.0,  # Time between polling requests
+                timeout=30  # How long to wait for response from Telegram
+            )
     except Exception as e:
         logging.error(f"Error in main loop: {e}")
         asyncio.sleep(5)
-
@@ -0,0 +1,39 @@
+import datetime
+from typing import List, Optional
+
+from utils.db import AsyncPostgres
+
+
+class BudgetRepository:
+    """Monthly budget limits per user and category (budgets) and the rollups they are checked against."""
+
+    def __init__(self, db: AsyncPostgres) -> None:
+        self.db = db
+
+    async def set_limit(self, user_uuid: str, category: str, currency_code: str, amount_limit: float) -> None:
+        await self.db.execute(
+            'INSERT INTO budgets (user_uuid, category, currency_code, amount_limit) '
+            'VALUES (:u, :category, :currency, :amount) '
+            'ON CONFLICT (user_uuid, category) DO UPDATE SET '
+            'currency_code = excluded.currency_code, amount_limit = excluded.amount_limit',
+            {'u': user_uuid, 'category': category, 'currency': currency_code, 'amount': amount_limit}
+        )
+
+    async def remove(self, user_uuid: str, category: str) -> int:
+        """Delete the budget stored under exactly this spelling of category."""
+        return await self.db.execute(
+            'DELETE FROM budgets WHERE user_uuid = :u AND category = :category',
+            {'u': user_uuid, 'category': category}
+        )
+
+    async def all_limits(self) -> List[dict]:
+        return await self.db.fetch_all('SELECT user_uuid, category, currency_code, amount_limit FROM budgets')
+
+    async def month_rollups(self, month_start: datetime.date, user_uuid: Optional[str] = None) -> List[dict]:
+        """Rollups of one month for users with budgets (or for one user); matched to budgets by the caller."""
+        user_filter = 'user_uuid = :u' if user_uuid is not None else 'user_uuid IN (SELECT user_uuid FROM budgets)'
+        return await self.db.fetch_all(
+            'SELECT user_uuid, month_start, category, currency_code, total_amount FROM monthly_rollups '
+            f'WHERE month_start = :m AND {user_filter}',
+            {'m': month_start, 'u': user_uuid}
+        )
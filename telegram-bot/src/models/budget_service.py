@@ -0,0 +1,159 @@
+import datetime
+from dataclasses import dataclass
+from typing import Any, Dict, List, Sequence, Tuple
+
+from config.settings import BUDGET_ALERT_THRESHOLDS
+from .budget_repository import BudgetRepository
+from .category_index import category_key
+
+
+@dataclass()
+class Budget:
+    category: str
+    currency_code: str
+    amount_limit: float
+
+
+@dataclass()
+class BudgetAlert:
+    """Spending in a budgeted category crossed threshold (a share of the limit) in the given month."""
+    budget: Budget
+    month_start: datetime.date
+    spent: float
+    threshold: float
+
+
+def _month_start(day: datetime.date) -> datetime.date:
+    return day.replace(day=1)
+
+
+class BudgetService:
+    """
+    Monthly budgets per user and category, held in memory with the month's spending.
+    Spending is never re-summed: every write to transactions returns the new rollup
+    totals with the change that led to them (TransactionRepository.rollup_listeners),
+    so an alert is a comparison of the totals before and after the change.
+    Only spending in the budget's currency counts, and only the current month is held:
+    changes to other months are ignored and the totals start over when the month
+    rolls. The database stays the source of truth; the current month is read back at
+    startup, after an import and when a budget is set.
+    """
+
+    def __init__(self, repo: BudgetRepository, thresholds: Sequence[float] = BUDGET_ALERT_THRESHOLDS) -> None:
+        self.repo = repo
+        self.thresholds = sorted(thresholds, reverse=True)
+        # user_uuid -> category key -> Budget
+        self._limits: Dict[str, Dict[str, Budget]] = {}
+        # (user_uuid, category key) -> {category spelling: total} for self._month; a key's
+        # spellings share one budget, rollups are kept per spelling
+        self._spent: Dict[Tuple[str, str], Dict[str, float]] = {}
+        self._month = _month_start(datetime.date.today())
+        # user_uuid -> (month_start, category key) -> latest alert not shown yet
+        self._alerts: Dict[str, Dict[Tuple[datetime.date, str], BudgetAlert]] = {}
+
+    def _add_rollups(self, spent: Dict[Tuple[str, str], Dict[str, float]], rows: List[dict]) -> None:
+        for row in rows:
+            key = category_key(row['category'])
+            budget = self._limits.get(str(row['user_uuid']), {}).get(key)
+            if budget is not None and row['currency_code'] == budget.currency_code:
+                spent.setdefault((str(row['user_uuid']), key), {})[row['category']] = (
+                    float(row['total_amount'])
+                )
+
+    async def load(self) -> int:
+        """Read every budget and the current month's spending against them."""
+        limits: Dict[str, Dict[str, Budget]] = {}
+        for row in await self.repo.all_limits():
+            limits.setdefault(str(row['user_uuid']), {})[category_key(row['category'])] = Budget(
+                row['category'], row['currency_code'], float(row['amount_limit'])
+            )
+        self._limits = limits
+        self._month = _month_start(datetime.date.today())
+        spent: Dict[Tuple[str, str], Dict[str, float]] = {}
+        self._add_rollups(spent, await self.repo.month_rollups(self._month))
+        self._spent = spent
+        return sum(len(budgets) for budgets in limits.values())
+
+    async def refresh_user(self, user_uuid: str) -> None:
+        """Re-read the user's spending this month, e.g. after a bulk import that bypassed the listener."""
+        if user_uuid not in self._limits:
+            return
+        self._roll_month()
+        rows = await self.repo.month_rollups(self._month, user_uuid)
+        for key in [k for k in self._spent if k[0] == user_uuid]:
+            del self._spent[key]
+        self._add_rollups(self._spent, rows)
+
+    async def set_limit(self, user_uuid: str, category: str, currency_code: str, amount_limit: float) -> Budget:
+        budgets = self._limits.get(user_uuid, {})
+        old = budgets.get(category_key(category))
+        if old is not None and old.category != category:
+            # Same category in another spelling: replace the row, not add a second one
+            await self.repo.remove(user_uuid, old.category)
+        await self.repo.set_limit(user_uuid, category, currency_code, amount_limit)
+        budget = Budget(category, currency_code, amount_limit)
+        self._limits.setdefault(user_uuid, {})[category_key(category)] = budget
+        await self.refresh_user(user_uuid)
+        return budget
+
+    async def remove(self, user_uuid: str, category: str) -> bool:
+        key = category_key(category)
+        budget = self._limits.get(user_uuid, {}).get(key)
+        # The row is stored in the spelling the budget was set with
+        removed = await self.repo.remove(user_uuid, budget.category if budget is not None else category) > 0
+        self._limits.get(user_uuid, {}).pop(key, None)
+        self._spent.pop((user_uuid, key), None)
+        alerts = self._alerts.get(user_uuid, {})
+        for alert_key in [k for k in alerts if k[1] == key]:
+            del alerts[alert_key]
+        return removed
+
+    def spent(self, user_uuid: str, category: str) -> float:
+        """This month's spending of the user in a budgeted category."""
+        self._roll_month()
+        return sum(self._spent.get((user_uuid, category_key(category)), {}).values())
+
+    def budgets(self, user_uuid: str) -> List[Tuple[Budget, float]]:
+        """The user's budgets with this month's spending, largest share of the limit first."""
+        rows = [(budget, self.spent(user_uuid, budget.category)) for budget in self._limits.get(user_uuid, {}).values()]
+        return sorted(rows, key=lambda r: (-r[1] / r[0].amount_limit, r[0].category))
+
+    def _roll_month(self) -> None:
+        month = _month_start(datetime.date.today())
+        if month != self._month:
+            self._month = month
+            self._spent.clear()
+
+    def apply(self, changes: List[Dict[str, Any]]) -> None:
+        """Rollup listener: update the spending of budgeted categories and note thresholds crossed upwards."""
+        self._roll_month()
+        for row in changes:
+            user_uuid = str(row['user_uuid'])
+            budgets = self._limits.get(user_uuid)
+            if not budgets or row['month_start'] != self._month:
+                continue
+            key = category_key(row['category'])
+            budget = budgets.get(key)
+            if budget is None or row['currency_code'] != budget.currency_code:
+                continue
+            spellings = self._spent.setdefault((user_uuid, key), {})
+            spellings[row['category']] = float(row['total_amount'])
+            after = sum(spellings.values())
+            before = after - float(row['delta_amount'])
+            for threshold in self.thresholds:
+                if before < threshold * budget.amount_limit <= after:
+                    self._alerts.setdefault(user_uuid, {})[(row['month_start'], key)] = BudgetAlert(
+                        budget, row['month_start'], after, threshold
+                    )
+                    break
+
+    def pop_alerts(self, user_uuid: str) -> List[BudgetAlert]:
+        alerts = self._alerts.pop(user_uuid, None)
+        return list(alerts.values()) if alerts else []
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'budgets': sum(len(budgets) for budgets in self._limits.values()),
+            'tracked_totals': len(self._spent),
+            'pending_alerts': sum(len(alerts) for alerts in self._alerts.values()),
+        }
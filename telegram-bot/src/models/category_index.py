@@ -0,0 +1,194 @@
+import re
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from config.settings import CATEGORY_INDEX_CACHE_SIZE, CATEGORY_INDEX_TTL, CATEGORY_SUGGESTIONS
+from .report_repository import ReportRepository
+from utils.cache import TTLCache
+
+
+_WHITESPACE_RE = re.compile(r'\s+')
+
+
+def category_key(category: str) -> str:
+    """Spelling-insensitive key of a category: case-folded with whitespace collapsed."""
+    return _WHITESPACE_RE.sub(' ', category).strip().casefold()
+
+
+def _deletes(key: str) -> Set[str]:
+    """The key with each single character removed."""
+    return {key[:i] + key[i + 1:] for i in range(len(key))}
+
+
+def is_typo(a: str, b: str) -> bool:
+    """True if a and b differ by one insertion, deletion, substitution or swap of adjacent characters."""
+    if a == b or abs(len(a) - len(b)) > 1:
+        return False
+    if len(a) > len(b):
+        a, b = b, a
+    i = 0
+    while i < len(a) and a[i] == b[i]:
+        i += 1
+    if len(a) < len(b):
+        return a[i:] == b[i + 1:]
+    return a[i + 1:] == b[i + 1:] or (a[i + 2:] == b[i + 2:] and a[i:i + 2] == b[i:i + 2][::-1])
+
+
+class _Node:
+    __slots__ = ('children', 'key')
+
+    def __init__(self) -> None:
+        self.children: Dict[str, '_Node'] = {}
+        self.key: Optional[str] = None
+
+
+class CategoryTrie:
+    """Trie of category keys for prefix completion."""
+
+    def __init__(self) -> None:
+        self._root = _Node()
+
+    def add(self, key: str) -> None:
+        node = self._root
+        for char in key:
+            child = node.children.get(char)
+            if child is None:
+                child = node.children[char] = _Node()
+            node = child
+        node.key = key
+
+    def complete(self, prefix: str, limit: int = 50) -> List[str]:
+        """Up to limit keys starting with prefix."""
+        node = self._root
+        for char in prefix:
+            node = node.children.get(char)
+            if node is None:
+                return []
+        keys = []
+        stack = [node]
+        while stack and len(keys) < limit:
+            node = stack.pop()
+            if node.key is not None:
+                keys.append(node.key)
+            stack.extend(node.children.values())
+        return keys
+
+
+class CategoryIndex:
+    """
+    A user's categories: the spelling used most for each key and usage counts,
+    with a trie of keys for completions and a single-deletion index for typos.
+    Two keys one edit apart always share the key itself or one of its deletions,
+    so a typo lookup is a handful of dict probes regardless of how many categories there are.
+    """
+
+    def __init__(self) -> None:
+        self._trie = CategoryTrie()
+        # key or one of its single deletions -> keys
+        self._neighbours: Dict[str, Set[str]] = {}
+        # key -> {spelling: uses}
+        self._spellings: Dict[str, Dict[str, int]] = {}
+
+    def __len__(self) -> int:
+        return len(self._spellings)
+
+    def add(self, category: str, count: int = 1) -> None:
+        key = category_key(category)
+        if not key:
+            return
+        spellings = self._spellings.get(key)
+        if spellings is None:
+            spellings = self._spellings[key] = {}
+            self._trie.add(key)
+            for variant in _deletes(key) | {key}:
+                keys = self._neighbours.get(variant)
+                if keys is None:
+                    self._neighbours[variant] = {key}
+                else:
+                    keys.add(key)
+        spelling = _WHITESPACE_RE.sub(' ', category).strip()
+        spellings[spelling] = spellings.get(spelling, 0) + count
+
+    def _uses(self, key: str) -> int:
+        return sum(self._spellings[key].values())
+
+    def _canonical(self, key: str) -> str:
+        spellings = self._spellings[key]
+        return max(spellings, key=spellings.get)
+
+    def resolve(self, category: str) -> Optional[str]:
+        """The user's usual spelling of category, or None if the user has never used it."""
+        key = category_key(category)
+        return self._canonical(key) if key in self._spellings else None
+
+    def suggest(self, category: str, limit: int = CATEGORY_SUGGESTIONS) -> List[str]:
+        """
+        Known categories the user probably meant: one-typo misspellings first, then
+        completions of a prefix, each ranked by how often the user used them.
+        """
+        key = category_key(category)
+        if not key:
+            return []
+        ranked = {}
+        for variant in _deletes(key) | {key}:
+            for k in self._neighbours.get(variant, ()):
+                if is_typo(key, k):
+                    ranked[k] = 0
+        # Completions rank after every typo match
+        for k in self._trie.complete(key, limit=20):
+            if k != key and k not in ranked:
+                ranked[k] = 1
+        order = sorted(ranked, key=lambda k: (ranked[k], -self._uses(k), k))
+        return [self._canonical(k) for k in order[:limit]]
+
+
+class CategoryService:
+    """
+    Per-user CategoryIndex instances, loaded lazily from the user's rollups on first
+    use and kept in a bounded TTL cache, so inactive users drop out of memory.
+    """
+
+    def __init__(
+        self,
+        report_repo: ReportRepository,
+        cache: Optional[TTLCache] = None,
+    ) -> None:
+        self.report_repo = report_repo
+        self.cache = cache or TTLCache(CATEGORY_INDEX_CACHE_SIZE, CATEGORY_INDEX_TTL)
+
+    async def get(self, user_uuid: str) -> CategoryIndex:
+        found, index = self.cache.get(user_uuid)
+        if found:
+            return index
+        index = CategoryIndex()
+        for row in await self.report_repo.categories(user_uuid):
+            if row['category']:
+                index.add(row['category'], int(row['txn_count']))
+        self.cache.set(user_uuid, index)
+        return index
+
+    async def normalize(self, user_uuid: str, category: Optional[str]) -> Tuple[Optional[str], List[str]]:
+        """
+        (category, suggestions): a known category comes back in the user's usual spelling;
+        an unknown one is kept as typed, with suggestions of known categories it may be meant as.
+        """
+        if not category:
+            return category, []
+        index = await self.get(user_uuid)
+        resolved = index.resolve(category)
+        if resolved is not None:
+            return resolved, []
+        return category, index.suggest(category)
+
+    def record(self, user_uuid: str, categories: Iterable[Optional[str]]) -> None:
+        """Count saved categories in the user's index if it is loaded; otherwise the next load sees them."""
+        found, index = self.cache.get(user_uuid)
+        if found:
+            for category in categories:
+                if category:
+                    index.add(category)
+
+    def invalidate(self, user_uuid: str) -> None:
+        self.cache.invalidate(user_uuid)
+
+    def stats(self) -> Dict[str, float]:
+        return self.cache.stats()
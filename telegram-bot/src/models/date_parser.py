@@ -0,0 +1,180 @@
+import datetime
+import re
+from typing import Dict, Optional, Tuple
+
+
+ParseResult = Tuple[Optional[datetime.datetime], int]
+
+DATEPARSER_SETTINGS = {
+    'PREFER_DATES_FROM': 'past',
+    'RETURN_AS_TIMEZONE_AWARE': False,
+}
+
+# Tier 1: explicit anchored formats to avoid over-consuming tokens
+EXPLICIT_PATTERNS = [
+    (re.compile(r'^(\d{4}-\d{2}-\d{2})'), '%Y-%m-%d'),          # 2025-09-07
+    (re.compile(r'^(\d{1,2}\.\d{1,2}\.\d{4})'), '%d.%m.%Y'),    # 8.09.2025 or 08.09.2025
+]
+
+# Tier 2: keyword table for the relative dates people actually type (en, ru)
+RELATIVE_DAYS = {
+    'today': 0,
+    'yesterday': 1,
+    'сегодня': 0,
+    'вчера': 1,
+    'позавчера': 2,
+}
+WEEKDAYS = {
+    'monday': 0, 'tuesday': 1, 'wednesday': 2, 'thursday': 3,
+    'friday': 4, 'saturday': 5, 'sunday': 6,
+    'понедельник': 0, 'вторник': 1, 'среда': 2, 'четверг': 3,
+    'пятница': 4, 'суббота': 5, 'воскресенье': 6,
+}
+
+# Tier 3: a leading amount is not a date unless the next token could continue one
+AMOUNT_RE = re.compile(r'^[+-]?\d+(?:[.,]\d+)?$')
+TIME_RE = re.compile(r'^\d{1,2}:\d{2}')
+MONTH_PREFIXES = {
+    'jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec',
+    'янв', 'фев', 'мар', 'апр', 'мая', 'май', 'июн', 'июл', 'авг', 'сен', 'окт', 'ноя', 'дек',
+}
+DATE_CONTINUATIONS = {
+    'am', 'pm', 'day', 'days', 'week', 'weeks', 'month', 'months', 'year', 'years', 'ago',
+    'день', 'дня', 'дней', 'неделя', 'недели', 'недель', 'месяц', 'месяца', 'месяцев', 'назад',
+}
+
+# How many prefixes were resolved inline vs. by the dateparser fallback
+PARSE_COUNTS: Dict[str, int] = {'fast': 0, 'fallback': 0}
+
+# Weekday tokens resolve to the same date for the whole calendar day
+_memo_day: Optional[datetime.date] = None
+_memo: Dict[str, datetime.datetime] = {}
+
+
+def _first_token(msg: str) -> Tuple[str, str]:
+    """Return (first token without trailing punctuation, following token or '')."""
+    tokens = msg.split(None, 2)
+    first = tokens[0].rstrip(',.;') if tokens else ''
+    second = tokens[1].rstrip(',.;') if len(tokens) > 1 else ''
+    return first, second
+
+
+def _resolve_weekday(token: str, weekday: int, now: datetime.datetime) -> datetime.datetime:
+    global _memo_day
+    today = now.date()
+    if _memo_day != today:
+        _memo.clear()
+        _memo_day = today
+    resolved = _memo.get(token)
+    if resolved is None:
+        # Most recent such weekday before today (same as dateparser with PREFER_DATES_FROM=past)
+        steps = (today.weekday() - weekday) % 7 or 7
+        resolved = datetime.datetime.combine(today - datetime.timedelta(days=steps), datetime.time())
+        _memo[token] = resolved
+    return resolved
+
+
+def parse_fast(msg: str) -> Optional[ParseResult]:
+    """
+    Resolve the date prefix of a message without dateparser.
+    Returns None when the prefix is ambiguous and needs parse_slow.
+    """
+    if not msg:
+        return None, 0
+
+    for pattern, fmt in EXPLICIT_PATTERNS:
+        m = pattern.match(msg)
+        if m:
+            date_str = m.group(1)
+            try:
+                return datetime.datetime.strptime(date_str, fmt), len(date_str)
+            except ValueError:
+                return None
+
+    if msg[0].isspace():
+        return None
+
+    first, second = _first_token(msg)
+    key = first.lower()
+
+    if key in RELATIVE_DAYS:
+        return datetime.datetime.now() - datetime.timedelta(days=RELATIVE_DAYS[key]), len(first)
+    if key in WEEKDAYS:
+        return _resolve_weekday(key, WEEKDAYS[key], datetime.datetime.now()), len(first)
+
+    if AMOUNT_RE.match(first):
+        follow = second.lower()
+        if (
+            AMOUNT_RE.match(follow)
+            or TIME_RE.match(follow)
+            or follow[:3] in MONTH_PREFIXES
+            or follow in DATE_CONTINUATIONS
+        ):
+            return None
+        return None, 0
+
+    return None
+
+
+def parse_slow(msg: str) -> ParseResult:
+    """
+    Try to find a date at the beginning of the message using dateparser.
+    Supports flexible formats like "25.03.2024", "2024-03-25", "yesterday",
+    "25 Mar 2024", etc.
+    Returns: (parsed_date, end_index) where end_index is the position after the detected date
+    """
+    if not msg:
+        return None, 0
+
+    # dateparser loads its locale data on import, so it is only imported once a prefix needs it
+    import dateparser
+    from dateparser.search import search_dates
+
+    # Strategy A: explicit anchored formats to avoid over-consuming tokens
+    for pattern, fmt in EXPLICIT_PATTERNS:
+        m = pattern.match(msg)
+        if m:
+            date_str = m.group(1)
+            try:
+                parsed = datetime.datetime.strptime(date_str, fmt)
+                return parsed, len(date_str)
+            except ValueError:
+                pass
+
+    # Strategy B: natural language single-token dates (e.g., "yesterday")
+    tokens = msg.strip().split()
+    if tokens:
+        first_token = tokens[0].rstrip(',.;')
+        parsed_single = dateparser.parse(first_token, settings=DATEPARSER_SETTINGS)
+        if parsed_single and msg.lower().startswith(first_token.lower()):
+            return parsed_single, len(first_token)
+
+    # Heuristic 2: fallback to search_dates but require prefix match
+    try:
+        results = search_dates(msg, settings=DATEPARSER_SETTINGS)
+    except Exception:
+        results = None
+
+    if results:
+        for matched_text, parsed_dt in results:
+            matched_text_stripped = matched_text.strip().rstrip(',.;')
+            if msg.lower().startswith(matched_text_stripped.lower()):
+                return parsed_dt, len(matched_text_stripped)
+
+    return None, 0
+
+
+def warm_up() -> None:
+    """Load dateparser's language data up front; the first search_dates call otherwise takes seconds."""
+    parse_slow('warm up 1 January 2024')
+    parse_slow('вчера')
+
+
+def parse_date_prefix(msg: str) -> ParseResult:
+    """Tiered parse: anchored regexes and keyword table first, dateparser only for ambiguous prefixes."""
+    result = parse_fast(msg)
+    if result is None:
+        PARSE_COUNTS['fallback'] += 1
+        return parse_slow(msg)
+    PARSE_COUNTS['fast'] += 1
+    return result
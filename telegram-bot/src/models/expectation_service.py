@@ -0,0 +1,228 @@
+import asyncio
+import bisect
+import datetime
+import logging
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from config.settings import (
+    EXPECTED_HORIZON_DAYS,
+    EXPECTED_LOOKBACK_DAYS,
+    EXPECTED_MATERIALIZE_INTERVAL,
+)
+from .category_index import category_key
+from .recurring_repository import RecurringRepository
+from .transaction import Transaction
+
+
+@dataclass()
+class ExpectedTransaction:
+    """One open occurrence of a recurring rule, with the rule's matching window and tolerance."""
+    expected_transaction_uuid: str
+    user_uuid: str
+    category: str
+    lcl_dttm: datetime.datetime
+    amount_lcy: float
+    currency_code: Optional[str]
+    recurring_uuid: str
+    match_window_days: int
+    amount_tolerance: float
+
+    @classmethod
+    def from_row(cls, row: Dict[str, Any]) -> 'ExpectedTransaction':
+        return cls(
+            expected_transaction_uuid=str(row['expected_transaction_uuid']),
+            user_uuid=str(row['user_uuid']),
+            category=row['category'],
+            lcl_dttm=row['lcl_dttm'],
+            amount_lcy=float(row['amount_lcy']),
+            currency_code=row['currency_code'],
+            recurring_uuid=str(row['recurring_uuid']),
+            match_window_days=row['match_window_days'],
+            amount_tolerance=float(row['amount_tolerance']),
+        )
+
+    def accepts(self, t: Transaction) -> bool:
+        if self.currency_code is not None and t.currency_code != self.currency_code:
+            return False
+        if abs(t.amount_lcy - self.amount_lcy) > self.amount_tolerance * abs(self.amount_lcy):
+            return False
+        return abs(t.lcl_dttm - self.lcl_dttm) <= datetime.timedelta(days=self.match_window_days)
+
+
+class _Bucket:
+    """Open expectations of one user and category, sorted by due date."""
+
+    def __init__(self) -> None:
+        self.dues: List[datetime.datetime] = []
+        self.items: List[ExpectedTransaction] = []
+        self.max_window = 0
+
+    def add(self, e: ExpectedTransaction) -> None:
+        i = bisect.bisect_right(self.dues, e.lcl_dttm)
+        self.dues.insert(i, e.lcl_dttm)
+        self.items.insert(i, e)
+        self.max_window = max(self.max_window, e.match_window_days)
+
+    def pop(self, i: int) -> ExpectedTransaction:
+        del self.dues[i]
+        return self.items.pop(i)
+
+    def find(self, t: Transaction) -> Optional[int]:
+        """Position of the accepting expectation due closest to the transaction, by binary search."""
+        window = datetime.timedelta(days=self.max_window)
+        lo = bisect.bisect_left(self.dues, t.lcl_dttm - window)
+        hi = bisect.bisect_right(self.dues, t.lcl_dttm + window)
+        best = None
+        for i in range(lo, hi):
+            if self.items[i].accepts(t) and (
+                best is None or abs(self.dues[i] - t.lcl_dttm) < abs(self.dues[best] - t.lcl_dttm)
+            ):
+                best = i
+        return best
+
+
+class ExpectationIndex:
+    """
+    In-memory open expectations per user and category key (category_key).
+    Matching a transaction touches only the few expectations of its user and
+    category whose due date is within the matching window.
+    """
+
+    def __init__(self) -> None:
+        self._buckets: Dict[str, Dict[str, _Bucket]] = {}
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def add(self, expectations: Iterable[ExpectedTransaction]) -> None:
+        for e in expectations:
+            user_buckets = self._buckets.setdefault(e.user_uuid, {})
+            user_buckets.setdefault(category_key(e.category), _Bucket()).add(e)
+            self._size += 1
+
+    def claim(self, t: Transaction) -> Optional[ExpectedTransaction]:
+        """Remove and return the open expectation t fulfils, if any."""
+        if not t.user_uuid or not t.category or t.amount_lcy is None:
+            return None
+        bucket = self._buckets.get(t.user_uuid, {}).get(category_key(t.category))
+        if bucket is None:
+            return None
+        i = bucket.find(t)
+        if i is None:
+            return None
+        self._size -= 1
+        return bucket.pop(i)
+
+    def remove_rule(self, user_uuid: str, recurring_uuid: str) -> int:
+        """Drop every occurrence of a rule, past or upcoming. Returns how many were dropped."""
+        removed = 0
+        for bucket in self._buckets.get(user_uuid, {}).values():
+            for i in reversed(range(len(bucket.items))):
+                if bucket.items[i].recurring_uuid == recurring_uuid:
+                    bucket.pop(i)
+                    removed += 1
+        self._size -= removed
+        return removed
+
+    def prune(self, before: datetime.datetime) -> int:
+        """Drop expectations whose matching window closed before the given time."""
+        pruned = 0
+        for user_uuid in list(self._buckets):
+            user_buckets = self._buckets[user_uuid]
+            for category in list(user_buckets):
+                bucket = user_buckets[category]
+                keep = [e for e in bucket.items
+                        if e.lcl_dttm + datetime.timedelta(days=e.match_window_days) >= before]
+                pruned += len(bucket.items) - len(keep)
+                if keep:
+                    bucket.items = keep
+                    bucket.dues = [e.lcl_dttm for e in keep]
+                else:
+                    del user_buckets[category]
+            if not user_buckets:
+                del self._buckets[user_uuid]
+        self._size -= pruned
+        return pruned
+
+
+class ExpectationService:
+    """
+    Materializes occurrences of recurring rules ahead of time and matches incoming
+    transactions against them in memory. An occurrence counts as matched once a
+    saved transaction points at it, so matching needs no extra write.
+    """
+
+    def __init__(
+        self,
+        repo: RecurringRepository,
+        horizon_days: int = EXPECTED_HORIZON_DAYS,
+        lookback_days: int = EXPECTED_LOOKBACK_DAYS,
+    ) -> None:
+        self.repo = repo
+        self.horizon_days = horizon_days
+        self.lookback_days = lookback_days
+        self.index = ExpectationIndex()
+
+    def _bounds(self) -> Tuple[datetime.datetime, datetime.datetime]:
+        today = datetime.datetime.combine(datetime.date.today(), datetime.time())
+        return (
+            today - datetime.timedelta(days=self.lookback_days),
+            today + datetime.timedelta(days=self.horizon_days),
+        )
+
+    async def load(self) -> int:
+        """Rebuild the index from the open expectations in the database, creating missing ones first."""
+        since, horizon = self._bounds()
+        await self.repo.materialize(since, horizon)
+        index = ExpectationIndex()
+        index.add(ExpectedTransaction.from_row(row) for row in await self.repo.open_expectations(since, horizon))
+        self.index = index
+        return len(index)
+
+    async def materialize(self, recurring_uuid: Optional[str] = None) -> int:
+        """Create upcoming occurrences (of every rule, or of one) and add them to the index."""
+        since, horizon = self._bounds()
+        rows = await self.repo.materialize(since, horizon, recurring_uuid)
+        self.index.add(ExpectedTransaction.from_row(row) for row in rows)
+        return len(rows)
+
+    async def run_periodic_materialize(self, interval: float = EXPECTED_MATERIALIZE_INTERVAL) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                since, _ = self._bounds()
+                pruned = self.index.prune(since)
+                created = await self.materialize()
+                if created or pruned:
+                    logging.info(
+                        f'Expectations: {created} materialized, {pruned} expired, {len(self.index)} open'
+                    )
+            except Exception as e:
+                logging.error(f'Error materializing expected transactions: {e}')
+
+    def match(self, t: Transaction) -> Optional[ExpectedTransaction]:
+        """Link t to the open expectation it fulfils; call release() if t is not saved after all."""
+        expectation = self.index.claim(t)
+        if expectation is not None:
+            t.expected_transaction_id = expectation.expected_transaction_uuid
+        return expectation
+
+    def release(self, t: Transaction, expectation: Optional[ExpectedTransaction]) -> None:
+        if expectation is not None:
+            t.expected_transaction_id = None
+            self.index.add([expectation])
+
+    async def deactivate(self, user_uuid: str, recurring_uuid: str) -> int:
+        """
+        Stop a rule. Its upcoming unmatched occurrences are deleted and none of its
+        occurrences, including past unmatched ones, can be matched any more.
+        Returns the number of deleted occurrences.
+        """
+        dropped = await self.repo.deactivate(user_uuid, recurring_uuid)
+        self.index.remove_rule(user_uuid, recurring_uuid)
+        return len(dropped)
+
+    def stats(self) -> Dict[str, int]:
+        return {'open': len(self.index)}
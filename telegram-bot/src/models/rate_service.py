@@ -0,0 +1,173 @@
+import asyncio
+import datetime
+import logging
+from dataclasses import dataclass
+from typing import Dict, Iterable, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from config.settings import RATES_REFRESH_INTERVAL
+from utils.db import AsyncPostgres
+
+
+# Open-ended intervals (utc_valid_to_dttm is NULL) are valid until this instant
+FAR_FUTURE = np.datetime64('9999-12-31T00:00:00', 'us')
+
+RateRow = Tuple[str, str, datetime.datetime, Optional[datetime.datetime], float]
+Timestamps = Union[datetime.datetime, np.datetime64, Sequence[datetime.datetime], np.ndarray]
+
+
+@dataclass()
+class _PairRates:
+    """Intervals of one currency pair, sorted by valid_from and non-overlapping."""
+    valid_from: np.ndarray
+    valid_to: np.ndarray
+    rate: np.ndarray
+
+    def lookup(self, at: np.ndarray) -> np.ndarray:
+        """Rate in force at each timestamp (NaN where no interval covers it), by binary search."""
+        idx = np.searchsorted(self.valid_from, at, side='right') - 1
+        safe_idx = np.clip(idx, 0, None)
+        covered = (idx >= 0) & (at < self.valid_to[safe_idx])
+        return np.where(covered, self.rate[safe_idx], np.nan)
+
+
+class RateIndex:
+    """In-memory exchange-rate intervals per (from, to) currency pair."""
+
+    def __init__(self) -> None:
+        self._pairs: Dict[Tuple[str, str], _PairRates] = {}
+
+    def __len__(self) -> int:
+        return sum(len(p.rate) for p in self._pairs.values())
+
+    def add(self, rows: Iterable[RateRow]) -> None:
+        """
+        Merge new intervals into the index. A later interval of a pair closes the
+        previous one, and an interval with the same start replaces the old one.
+        """
+        grouped: Dict[Tuple[str, str], list] = {}
+        for from_code, to_code, valid_from, valid_to, rate in rows:
+            grouped.setdefault((from_code, to_code), []).append((valid_from, valid_to, rate))
+
+        for pair, intervals in grouped.items():
+            valid_from = np.array([i[0] for i in intervals], dtype='datetime64[us]')
+            valid_to = np.array(
+                [i[1] if i[1] is not None else FAR_FUTURE for i in intervals], dtype='datetime64[us]'
+            )
+            rate = np.array([i[2] for i in intervals], dtype=np.float64)
+
+            existing = self._pairs.get(pair)
+            if existing is not None:
+                valid_from = np.concatenate([existing.valid_from, valid_from])
+                valid_to = np.concatenate([existing.valid_to, valid_to])
+                rate = np.concatenate([existing.rate, rate])
+
+            # Keep the most recently loaded interval for duplicate starts, then sort by start
+            reversed_from = valid_from[::-1]
+            _, first_in_reversed = np.unique(reversed_from, return_index=True)
+            keep = len(valid_from) - 1 - first_in_reversed
+            order = keep[np.argsort(valid_from[keep], kind='stable')]
+            valid_from, valid_to, rate = valid_from[order], valid_to[order], rate[order]
+            valid_to[:-1] = np.minimum(valid_to[:-1], valid_from[1:])
+
+            self._pairs[pair] = _PairRates(valid_from, valid_to, rate)
+
+    def factors(self, from_code: str, to_code: str, at: np.ndarray) -> np.ndarray:
+        """Multipliers converting from_code into to_code at each timestamp; NaN when unknown."""
+        if from_code == to_code:
+            return np.ones(len(at))
+        direct = self._pairs.get((from_code, to_code))
+        if direct is not None:
+            return direct.lookup(at)
+        inverse = self._pairs.get((to_code, from_code))
+        if inverse is not None:
+            return 1.0 / inverse.lookup(at)
+        return np.full(len(at), np.nan)
+
+    def convert(
+        self, amounts: Sequence[float], from_codes: Sequence[str], to_code: str, at: Timestamps
+    ) -> np.ndarray:
+        """
+        Convert a batch of amounts into to_code. at is one timestamp for the whole
+        batch or one per amount. Amounts without a known rate come back as NaN.
+        """
+        amounts = np.asarray(amounts, dtype=np.float64)
+        from_codes = np.asarray(from_codes, dtype=object)
+        at = np.broadcast_to(np.asarray(at, dtype='datetime64[us]'), amounts.shape)
+        result = np.full(amounts.shape, np.nan)
+        for code in set(from_codes.tolist()):
+            mask = from_codes == code
+            result[mask] = amounts[mask] * self.factors(code, to_code, at[mask])
+        return result
+
+
+class RateService:
+    """
+    Keeps a RateIndex in sync with the exchange_rates table.
+    The first refresh loads everything; later ones only fetch intervals starting
+    at or after the newest one already loaded. Intervals at that start are fetched
+    again in case more pairs got one since, and those already loaded unchanged are
+    skipped, so a refresh without new rates merges and reports nothing.
+    """
+
+    def __init__(self, db: AsyncPostgres) -> None:
+        self.db = db
+        self.index = RateIndex()
+        self._loaded_until: Optional[datetime.datetime] = None
+        # (from, to) -> (valid_to, rate) of the intervals loaded that start at _loaded_until
+        self._at_loaded_until: Dict[Tuple[str, str], Tuple[Optional[datetime.datetime], float]] = {}
+
+    async def refresh(self, full: bool = False) -> int:
+        currencies = await self.db.fetch_all('SELECT currency_num_code, currency_code FROM currencies')
+        codes = {row['currency_num_code']: row['currency_code'] for row in currencies}
+
+        query = (
+            'SELECT from_currency_code, to_currency_code, buyrate, sellrate, '
+            'utc_valid_from_dttm, utc_valid_to_dttm FROM exchange_rates '
+            'WHERE utc_valid_from_dttm IS NOT NULL'
+        )
+        params = {}
+        if self._loaded_until is not None and not full:
+            query += ' AND utc_valid_from_dttm >= :since'
+            params['since'] = self._loaded_until
+        rows = await self.db.fetch_all(query, params)
+
+        if full:
+            self.index = RateIndex()
+            self._loaded_until = None
+            self._at_loaded_until = {}
+        index_rows = []
+        for row in rows:
+            from_code = codes.get(row['from_currency_code'])
+            to_code = codes.get(row['to_currency_code'])
+            quotes = [float(q) for q in (row['buyrate'], row['sellrate']) if q is not None]
+            if from_code is None or to_code is None or not quotes:
+                continue
+            valid_from, valid_to, rate = row['utc_valid_from_dttm'], row['utc_valid_to_dttm'], sum(quotes) / len(quotes)
+            if valid_from == self._loaded_until and self._at_loaded_until.get((from_code, to_code)) == (valid_to, rate):
+                continue
+            index_rows.append((from_code, to_code, valid_from, valid_to, rate))
+        for from_code, to_code, valid_from, valid_to, rate in index_rows:
+            if self._loaded_until is None or valid_from > self._loaded_until:
+                self._loaded_until = valid_from
+                self._at_loaded_until = {}
+            if valid_from == self._loaded_until:
+                self._at_loaded_until[(from_code, to_code)] = (valid_to, rate)
+        self.index.add(index_rows)
+        return len(index_rows)
+
+    async def run_periodic_refresh(self, interval: float = RATES_REFRESH_INTERVAL) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                loaded = await self.refresh()
+                if loaded:
+                    logging.info(f'Exchange rates refreshed: {loaded} intervals, {len(self.index)} in index')
+            except Exception as e:
+                logging.error(f'Error refreshing exchange rates: {e}')
+
+    def convert(
+        self, amounts: Sequence[float], from_codes: Sequence[str], to_code: str, at: Timestamps
+    ) -> np.ndarray:
+        return self.index.convert(amounts, from_codes, to_code, at)
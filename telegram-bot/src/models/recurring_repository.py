@@ -0,0 +1,157 @@
+import datetime
+import uuid
+from decimal import Decimal
+from typing import Any, Dict, List, Optional
+
+from utils.db import AsyncPostgres
+
+
+# Step of a rule as a Postgres interval; the text form is how Postgres prints it back
+PERIODS = {'weekly': '7 days', 'monthly': '1 mon', 'yearly': '1 year'}
+PERIOD_NAMES = {interval: name for name, interval in PERIODS.items()}
+
+# Columns the ExpectationService needs for matching, with the rule's window and tolerance
+EXPECTATION_COLUMNS = (
+    'e.expected_transaction_uuid, e.lcl_dttm, e.category, e.user_uuid, e.amount_lcy, e.currency_code, '
+    'e.recurring_uuid, r.match_window_days, r.amount_tolerance'
+)
+
+# Occurrence n of a rule is start_date + n * period, so monthly rules starting on the 31st
+# stay on the last day of short months instead of drifting to the 28th.
+# The series bounds estimate n from the interval's length in seconds (a month counts as
+# 30 days) with some slack; the WHERE clause keeps exactly the occurrences in [since, horizon).
+MATERIALIZE_SQL = """
+WITH due AS (
+    SELECT
+        r.recurring_uuid
+        , r.user_uuid
+        , r.category
+        , r.amount_lcy
+        , r.currency_code
+        , (r.start_date + n * r.period)::timestamp AS lcl_dttm
+    FROM recurring_transactions r
+    CROSS JOIN LATERAL generate_series(
+        greatest(0, floor(
+            extract(epoch FROM CAST(:since AS timestamp) - r.start_date) / extract(epoch FROM r.period) * 0.95
+        )::int - 1),
+        ceil(extract(epoch FROM CAST(:horizon AS timestamp) - r.start_date) / extract(epoch FROM r.period))::int + 1
+    ) AS n
+    WHERE r.active {rule_filter}
+), inserted AS (
+    INSERT INTO expected_transactions (
+        expected_transaction_uuid, lcl_dttm, entity_type, category, user_uuid, amount_lcy, currency_code, recurring_uuid
+    )
+    SELECT gen_random_uuid(), lcl_dttm, 'recurring', category, user_uuid, amount_lcy, currency_code, recurring_uuid
+    FROM due
+    WHERE lcl_dttm >= :since AND lcl_dttm < :horizon
+    ON CONFLICT (recurring_uuid, lcl_dttm) DO NOTHING
+    RETURNING *
+)
+SELECT {columns}
+FROM inserted e
+JOIN recurring_transactions r USING (recurring_uuid)
+"""
+
+# Matched occurrences are the ones a transaction points at (partial index transactions_expected_idx)
+UNMATCHED_SQL = (
+    'NOT EXISTS (SELECT 1 FROM transactions t WHERE t.expected_transaction_id = e.expected_transaction_uuid)'
+)
+
+
+class RecurringRepository:
+    """Recurring rules (recurring_transactions) and their materialized occurrences (expected_transactions)."""
+
+    def __init__(self, db: AsyncPostgres) -> None:
+        self.db = db
+
+    async def add_rule(
+        self,
+        user_uuid: str,
+        category: str,
+        amount: float,
+        currency_code: Optional[str],
+        period: str,
+        start_date: datetime.date,
+        match_window_days: int,
+        amount_tolerance: float,
+    ) -> str:
+        recurring_uuid = str(uuid.uuid4())
+        await self.db.execute(
+            'INSERT INTO recurring_transactions ('
+            'recurring_uuid, user_uuid, category, amount_lcy, currency_code, period, start_date, '
+            'match_window_days, amount_tolerance) '
+            'VALUES (:id, :u, :category, :amount, :currency, CAST(CAST(:period AS text) AS interval), :start, :window, :tolerance)',
+            {
+                'id': recurring_uuid,
+                'u': user_uuid,
+                'category': category,
+                'amount': Decimal(str(amount)),
+                'currency': currency_code,
+                'period': PERIODS[period],
+                'start': start_date,
+                'window': match_window_days,
+                'tolerance': Decimal(str(amount_tolerance)),
+            }
+        )
+        return recurring_uuid
+
+    async def list_rules(self, user_uuid: str) -> List[Dict[str, Any]]:
+        return await self.db.fetch_all(
+            'SELECT recurring_uuid, category, amount_lcy, currency_code, period::text AS period, start_date '
+            'FROM recurring_transactions WHERE user_uuid = :u AND active '
+            'ORDER BY start_date, category',
+            {'u': user_uuid}
+        )
+
+    async def deactivate(self, user_uuid: str, recurring_uuid: str) -> List[str]:
+        """
+        Stop a rule and drop its future occurrences that are still unmatched.
+        Returns the ids of the dropped occurrences.
+        """
+        rows = await self.db.execute_returning(
+            f"WITH stopped AS ("
+            f"UPDATE recurring_transactions SET active = false "
+            f"WHERE recurring_uuid = :id AND user_uuid = :u RETURNING recurring_uuid) "
+            f"DELETE FROM expected_transactions e USING stopped "
+            f"WHERE e.recurring_uuid = stopped.recurring_uuid AND e.lcl_dttm >= :now AND {UNMATCHED_SQL} "
+            f"RETURNING e.expected_transaction_uuid",
+            {'id': recurring_uuid, 'u': user_uuid, 'now': datetime.datetime.now()}
+        )
+        return [str(row['expected_transaction_uuid']) for row in rows]
+
+    async def materialize(
+        self, since: datetime.datetime, horizon: datetime.datetime, recurring_uuid: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Create the missing occurrences of active rules (all of them, or one) due in [since, horizon)
+        with a single INSERT ... SELECT. Returns only the newly created rows.
+        """
+        params: Dict[str, Any] = {'since': since, 'horizon': horizon}
+        rule_filter = ''
+        if recurring_uuid is not None:
+            rule_filter = 'AND r.recurring_uuid = :id'
+            params['id'] = recurring_uuid
+        query = MATERIALIZE_SQL.format(columns=EXPECTATION_COLUMNS, rule_filter=rule_filter)
+        return await self.db.execute_returning(query, params)
+
+    async def open_expectations(self, since: datetime.datetime, horizon: datetime.datetime) -> List[Dict[str, Any]]:
+        """Unmatched occurrences of active rules due in [since, horizon), for every user."""
+        return await self.db.fetch_all(
+            f"SELECT {EXPECTATION_COLUMNS} FROM expected_transactions e "
+            f"JOIN recurring_transactions r USING (recurring_uuid) "
+            f"WHERE r.active AND e.lcl_dttm >= :since AND e.lcl_dttm < :horizon AND {UNMATCHED_SQL}",
+            {'since': since, 'horizon': horizon}
+        )
+
+    async def unmatched_for_user(
+        self, user_uuid: str, horizon: datetime.datetime, limit: int = 50
+    ) -> List[Dict[str, Any]]:
+        """A user's unmatched occurrences of active rules due before horizon, the most recent first."""
+        return await self.db.fetch_all(
+            f"SELECT e.lcl_dttm, e.category, e.amount_lcy, e.currency_code, r.match_window_days "
+            f"FROM expected_transactions e "
+            f"JOIN recurring_transactions r USING (recurring_uuid) "
+            f"WHERE e.user_uuid = :u AND r.active AND e.lcl_dttm < :horizon AND {UNMATCHED_SQL} "
+            f"ORDER BY e.lcl_dttm DESC LIMIT :limit",
+            {'u': user_uuid, 'horizon': horizon, 'limit': limit}
+        )
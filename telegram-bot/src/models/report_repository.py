@@ -0,0 +1,39 @@
+import datetime
+from typing import List
+
+from utils.db import AsyncPostgres
+
+
+class ReportRepository:
+    """Read side of reporting; every query is served from monthly_rollups, never from transactions."""
+
+    def __init__(self, db: AsyncPostgres) -> None:
+        self.db = db
+
+    async def month_by_category(self, user_uuid: str, month_start: datetime.date) -> List[dict]:
+        return await self.db.fetch_all(
+            'SELECT category, currency_code, total_amount, txn_count FROM monthly_rollups '
+            'WHERE user_uuid = :u AND month_start = :m AND txn_count > 0 '
+            'ORDER BY currency_code, total_amount DESC',
+            {'u': user_uuid, 'm': month_start}
+        )
+
+    async def monthly_totals(self, user_uuid: str, since: datetime.date) -> List[dict]:
+        return await self.db.fetch_all(
+            'SELECT month_start, currency_code, sum(total_amount) AS total_amount, sum(txn_count) AS txn_count '
+            'FROM monthly_rollups '
+            'WHERE user_uuid = :u AND month_start >= :since AND txn_count > 0 '
+            'GROUP BY month_start, currency_code '
+            'ORDER BY month_start DESC, currency_code',
+            {'u': user_uuid, 'since': since}
+        )
+
+    async def categories(self, user_uuid: str) -> List[dict]:
+        return await self.db.fetch_all(
+            'SELECT category, currency_code, sum(total_amount) AS total_amount, sum(txn_count) AS txn_count '
+            'FROM monthly_rollups '
+            'WHERE user_uuid = :u AND txn_count > 0 '
+            'GROUP BY category, currency_code '
+            'ORDER BY sum(txn_count) DESC, category',
+            {'u': user_uuid}
+        )
@@ -0,0 +1,200 @@
+import asyncio
+import datetime
+import functools
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from config.settings import IMPORT_CHUNK_SIZE
+from utils.statement_reader import chunked, iter_statement_rows
+from .date_parser import parse_date_prefix
+from .transaction import Transaction
+from .transaction_repository import TransactionRepository
+
+
+# Statement column headers (lowercased) accepted for each Transaction field
+COLUMN_ALIASES = {
+    'lcl_dttm': (
+        'date', 'datetime', 'transaction date', 'booking date', 'operation date', 'posted date',
+        'дата', 'дата операции', 'дата платежа',
+    ),
+    'amount_lcy': (
+        'amount', 'sum', 'value', 'amount_lcy',
+        'сумма', 'сумма операции', 'сумма платежа',
+    ),
+    'currency_code': (
+        'currency', 'currency code', 'currency_code', 'ccy',
+        'валюта', 'валюта операции',
+    ),
+    'category': (
+        'category', 'description', 'details', 'merchant', 'payee',
+        'категория', 'описание',
+    ),
+}
+REQUIRED_FIELDS = ('lcl_dttm', 'amount_lcy')
+
+# Full timestamp layouts tried before handing a date cell to the message parser
+STATEMENT_DTTM_FORMATS = ('%d.%m.%Y %H:%M:%S', '%d.%m.%Y %H:%M', '%d/%m/%Y %H:%M', '%d/%m/%Y')
+
+CATEGORY_MAX_LENGTH = 50
+MAX_REPORTED_ERRORS = 10
+
+
+@dataclass()
+class ImportSummary:
+    rows: int = 0
+    imported: int = 0
+    duplicates: int = 0
+    invalid: int = 0
+    errors: List[str] = field(default_factory=list)
+
+
+def map_columns(header: List[str]) -> Dict[str, str]:
+    """Map Transaction fields to the statement's column names; raises ValueError if a required one is missing."""
+    normalized = {name.strip().lower(): name for name in header if name}
+    mapping = {}
+    for field_name, aliases in COLUMN_ALIASES.items():
+        for alias in aliases:
+            if alias in normalized:
+                mapping[field_name] = normalized[alias]
+                break
+    missing = [f for f in REQUIRED_FIELDS if f not in mapping]
+    if missing:
+        expected = '; '.join(f"{f}: {', '.join(COLUMN_ALIASES[f][:3])}" for f in missing)
+        raise ValueError(f'Could not find the required columns ({expected})')
+    return mapping
+
+
+@functools.lru_cache(maxsize=4096)
+def _parse_date_cell(value: str) -> Optional[datetime.datetime]:
+    # Statements repeat the same day many times, so cells are memoized
+    try:
+        return datetime.datetime.fromisoformat(value)
+    except ValueError:
+        pass
+    for fmt in STATEMENT_DTTM_FORMATS:
+        try:
+            return datetime.datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+    parsed, end = parse_date_prefix(value)
+    if parsed is None or value[end:].strip():
+        return None
+    return parsed
+
+
+def record_to_transaction(
+    record: Dict[str, Any], columns: Dict[str, str], default_currency: Optional[str]
+) -> Transaction:
+    """Build a Transaction from one statement row; raises ValueError if the row is unusable."""
+    raw_dttm = record.get(columns['lcl_dttm'])
+    if isinstance(raw_dttm, datetime.datetime):
+        lcl_dttm = raw_dttm
+    elif isinstance(raw_dttm, datetime.date):
+        lcl_dttm = datetime.datetime.combine(raw_dttm, datetime.time())
+    else:
+        lcl_dttm = _parse_date_cell(str(raw_dttm or '').strip())
+    if lcl_dttm is None:
+        raise ValueError(f'bad date {raw_dttm!r}')
+
+    raw_amount = record.get(columns['amount_lcy'])
+    if isinstance(raw_amount, (int, float)):
+        amount = float(raw_amount)
+    else:
+        amount = Transaction.parse_amount(str(raw_amount or ''))
+
+    currency = default_currency
+    if 'currency_code' in columns:
+        raw_currency = str(record.get(columns['currency_code']) or '').strip()
+        if raw_currency:
+            currency = raw_currency.upper()
+
+    category = None
+    if 'category' in columns:
+        category = str(record.get(columns['category']) or '').strip()[:CATEGORY_MAX_LENGTH] or None
+
+    return Transaction(lcl_dttm=lcl_dttm, amount_lcy=amount, currency_code=currency, category=category)
+
+
+def parse_records(
+    records: List[Dict[str, Any]], columns: Dict[str, str], default_currency: Optional[str], first_row: int
+) -> Tuple[List[Transaction], List[str]]:
+    transactions = []
+    errors = []
+    for row_no, record in enumerate(records, start=first_row):
+        try:
+            t = record_to_transaction(record, columns, default_currency)
+        except ValueError as e:
+            errors.append(f'Row {row_no}: {e}')
+            continue
+        # A row COPY would refuse fails its whole chunk, so it is reported here instead
+        problem = t.storage_error()
+        if problem is not None:
+            errors.append(f'Row {row_no}: {problem}')
+            continue
+        transactions.append(t)
+    return transactions, errors
+
+
+class StatementImporter:
+    """
+    Stream a CSV/XLSX statement into the transactions table.
+    The file is read and parsed chunk by chunk off the event loop and every
+    chunk is loaded with COPY, so memory stays bounded by the chunk size.
+    """
+
+    def __init__(
+        self,
+        txn_repo: TransactionRepository,
+        user_uuid: str,
+        default_currency: Optional[str],
+        dedupe: bool = True,
+        chunk_size: int = IMPORT_CHUNK_SIZE,
+    ) -> None:
+        self.txn_repo = txn_repo
+        self.user_uuid = user_uuid
+        self.default_currency = default_currency
+        self.dedupe = dedupe
+        self.chunk_size = chunk_size
+
+    async def run(
+        self, path: str, progress: Optional[Callable[[ImportSummary], Awaitable[None]]] = None
+    ) -> ImportSummary:
+        loop = asyncio.get_running_loop()
+        summary = ImportSummary()
+        chunks = chunked(iter_statement_rows(path), self.chunk_size)
+        columns = None
+        # Rows loaded so far, which later chunks must not be deduplicated against
+        loaded_ids: List[str] = []
+
+        try:
+            while True:
+                chunk = await loop.run_in_executor(None, next, chunks, None)
+                if chunk is None:
+                    break
+                if columns is None:
+                    columns = map_columns(list(chunk[0].keys()))
+
+                # Row numbers are 1-based and count the header line
+                first_row = summary.rows + 2
+                transactions, errors = await loop.run_in_executor(
+                    None, parse_records, chunk, columns, self.default_currency, first_row
+                )
+                for t in transactions:
+                    t.user_uuid = self.user_uuid
+
+                inserted = await self.txn_repo.copy_many(transactions, dedupe=self.dedupe, loaded_ids=loaded_ids)
+                if self.dedupe:
+                    loaded_ids.extend(t.transaction_id for t in transactions)
+
+                summary.rows += len(chunk)
+                summary.imported += inserted
+                summary.duplicates += len(transactions) - inserted
+                summary.invalid += len(errors)
+                summary.errors.extend(errors[:MAX_REPORTED_ERRORS - len(summary.errors)])
+
+                if progress is not None:
+                    await progress(summary)
+        finally:
+            chunks.close()
+
+        return summary
@@ -1,10 +1,27 @@
+import asyncio
+import logging
+import math
+import re
 import uuid
 import datetime
-import re
+from decimal import Decimal
 from dataclasses import dataclass, field
-from typing import Optional, Tuple
-from dateparser.search import search_dates
-import dateparser
+from typing import List, Optional, Tuple
+
+from config.settings import MULTI_ENTRY_SPLIT_SEMICOLON
+from .date_parser import PARSE_COUNTS, ParseResult, parse_date_prefix, parse_fast, parse_slow
+from utils.metrics import TRANSACTION_PARSES
+from utils.workers import WorkerPool, WorkerPoolBusy
+
+
+# Lengths of the text columns of transactions (database/init_tables.sql)
+COLUMN_MAX_LENGTHS = {
+    'entity_type': 50,
+    'category': 50,
+    'currency_code': 10,
+    'place': 100,
+    'description': 100,
+}
 
 
 @dataclass()
@@ -23,56 +40,12 @@ class Transaction:
     @staticmethod
     def _parse_dttm_from_msg(msg: str) -> Tuple[Optional[datetime.datetime], int]:
         """
-        Try to find a date at the beginning of the message using dateparser.
-        Supports flexible formats like "25.03.2024", "2024-03-25", "yesterday",
-        "25 Mar 2024", etc.
+        Find a date at the beginning of the message.
+        Cheap anchored formats and relative keywords are resolved inline;
+        dateparser is only consulted for ambiguous prefixes (see models.date_parser).
         Returns: (parsed_date, end_index) where end_index is the position after the detected date
         """
-        if not msg:
-            return None, 0
-
-        # Strategy A: explicit anchored formats to avoid over-consuming tokens
-        explicit_patterns = [
-            (r'^(\d{4}-\d{2}-\d{2})', '%Y-%m-%d'),               # 2025-09-07
-            (r'^(\d{1,2}\.\d{1,2}\.\d{4})', '%d.%m.%Y'),       # 8.09.2025 or 08.09.2025
-        ]
-        for pattern, fmt in explicit_patterns:
-            m = re.match(pattern, msg)
-            if m:
-                date_str = m.group(1)
-                try:
-                    parsed = datetime.datetime.strptime(date_str, fmt)
-                    return parsed, len(date_str)
-                except ValueError:
-                    pass
-
-        # Strategy B: natural language single-token dates (e.g., "yesterday")
-        tokens = msg.strip().split()
-        if tokens:
-            first_token = tokens[0].rstrip(',.;')
-            parsed_single = dateparser.parse(first_token, settings={
-                'PREFER_DATES_FROM': 'past',
-                'RETURN_AS_TIMEZONE_AWARE': False,
-            })
-            if parsed_single and msg.lower().startswith(first_token.lower()):
-                return parsed_single, len(first_token)
-
-        # Heuristic 2: fallback to search_dates but require prefix match
-        try:
-            results = search_dates(msg, settings={
-                'PREFER_DATES_FROM': 'past',
-                'RETURN_AS_TIMEZONE_AWARE': False,
-            })
-        except Exception:
-            results = None
-
-        if results:
-            for matched_text, parsed_dt in results:
-                matched_text_stripped = matched_text.strip().rstrip(',.;')
-                if msg.lower().startswith(matched_text_stripped.lower()):
-                    return parsed_dt, len(matched_text_stripped)
-
-        return None, 0
+        return parse_date_prefix(msg)
 
     @classmethod
     def from_message(cls, msg: str, default_currency: str = None) -> Optional["Transaction"]:
@@ -86,10 +59,82 @@ class Transaction:
           - "100 food" (uses default currency if provided)
         Returns: Transaction instance or None if parsing fails
         """
+        return cls._from_parsed(msg, cls._parse_dttm_from_msg(msg), default_currency)
+
+    @classmethod
+    async def afrom_message(
+        cls, msg: str, default_currency: str = None, pool: Optional[WorkerPool] = None
+    ) -> Optional["Transaction"]:
+        """
+        Async variant of from_message for handlers.
+        Cheap date prefixes are parsed inline; the dateparser fallback runs in pool
+        so it cannot freeze the event loop. A fallback that times out or finds the
+        pool saturated is treated as a parse failure.
+        """
+        parsed = parse_fast(msg)
+        if parsed is None:
+            PARSE_COUNTS['fallback'] += 1
+            if pool is None:
+                parsed = parse_slow(msg)
+            else:
+                try:
+                    parsed = await pool.run(parse_slow, msg)
+                except (asyncio.TimeoutError, WorkerPoolBusy) as e:
+                    TRANSACTION_PARSES.labels('busy' if isinstance(e, WorkerPoolBusy) else 'timeout').inc()
+                    logging.warning(f"Date parsing fallback skipped ({type(e).__name__}): {msg!r}")
+                    return None
+        else:
+            PARSE_COUNTS['fast'] += 1
+        transaction = cls._from_parsed(msg, parsed, default_currency)
+        TRANSACTION_PARSES.labels('ok' if transaction else 'invalid').inc()
+        return transaction
+
+    @staticmethod
+    def parse_amount(token: str) -> float:
+        """
+        Parse an amount such as "100", "45,50", "1 234.56" or "1.234,56".
+        When both separators are present the last one is the decimal separator.
+        Raises ValueError for anything that is not a number.
+        """
+        token = token.strip().replace('\u00a0', '').replace('\u202f', '').replace(' ', '')
+        if ',' in token and '.' in token:
+            thousands = ',' if token.rindex('.') > token.rindex(',') else '.'
+            token = token.replace(thousands, '')
+        return float(token.replace(',', '.'))
+
+    @staticmethod
+    def split_entries(msg: str, split_semicolons: bool = MULTI_ENTRY_SPLIT_SEMICOLON) -> List[str]:
+        """Split a message into one entry per non-empty line (and per ';' if enabled)."""
+        separators = r'[\n;]' if split_semicolons else r'\n'
+        return [entry.strip() for entry in re.split(separators, msg or '') if entry.strip()]
+
+    @classmethod
+    async def afrom_entries(
+        cls, entries: List[str], default_currency: str = None, pool: Optional[WorkerPool] = None
+    ) -> List[Optional["Transaction"]]:
+        """
+        Parse every entry concurrently; the result holds None for entries that failed to parse.
+        At most pool.max_workers entries are parsed at a time, so a long message waits for
+        the pool instead of overflowing its max_pending and failing the lines past it.
+        """
+        if pool is None:
+            slots = None
+        else:
+            slots = asyncio.Semaphore(pool.max_workers)
+
+        async def parse(entry: str) -> Optional["Transaction"]:
+            if slots is None:
+                return await cls.afrom_message(entry, default_currency=default_currency, pool=pool)
+            async with slots:
+                return await cls.afrom_message(entry, default_currency=default_currency, pool=pool)
+
+        return list(await asyncio.gather(*(parse(entry) for entry in entries)))
+
+    @classmethod
+    def _from_parsed(cls, msg: str, parsed: ParseResult, default_currency: str = None) -> Optional["Transaction"]:
         try:
             tx = cls()
-            # Try to parse date at the beginning
-            date, date_end = cls._parse_dttm_from_msg(msg)
+            date, date_end = parsed
             if date:
                 tx.lcl_dttm = date
                 # Remove the date part from the message
@@ -102,8 +147,7 @@ class Transaction:
                 return None
 
             # Parse amount (should be the first part)
-            amount_token = parts[0].replace(',', '.')
-            tx.amount_lcy = float(amount_token)
+            tx.amount_lcy = cls.parse_amount(parts[0])
             
             # Check if the second part is a currency code (3-letter alphabetic)
             if len(parts) >= 3 and len(parts[1]) == 3 and parts[1].isalpha():
@@ -124,6 +168,26 @@ class Transaction:
         except (ValueError, IndexError):
             return None
 
+    def storage_error(self) -> Optional[str]:
+        """Why Postgres would refuse to store this transaction, or None if it fits the transactions table."""
+        for column, max_length in COLUMN_MAX_LENGTHS.items():
+            value = getattr(self, column)
+            if value is None:
+                continue
+            name = column.replace('_', ' ')
+            if len(value) > max_length:
+                return f'{name} is longer than {max_length} characters'
+            if '\x00' in value:
+                return f'{name} contains a NUL character'
+        if self.amount_lcy is not None and not math.isfinite(self.amount_lcy):
+            return 'amount is not a finite number'
+        if self.user_uuid is not None:
+            try:
+                uuid.UUID(self.user_uuid)
+            except ValueError:
+                return f'user {self.user_uuid!r} is not a uuid'
+        return None
+
     def to_dict(self) -> dict:
         """Convert transaction to dictionary for database insertion"""
         return {
@@ -132,7 +196,8 @@ class Transaction:
             'entity_type': self.entity_type,
             'category': self.category,
             'user_uuid': self.user_uuid,
-            'amount_lcy': self.amount_lcy,
+            # Decimal keeps "45.55" exact in the numeric column (asyncpg would encode the float's binary value)
+            'amount_lcy': Decimal(str(self.amount_lcy)) if self.amount_lcy is not None else None,
             'currency_code': self.currency_code,
             'place': self.place,
             'description': self.description,
@@ -0,0 +1,87 @@
+import asyncio
+import logging
+from typing import List, Optional, Set, Tuple
+
+from config.settings import TXN_BATCH_SIZE, TXN_BATCH_MAX_DELAY
+from .transaction import Transaction
+from .transaction_repository import TransactionRepository
+
+
+class TransactionBuffer:
+    """
+    Write-behind buffer for transaction inserts.
+    Rows are collected in memory and flushed with a single multi-row INSERT once
+    max_size rows are pending or max_delay seconds have passed since the first one.
+    submit() resolves only after the row has been persisted (or failed).
+    """
+
+    def __init__(
+        self,
+        repo: TransactionRepository,
+        max_size: int = TXN_BATCH_SIZE,
+        max_delay: float = TXN_BATCH_MAX_DELAY,
+    ) -> None:
+        self.repo = repo
+        self.max_size = max_size
+        self.max_delay = max_delay
+        self._pending: List[Tuple[Transaction, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._flushes: Set[asyncio.Task] = set()
+        self._closed = False
+
+    async def submit(self, t: Transaction) -> bool:
+        if self._closed:
+            return await self.repo.insert(t)
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((t, future))
+        if len(self._pending) >= self.max_size:
+            self._start_flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_delay, self._start_flush)
+        return await future
+
+    async def submit_many(self, transactions: List[Transaction]) -> bool:
+        """Store transactions that arrived together; they already form a batch, so they are inserted at once."""
+        return await self.repo.insert_many(transactions) == len(transactions)
+
+    def _start_flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+        task = asyncio.get_running_loop().create_task(self._flush(batch))
+        self._flushes.add(task)
+        task.add_done_callback(self._flushes.discard)
+
+    async def _flush(self, batch: List[Tuple[Transaction, asyncio.Future]]) -> None:
+        try:
+            await self.repo.insert_many([t for t, _ in batch])
+            results = [True] * len(batch)
+        except Exception as e:
+            # One bad row must not fail the whole batch: retry rows one by one
+            logging.error(f"Batch insert of {len(batch)} transactions failed, retrying individually: {e}")
+            results = []
+            for t, _ in batch:
+                try:
+                    results.append(await self.repo.insert(t))
+                except Exception as row_error:
+                    logging.error(f"Error inserting transaction {t.transaction_id}: {row_error}")
+                    results.append(False)
+
+        for (_, future), ok in zip(batch, results):
+            if not future.done():
+                future.set_result(ok)
+
+    async def flush(self) -> None:
+        self._start_flush()
+        if self._flushes:
+            await asyncio.gather(*self._flushes, return_exceptions=True)
+
+    async def close(self) -> None:
+        """Flush everything still pending; later submits are written directly."""
+        self._closed = True
+        await self.flush()
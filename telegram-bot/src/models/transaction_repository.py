@@ -1,17 +1,189 @@
-from typing import Optional
+import datetime
+import logging
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Sequence
 
 from .transaction import Transaction
-from utils.db import Postgres
+from utils.db import AsyncPostgres
+
+
+# Every write to transactions also maintains monthly_rollups in the same statement.
+# {changed} is a CTE of the affected transactions, {sign} is 1 for inserts and -1 for deletes;
+# {name} names the CTEs, so one statement can both remove and add rollup amounts.
+# {name}_delta holds the per-rollup changes and {name} returns the new totals (see ROLLUP_CHANGES).
+ROLLUP_CTE = """
+{name}_delta AS (
+    SELECT
+        user_uuid
+        , date_trunc('month', lcl_dttm)::date AS month_start
+        , coalesce(category, '') AS category
+        , coalesce(currency_code, '') AS currency_code
+        , {sign} * coalesce(sum(amount_lcy), 0) AS total_amount
+        , {sign} * count(*) AS txn_count
+    FROM {changed}
+    GROUP BY 1, 2, 3, 4
+),
+{name} AS (
+    INSERT INTO monthly_rollups (user_uuid, month_start, category, currency_code, total_amount, txn_count)
+    SELECT user_uuid, month_start, category, currency_code, total_amount, txn_count FROM {name}_delta
+    ON CONFLICT (user_uuid, month_start, category, currency_code) DO UPDATE SET
+        total_amount = monthly_rollups.total_amount + excluded.total_amount
+        , txn_count = monthly_rollups.txn_count + excluded.txn_count
+    RETURNING user_uuid, month_start, category, currency_code, total_amount, txn_count
+)
+"""
+
+# Rollups changed by the ROLLUP_CTE {name}: new totals with the change that led to them
+ROLLUP_CHANGES = """
+SELECT r.user_uuid, r.month_start, r.category, r.currency_code, r.total_amount, r.txn_count
+    , d.total_amount AS delta_amount, d.txn_count AS delta_count
+FROM {name} r JOIN {name}_delta d USING (user_uuid, month_start, category, currency_code)
+"""
+
+RollupListener = Callable[[List[Dict[str, Any]]], None]
+
+ROLLUP_COLUMNS = 'user_uuid, lcl_dttm, category, currency_code, amount_lcy'
+
+EXPORT_COLUMNS = ('transaction_id', 'lcl_dttm', 'amount_lcy', 'currency_code', 'category', 'place', 'description')
 
 
 class TransactionRepository:
-    def __init__(self, db: Postgres) -> None:
+    def __init__(self, db: AsyncPostgres) -> None:
         self.db = db
+        # Called with the ROLLUP_CHANGES rows of every insert, delete and recategorization
+        self.rollup_listeners: List[RollupListener] = []
+
+    def _notify(self, changes: List[Dict[str, Any]]) -> None:
+        for listener in self.rollup_listeners:
+            try:
+                listener(changes)
+            except Exception as e:
+                logging.error(f'Error in rollup listener {listener!r}: {e}')
+
+    async def insert(self, t: Transaction) -> bool:
+        return await self.insert_many([t]) > 0
+
+    async def insert_many(self, transactions: List[Transaction], skip_existing: bool = False) -> int:
+        """
+        Insert transactions and update their rollups; returns the number inserted.
+        With skip_existing, transactions that are already stored are left out (and not
+        counted in the rollups), so replaying a batch is harmless.
+        """
+        # The primary key includes the partition key; a replayed transaction has the same lcl_dttm
+        conflict_sql = ' ON CONFLICT (transaction_id, lcl_dttm) DO NOTHING' if skip_existing else ''
+        wrap_sql = (
+            f"WITH inserted AS ({{insert}}{conflict_sql} RETURNING {ROLLUP_COLUMNS}), "
+            + ROLLUP_CTE.format(name='rollup', sign=1, changed='inserted')
+            + ROLLUP_CHANGES.format(name='rollup')
+        )
+        changes = await self.db.insert_rows_returning(
+            'transactions', [t.to_dict() for t in transactions], wrap_sql=wrap_sql
+        )
+        self._notify(changes)
+        return sum(row['delta_count'] for row in changes)
+
+    async def copy_many(
+        self, transactions: List[Transaction], dedupe: bool = False, loaded_ids: Sequence[str] = ()
+    ) -> int:
+        """
+        Bulk load transactions with COPY. With dedupe, rows matching an existing
+        transaction of the same user (time, amount, currency, category) are skipped.
+        Rows within the load are never matched against each other, nor against
+        loaded_ids (earlier chunks of the same import): two coffees on the same day
+        of a date-only statement are two transactions.
+        Returns the number of rows inserted.
+        """
+        if not transactions:
+            return 0
+        rows = [t.to_dict() for t in transactions]
+        columns = list(rows[0].keys())
+        records = [tuple(row[c] for c in columns) for row in rows]
+        column_list = ', '.join(columns)
+        dedupe_sql = ''
+        merge_args = []
+        if dedupe:
+            merge_args.append(list(loaded_ids))
+            dedupe_sql = (
+                "WHERE NOT EXISTS ("
+                "SELECT 1 FROM transactions t "
+                "WHERE t.user_uuid = s.user_uuid "
+                "AND t.lcl_dttm = s.lcl_dttm "
+                "AND t.amount_lcy = s.amount_lcy "
+                "AND t.currency_code IS NOT DISTINCT FROM s.currency_code "
+                "AND t.category IS NOT DISTINCT FROM s.category "
+                "AND t.transaction_id <> ALL($1::uuid[]))"
+            )
+        merge_sql = (
+            f"WITH inserted AS ("
+            f"INSERT INTO transactions ({column_list}) "
+            f"SELECT {column_list} FROM {{staging}} s {dedupe_sql} "
+            f"RETURNING {ROLLUP_COLUMNS}), "
+            + ROLLUP_CTE.format(name='rollup', sign=1, changed='inserted')
+            + "SELECT count(*) FROM inserted"
+        )
+        return await self.db.copy_records('transactions', columns, records, merge_sql=merge_sql, merge_args=merge_args)
 
-    def insert(self, t: Transaction) -> bool:
-        return self.db.insert_row('transactions', t.to_dict()) > 0
+    async def delete_by_id(self, transaction_id: str) -> int:
+        changes = await self.db.execute_returning(
+            f"WITH deleted AS ("
+            f"DELETE FROM transactions WHERE transaction_id = :id RETURNING {ROLLUP_COLUMNS}), "
+            + ROLLUP_CTE.format(name='rollup', sign=-1, changed='deleted')
+            + ROLLUP_CHANGES.format(name='rollup'),
+            {'id': transaction_id}
+        )
+        self._notify(changes)
+        return -sum(row['delta_count'] for row in changes)
 
-    def delete_by_id(self, transaction_id: str) -> int:
-        return self.db.delete_where('transactions', 'transaction_id = :id', {'id': transaction_id})
+    async def recategorize(self, transaction_id: str, user_uuid: str, category: str) -> bool:
+        """Change the category of one of the user's transactions, moving its amount between rollups."""
+        changes = await self.db.execute_returning(
+            f"WITH old AS ("
+            f"SELECT transaction_id, {ROLLUP_COLUMNS} FROM transactions "
+            f"WHERE transaction_id = :id AND user_uuid = :u AND category IS DISTINCT FROM :category FOR UPDATE), "
+            f"updated AS ("
+            f"UPDATE transactions t SET category = :category FROM old "
+            f"WHERE t.transaction_id = old.transaction_id AND t.lcl_dttm = old.lcl_dttm "
+            f"RETURNING t.user_uuid, t.lcl_dttm, t.category, t.currency_code, t.amount_lcy), "
+            + ROLLUP_CTE.format(name='removed', sign=-1, changed='old') + ", "
+            + ROLLUP_CTE.format(name='added', sign=1, changed='updated')
+            + ROLLUP_CHANGES.format(name='removed') + " UNION ALL " + ROLLUP_CHANGES.format(name='added'),
+            {'id': transaction_id, 'u': user_uuid, 'category': category}
+        )
+        self._notify(changes)
+        return any(row['delta_count'] > 0 for row in changes)
 
+    async def create_partitions(self, months_ahead: int) -> int:
+        """
+        Create the monthly partitions of transactions up to months_ahead months from now,
+        and for months whose rows went to the default partition; returns how many were created.
+        """
+        rows = await self.db.execute_returning(
+            'SELECT create_transactions_partitions(:months_ahead) AS created', {'months_ahead': months_ahead}
+        )
+        return rows[0]['created']
 
+    async def stream_for_user(
+        self,
+        user_uuid: str,
+        since: Optional[datetime.date] = None,
+        until: Optional[datetime.date] = None,
+        category: Optional[str] = None,
+        chunk_size: int = 1000,
+    ) -> AsyncIterator[List[Dict[str, Any]]]:
+        """Stream a user's ledger oldest first; filters are applied in SQL, until is inclusive."""
+        conditions = ['user_uuid = :u']
+        params: Dict[str, Any] = {'u': user_uuid}
+        if since is not None:
+            conditions.append('lcl_dttm >= :since')
+            params['since'] = datetime.datetime.combine(since, datetime.time())
+        if until is not None:
+            conditions.append('lcl_dttm < :until')
+            params['until'] = datetime.datetime.combine(until + datetime.timedelta(days=1), datetime.time())
+        if category is not None:
+            conditions.append('lower(category) = lower(:category)')
+            params['category'] = category
+        query = (
+            f"SELECT {', '.join(EXPORT_COLUMNS)} FROM transactions "
+            f"WHERE {' AND '.join(conditions)} ORDER BY lcl_dttm"
+        )
+        async for chunk in self.db.stream(query, params, chunk_size=chunk_size):
+            yield chunk
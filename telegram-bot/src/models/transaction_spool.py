@@ -0,0 +1,281 @@
+import asyncio
+import base64
+import dataclasses
+import datetime
+import json
+import logging
+from typing import Any, Dict, List, Optional
+
+from config.settings import (
+    TXN_ACK_TIMEOUT,
+    TXN_BATCH_MAX_DELAY,
+    TXN_BATCH_SIZE,
+    TXN_DRAIN_RETRY_MAX,
+    TXN_DRAIN_TIMEOUT,
+)
+from .transaction import Transaction
+from .transaction_repository import TransactionRepository
+from utils.spool import CorruptRecord, Spool
+
+
+# SQLSTATE classes of errors that retrying cannot fix: data exceptions and integrity violations
+REJECTED_SQLSTATE_CLASSES = ('22', '23')
+RETRY_INITIAL_DELAY = 0.5  # seconds
+
+
+def _is_rejected(e: Exception) -> bool:
+    """True if the database refused the rows themselves rather than failed to run the statement."""
+    sqlstate = getattr(getattr(e, 'orig', None), 'sqlstate', None) or ''
+    return sqlstate[:2] in REJECTED_SQLSTATE_CLASSES
+
+
+def _encode(t: Transaction) -> bytes:
+    record = dataclasses.asdict(t)
+    record['lcl_dttm'] = t.lcl_dttm.isoformat()
+    return json.dumps(record).encode('utf-8')
+
+
+def _decode(payload: bytes) -> Transaction:
+    record = json.loads(payload)
+    record['lcl_dttm'] = datetime.datetime.fromisoformat(record['lcl_dttm'])
+    return Transaction(**record)
+
+
+class TransactionSpool:
+    """
+    Drop-in replacement for TransactionBuffer that survives Postgres being slow or down.
+
+    submit() acknowledges a transaction once it is appended to a local Spool (and
+    synced, as its fsync policy says), so replies do not wait on the database. A
+    positive ack_timeout makes it also wait up to that long for the insert, so that
+    replies reflect what the insert changed (budget alerts); after that the spooled
+    transaction counts as accepted all the same. A single drainer
+    task moves spooled transactions into Postgres in order, max_size per statement,
+    retrying with exponential backoff while the database fails. Inserts skip
+    transaction_ids that are already stored, so transactions replayed after a crash
+    (or after an insert whose commit was not confirmed) are neither duplicated nor
+    counted twice in the rollups. Transactions that do not fit the table
+    (Transaction.storage_error) are refused before they are spooled, so an
+    acknowledged transaction is one the database can take. One the database still
+    rejects outright is moved to the dead-letter file (one JSON line with the error
+    per transaction, dead_letter_path, by default next to the spool) instead of
+    blocking the spool, as are spooled bytes that cannot be read back (base64 in
+    "data"). A drainer that stops on an unexpected error is logged and restarted.
+    """
+
+    COUNTERS = Spool.COUNTERS + ('inserted', 'duplicates', 'rejected', 'retries')
+
+    def __init__(
+        self,
+        repo: TransactionRepository,
+        spool: Spool,
+        max_size: int = TXN_BATCH_SIZE,
+        max_delay: float = TXN_BATCH_MAX_DELAY,
+        ack_timeout: float = TXN_ACK_TIMEOUT,
+        drain_timeout: float = TXN_DRAIN_TIMEOUT,
+        retry_max: float = TXN_DRAIN_RETRY_MAX,
+        dead_letter_path: Optional[str] = None,
+    ) -> None:
+        self.repo = repo
+        self.spool = spool
+        self.dead_letter_path = dead_letter_path if dead_letter_path is not None else f'{spool.path}.rejected'
+        self.max_size = max_size
+        self.max_delay = max_delay
+        self.ack_timeout = ack_timeout
+        self.drain_timeout = drain_timeout
+        self.retry_max = retry_max
+        # transaction_id -> whether the transaction reached the database
+        self._waiters: Dict[str, asyncio.Future] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._drainer: Optional[asyncio.Task] = None
+        self._closed = False
+        self.inserted = 0
+        self.duplicates = 0
+        self.rejected = 0
+        self.retries = 0
+
+    async def start(self) -> int:
+        """Open the spool and start draining; returns the number of transactions left from the last run."""
+        backlog = self.spool.open()
+        self._wakeup = asyncio.Event()
+        self._start_drainer()
+        if backlog:
+            self._wakeup.set()
+        return backlog
+
+    def _start_drainer(self) -> None:
+        if self._closed:
+            return
+        self._drainer = asyncio.get_running_loop().create_task(self._drain())
+        self._drainer.add_done_callback(self._drainer_done)
+
+    def _drainer_done(self, task: asyncio.Task) -> None:
+        if task.cancelled() or self._closed:
+            return
+        logging.error(
+            f'Drainer of spool {self.spool.path} stopped, restarting it in {self.retry_max:.1f}s',
+            exc_info=task.exception(),
+        )
+        asyncio.get_running_loop().call_later(self.retry_max, self._start_drainer)
+
+    async def submit(self, t: Transaction) -> bool:
+        return await self.submit_many([t])
+
+    async def submit_many(self, transactions: List[Transaction]) -> bool:
+        """
+        True once the transactions are spooled (and, with a positive ack_timeout, inserted or
+        ack_timeout has passed).
+        False, with nothing stored, if any of them would be rejected by the database.
+        """
+        for t in transactions:
+            problem = t.storage_error()
+            if problem is not None:
+                logging.warning(f'Refusing transaction {t.transaction_id}: {problem}')
+                return False
+        if self._closed or self._drainer is None:
+            return await self.repo.insert_many(transactions, skip_existing=True) == len(transactions)
+
+        loop = asyncio.get_running_loop()
+        futures = []
+        if self.ack_timeout > 0:
+            for t in transactions:
+                future = loop.create_future()
+                self._waiters[t.transaction_id] = future
+                futures.append(future)
+        try:
+            await self.spool.append_many([_encode(t) for t in transactions])
+        except Exception as e:
+            logging.error(f'Error spooling {len(transactions)} transactions, inserting directly: {e}')
+            for t in transactions:
+                self._waiters.pop(t.transaction_id, None)
+            # Records that did reach the file are skipped by the drainer once these are stored
+            return await self.repo.insert_many(transactions, skip_existing=True) == len(transactions)
+        self._wakeup.set()
+        if not futures:
+            return True
+
+        try:
+            results = await asyncio.wait_for(asyncio.shield(asyncio.gather(*futures)), self.ack_timeout)
+        except asyncio.TimeoutError:
+            # Durable in the spool; the drainer keeps trying
+            return True
+        return all(results)
+
+    async def _insert(self, transactions: List[Transaction]) -> List[bool]:
+        """Insert a batch; rows the database rejects are retried one by one so only they fail."""
+        try:
+            inserted = await asyncio.wait_for(
+                self.repo.insert_many(transactions, skip_existing=True), self.drain_timeout
+            )
+            self.inserted += inserted
+            self.duplicates += len(transactions) - inserted
+            return [True] * len(transactions)
+        except Exception as e:
+            if not _is_rejected(e):
+                raise
+            logging.error(
+                f'Batch insert of {len(transactions)} spooled transactions rejected, retrying individually: {e}'
+            )
+
+        # Outcomes are applied only once every row has one: if the database fails midway the whole
+        # batch is retried, and rows already inserted then count as duplicates, not twice
+        results = []
+        inserted = 0
+        rejected = []
+        for t in transactions:
+            try:
+                inserted += await asyncio.wait_for(self.repo.insert_many([t], skip_existing=True), self.drain_timeout)
+                results.append(True)
+            except Exception as e:
+                if not _is_rejected(e):
+                    raise
+                rejected.append((t, e))
+                results.append(False)
+        for t, e in rejected:
+            logging.error(f'Spooled transaction {t.transaction_id} rejected, moving it to {self.dead_letter_path}: {e}')
+            self._dead_letter(e, transaction=json.loads(_encode(t)))
+        self.inserted += inserted
+        self.duplicates += len(transactions) - len(rejected) - inserted
+        self.rejected += len(rejected)
+        return results
+
+    def _dead_letter(self, error: Exception, **entry: Any) -> None:
+        line = json.dumps({'rejected_at': datetime.datetime.now().isoformat(), 'error': str(error), **entry})
+        try:
+            with open(self.dead_letter_path, 'a', encoding='utf-8') as f:
+                f.write(line + '\n')
+        except OSError as e:
+            logging.error(f'Error writing {self.dead_letter_path} ({e}), lost transaction: {line}')
+
+    async def _drain(self) -> None:
+        delay = RETRY_INITIAL_DELAY
+        while True:
+            if not self.spool.pending_bytes:
+                if self._closed:
+                    return
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                # Let messages arriving together share one INSERT, as TransactionBuffer does
+                await asyncio.sleep(self.max_delay)
+
+            try:
+                payloads, offset = self.spool.read(self.max_size)
+            except CorruptRecord as e:
+                data, offset = self.spool.skip_corrupt()
+                logging.error(f'{e}, moving {len(data)} bytes to {self.dead_letter_path}')
+                self._dead_letter(e, data=base64.b64encode(data).decode('ascii'))
+                self.rejected += 1
+                self.spool.consume(offset)
+                continue
+            transactions = []
+            undecodable = []
+            for payload in payloads:
+                try:
+                    transactions.append(_decode(payload))
+                except (ValueError, TypeError, KeyError) as e:
+                    undecodable.append((payload, e))
+            try:
+                results = await self._insert(transactions) if transactions else []
+            except Exception as e:
+                # Database unavailable or slow: keep the batch in the spool and try again later
+                self.retries += 1
+                logging.warning(
+                    f'Draining {len(transactions)} spooled transactions failed, retrying in {delay:.1f}s: {e!r}'
+                )
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.retry_max)
+                continue
+            delay = RETRY_INITIAL_DELAY
+            for payload, e in undecodable:
+                logging.error(f'Undecodable spooled transaction, moving it to {self.dead_letter_path}: {e}')
+                self._dead_letter(e, data=base64.b64encode(payload).decode('ascii'))
+                self.rejected += 1
+            self.spool.consume(offset)
+
+            for t, ok in zip(transactions, results):
+                future = self._waiters.pop(t.transaction_id, None)
+                if future is not None and not future.done():
+                    future.set_result(ok)
+
+    async def close(self, timeout: float = TXN_DRAIN_TIMEOUT) -> None:
+        """Drain what the database accepts within timeout; anything left stays spooled for the next start."""
+        self._closed = True
+        if self._drainer is not None:
+            self._wakeup.set()
+            try:
+                await asyncio.wait_for(self._drainer, timeout)
+            except asyncio.TimeoutError:
+                logging.warning(f'{self.spool.pending_bytes} bytes of transactions left in spool {self.spool.path}')
+            except Exception as e:
+                logging.error(f'Error draining spool {self.spool.path}: {e}')
+        await self.spool.close()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            **self.spool.stats(),
+            'waiting': len(self._waiters),
+            'inserted': self.inserted,
+            'duplicates': self.duplicates,
+            'rejected': self.rejected,
+            'retries': self.retries,
+        }
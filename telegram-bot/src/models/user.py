@@ -12,12 +12,12 @@ class User:
     email: Optional[str] = None
 
     def to_dict(self) -> dict:
+        # Columns of the users table; first/last name are not stored
         return {
             'user_uuid': self.user_uuid,
+            'username': self.telegram_account,
             'telegram_account': self.telegram_account,
             'default_currency_code': self.default_currency_code,
-            'first_name': self.first_name,
-            'last_name': self.last_name,
             'email': self.email,
         }
 
@@ -1,20 +1,36 @@
 from typing import Optional
 
 from .user import User
-from utils.db import Postgres
+from utils.cache import TTLCache
+from utils.db import AsyncPostgres
 
 
 class UserRepository:
-    def __init__(self, db: Postgres) -> None:
+    def __init__(self, db: AsyncPostgres, cache: Optional[TTLCache] = None) -> None:
         self.db = db
+        # Keyed by telegram account; negative lookups are cached too
+        self.cache = cache
 
-    def insert(self, user: User) -> bool:
-        return self.db.insert_row('users', user.to_dict()) > 0
+    async def insert(self, user: User) -> bool:
+        inserted = await self.db.insert_row('users', user.to_dict()) > 0
+        self.invalidate(user.telegram_account)
+        return inserted
 
-    def get_by_telegram(self, username: str) -> Optional[dict]:
-        return self.db.fetch_one(
+    async def get_by_telegram(self, username: str) -> Optional[dict]:
+        if self.cache is not None:
+            found, row = self.cache.get(username)
+            if found:
+                return row
+
+        row = await self.db.fetch_one(
             'SELECT user_uuid, telegram_account, default_currency_code FROM users WHERE telegram_account = :u',
             {'u': username}
         )
+        if self.cache is not None:
+            self.cache.set(username, row)
+        return row
 
-
+    def invalidate(self, username: str) -> None:
+        """Drop the cached row of username; every write to the users table must call it."""
+        if self.cache is not None:
+            self.cache.invalidate(username)
@@ -1,52 +1,345 @@
+import contextlib
+import functools
 import logging
-from typing import Any, Dict, Optional
+import time
+from typing import TYPE_CHECKING, Any, AsyncIterator, Dict, Iterator, List, Optional, Sequence, Tuple
 
-import pandas as pd
 from sqlalchemy import create_engine, URL, text
+from sqlalchemy.engine import Connection, Engine, Result
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine, create_async_engine
+from sqlalchemy.sql.elements import TextClause
 
-from config.settings import get_credentials
+from config.settings import (
+    get_credentials,
+    DB_POOL_SIZE,
+    DB_MAX_OVERFLOW,
+    DB_POOL_RECYCLE,
+    DB_POOL_TIMEOUT,
+    DB_POOL_PRE_PING,
+    DB_STATEMENT_CACHE_SIZE,
+)
+from utils.metrics import DB_CHECKOUT_SECONDS, QueryTimer
 
+if TYPE_CHECKING:
+    import pandas as pd
 
-class Postgres:
-    def __init__(self, credentials: Optional[Dict[str, str]] = None) -> None:
-        self.cred = credentials or get_credentials()
-        self._url_object = URL.create(
-            'postgresql+psycopg2',
-            username=self.cred['pg_user'],
-            password=self.cred['pg_password'],
-            host=self.cred['pg_host'],
-            database=self.cred['pg_database'],
+
+# Statements kept parsed by the helpers; queries are static SQL, so this holds all of them
+STATEMENT_CACHE_SIZE = 1024
+
+_engine: Optional[Engine] = None
+_async_engine: Optional[AsyncEngine] = None
+
+
+def _make_url(drivername: str, credentials: Optional[Dict[str, str]] = None) -> URL:
+    cred = credentials or get_credentials()
+    return URL.create(
+        drivername,
+        username=cred['pg_user'],
+        password=cred['pg_password'],
+        host=cred['pg_host'],
+        port=int(cred['pg_port']) if cred.get('pg_port') else None,
+        database=cred['pg_database'],
+    )
+
+
+def _pool_options() -> Dict[str, Any]:
+    return {
+        'pool_size': DB_POOL_SIZE,
+        'max_overflow': DB_MAX_OVERFLOW,
+        'pool_recycle': DB_POOL_RECYCLE,
+        'pool_timeout': DB_POOL_TIMEOUT,
+        'pool_pre_ping': DB_POOL_PRE_PING,
+    }
+
+
+def create_pooled_engine(credentials: Optional[Dict[str, str]] = None) -> Engine:
+    return create_engine(_make_url('postgresql+psycopg2', credentials), **_pool_options())
+
+
+def create_pooled_async_engine(credentials: Optional[Dict[str, str]] = None) -> AsyncEngine:
+    return create_async_engine(
+        _make_url('postgresql+asyncpg', credentials),
+        connect_args={'prepared_statement_cache_size': DB_STATEMENT_CACHE_SIZE},
+        **_pool_options(),
+    )
+
+
+def get_engine(credentials: Optional[Dict[str, str]] = None) -> Engine:
+    """Return the process-wide engine, creating it on first use."""
+    global _engine
+    if _engine is None:
+        _engine = create_pooled_engine(credentials)
+        logging.info(
+            f'Database engine created (pool_size={DB_POOL_SIZE}, max_overflow={DB_MAX_OVERFLOW})'
         )
+    return _engine
 
-        self.engine = create_engine(self._url_object)
 
-    # Generic helpers
-    def fetch_df(self, query: str, params: Optional[Dict[str, Any]] = None) -> pd.DataFrame:
+def dispose_engine() -> None:
+    global _engine
+    if _engine is not None:
+        _engine.dispose()
+        _engine = None
+        logging.info('Database engine disposed')
+
+
+def get_async_engine(credentials: Optional[Dict[str, str]] = None) -> AsyncEngine:
+    """Return the process-wide asyncpg engine used by the bot handlers."""
+    global _async_engine
+    if _async_engine is None:
+        _async_engine = create_pooled_async_engine(credentials)
+        logging.info(
+            f'Async database engine created (pool_size={DB_POOL_SIZE}, max_overflow={DB_MAX_OVERFLOW})'
+        )
+    return _async_engine
+
+
+async def dispose_async_engine() -> None:
+    global _async_engine
+    if _async_engine is not None:
+        await _async_engine.dispose()
+        _async_engine = None
+        logging.info('Async database engine disposed')
+
+
+@functools.lru_cache(maxsize=STATEMENT_CACHE_SIZE)
+def _statement(query: str) -> TextClause:
+    """
+    text() of a query, built once. Reusing the clause skips parsing its bind parameters
+    and hits SQLAlchemy's compiled cache; as the SQL text stays the same, asyncpg also
+    reuses the statement it prepared on a connection (DB_STATEMENT_CACHE_SIZE).
+    """
+    return text(query)
+
+
+@functools.lru_cache(maxsize=STATEMENT_CACHE_SIZE)
+def _insert_sql(table: str, columns: Tuple[str, ...]) -> str:
+    return f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join(f':{c}' for c in columns)})"
+
+
+@functools.lru_cache(maxsize=STATEMENT_CACHE_SIZE)
+def _delete_sql(table: str, where_sql: str) -> str:
+    return f"DELETE FROM {table} WHERE {where_sql}"
+
+
+@functools.lru_cache(maxsize=STATEMENT_CACHE_SIZE)
+def _unnest_insert_sql(table: str, columns: Tuple[Tuple[str, str], ...], wrap_sql: Optional[str]) -> str:
+    """
+    INSERT of any number of rows, one array parameter per column, so the statement text
+    does not depend on the row count. columns are (name, SQL type) pairs.
+    """
+    arrays = ', '.join(f"CAST(:{name} AS {sql_type}[])" for name, sql_type in columns)
+    query = f"INSERT INTO {table} ({', '.join(name for name, _ in columns)}) SELECT * FROM unnest({arrays})"
+    return query if wrap_sql is None else wrap_sql.format(insert=query)
+
+
+class Postgres:
+    def __init__(self, credentials: Optional[Dict[str, str]] = None, engine: Optional[Engine] = None) -> None:
+        self.engine = engine or get_engine(credentials)
+
+    @contextlib.contextmanager
+    def _connect(self) -> Iterator[Connection]:
+        started = time.perf_counter()
         with self.engine.connect() as connection:
-            return pd.read_sql_query(text(query), connection, params=params)
+            DB_CHECKOUT_SECONDS.observe(time.perf_counter() - started)
+            yield connection
+
+    # Generic helpers
+    def fetch_df(self, query: str, params: Optional[Dict[str, Any]] = None) -> 'pd.DataFrame':
+        # pandas takes longer to import than the rest of the bot; only scripts need it
+        import pandas as pd
+
+        with QueryTimer('fetch_df', query) as timer, self._connect() as connection:
+            df = pd.read_sql_query(_statement(query), connection, params=params)
+            timer.rows = len(df)
+            return df
 
     def fetch_one(self, query: str, params: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
-        with self.engine.connect() as connection:
-            result = connection.execute(text(query), params or {})
+        with QueryTimer('fetch_one', query) as timer, self._connect() as connection:
+            result = connection.execute(_statement(query), params or {})
             row = result.mappings().fetchone()
+            timer.rows = 1 if row else 0
             return dict(row) if row else None
 
     def execute(self, query: str, params: Optional[Dict[str, Any]] = None) -> int:
-        with self.engine.connect() as connection:
-            result = connection.execute(text(query), params or {})
+        with QueryTimer('execute', query) as timer, self._connect() as connection:
+            result = connection.execute(_statement(query), params or {})
             connection.commit()
-            return result.rowcount or 0
+            timer.rows = result.rowcount or 0
+            return timer.rows
 
     def insert_row(self, table: str, values: Dict[str, Any]) -> int:
         if not values:
             return 0
-        columns = ', '.join(values.keys())
-        placeholders = ', '.join(f":{k}" for k in values.keys())
-        query = f"INSERT INTO {table} ({columns}) VALUES ({placeholders})"
-        return self.execute(query, values)
+        return self.execute(_insert_sql(table, tuple(values)), values)
 
     def delete_where(self, table: str, where_sql: str, params: Dict[str, Any]) -> int:
-        query = f"DELETE FROM {table} WHERE {where_sql}"
-        return self.execute(query, params)
+        return self.execute(_delete_sql(table, where_sql), params)
+
+
+class AsyncPostgres:
+    """Asyncio counterpart of Postgres; queries run on asyncpg without blocking the event loop."""
+
+    def __init__(self, credentials: Optional[Dict[str, str]] = None, engine: Optional[AsyncEngine] = None) -> None:
+        self.engine = engine or get_async_engine(credentials)
+        # table -> column -> SQL type, for insert_rows; read once, so restart after altering a column's type
+        self._column_types: Dict[str, Dict[str, str]] = {}
+
+    @contextlib.asynccontextmanager
+    async def _connect(self, begin: bool = False) -> AsyncIterator[AsyncConnection]:
+        """Check a connection out of the pool, recording how long that took; begin wraps it in a transaction."""
+        started = time.perf_counter()
+        async with self.engine.connect() as connection:
+            DB_CHECKOUT_SECONDS.observe(time.perf_counter() - started)
+            if begin:
+                async with connection.begin():
+                    yield connection
+            else:
+                yield connection
+
+    # Generic helpers
+    async def fetch_one(self, query: str, params: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        with QueryTimer('fetch_one', query) as timer:
+            async with self._connect() as connection:
+                result = await connection.execute(_statement(query), params or {})
+                row = result.mappings().fetchone()
+                timer.rows = 1 if row else 0
+                return dict(row) if row else None
+
+    async def fetch_all(self, query: str, params: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        with QueryTimer('fetch_all', query) as timer:
+            async with self._connect() as connection:
+                result = await connection.execute(_statement(query), params or {})
+                rows = [dict(row) for row in result.mappings().fetchall()]
+                timer.rows = len(rows)
+                return rows
+
+    async def stream(
+        self, query: str, params: Optional[Dict[str, Any]] = None, chunk_size: int = 1000
+    ) -> AsyncIterator[List[Dict[str, Any]]]:
+        """
+        Yield the rows of a query in chunks of chunk_size from a server-side cursor.
+        The recorded duration includes the time the consumer spends between chunks.
+        """
+        with QueryTimer('stream', query) as timer:
+            async with self._connect() as connection:
+                result = await connection.stream(
+                    _statement(query).execution_options(yield_per=chunk_size), params or {}
+                )
+                async for partition in result.mappings().partitions(chunk_size):
+                    timer.rows += len(partition)
+                    yield [dict(row) for row in partition]
+
+    async def execute(self, query: str, params: Optional[Dict[str, Any]] = None) -> int:
+        with QueryTimer('execute', query) as timer:
+            async with self._connect() as connection:
+                result = await connection.execute(_statement(query), params or {})
+                await connection.commit()
+                timer.rows = result.rowcount or 0
+                return timer.rows
+
+    async def insert_row(self, table: str, values: Dict[str, Any]) -> int:
+        if not values:
+            return 0
+        return await self.execute(_insert_sql(table, tuple(values)), values)
+
+    async def execute_returning(self, query: str, params: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """Run a data-modifying statement with a RETURNING/SELECT part, commit and return its rows."""
+        with QueryTimer('execute_returning', query) as timer:
+            async with self._connect(begin=True) as connection:
+                result = await connection.execute(_statement(query), params or {})
+                rows = [dict(row) for row in result.mappings().fetchall()]
+                timer.rows = len(rows)
+                return rows
+
+    async def _insert_many(
+        self, connection: AsyncConnection, table: str, rows: List[Dict[str, Any]], wrap_sql: Optional[str]
+    ) -> Result:
+        """Insert rows with a single statement whose text depends only on the table, columns and wrap_sql."""
+        column_types = self._column_types.get(table)
+        if column_types is None:
+            result = await connection.execute(
+                _statement(
+                    "SELECT attname, format_type(atttypid, NULL) FROM pg_attribute "
+                    "WHERE attrelid = CAST(:table AS regclass) AND attnum > 0 AND NOT attisdropped"
+                ),
+                {'table': table},
+            )
+            column_types = self._column_types[table] = dict(result.fetchall())
+        keys = tuple(rows[0].keys())
+        columns = tuple((k, column_types[k]) for k in keys)
+        if any(sql_type.endswith('[]') for _, sql_type in columns):
+            # unnest() would flatten the arrays into separate rows
+            raise ValueError(f'insert_rows does not support array columns ({table})')
+        params = {k: [row[k] for row in rows] for k in keys}
+        return await connection.execute(_statement(_unnest_insert_sql(table, columns, wrap_sql)), params)
+
+    async def insert_rows(self, table: str, rows: List[Dict[str, Any]], wrap_sql: Optional[str] = None) -> int:
+        """
+        Insert many rows with one INSERT ... SELECT FROM unnest() of per-column arrays.
+        wrap_sql embeds the INSERT ({insert}) in a larger statement, e.g. a CTE that
+        also maintains derived tables; it must return the inserted row count as a scalar.
+        """
+        if not rows:
+            return 0
+        with QueryTimer('insert_rows', f'INSERT INTO {table}') as timer:
+            async with self._connect(begin=True) as connection:
+                result = await self._insert_many(connection, table, rows, wrap_sql)
+                if wrap_sql is None:
+                    timer.rows = result.rowcount or 0
+                else:
+                    timer.rows = result.scalar_one()
+        return timer.rows
+
+    async def insert_rows_returning(self, table: str, rows: List[Dict[str, Any]], wrap_sql: str) -> List[Dict[str, Any]]:
+        """Like insert_rows, but returns the rows wrap_sql selects."""
+        if not rows:
+            return []
+        with QueryTimer('insert_rows', f'INSERT INTO {table}') as timer:
+            async with self._connect(begin=True) as connection:
+                result = await self._insert_many(connection, table, rows, wrap_sql)
+                returned = [dict(row) for row in result.mappings().fetchall()]
+            timer.rows = len(rows)
+        return returned
+
+    async def copy_records(
+        self,
+        table: str,
+        columns: Sequence[str],
+        records: Sequence[Sequence[Any]],
+        merge_sql: Optional[str] = None,
+        merge_args: Sequence[Any] = (),
+    ) -> int:
+        """
+        Bulk load records with COPY in a single transaction.
+        With merge_sql the records are copied into a temporary staging table
+        ({staging} in merge_sql) and merge_sql moves them into the target table;
+        it must return the number of rows moved as a scalar. merge_args fill
+        its $1, $2, ... placeholders.
+        Returns the number of rows that reached the target table.
+        """
+        if not records:
+            return 0
+        with QueryTimer('copy_records', f'INSERT INTO {table}') as timer:
+            async with self._connect() as connection:
+                raw = await connection.get_raw_connection()
+                driver = raw.driver_connection
+                async with driver.transaction():
+                    if merge_sql is None:
+                        status = await driver.copy_records_to_table(table, records=records, columns=list(columns))
+                        # Command tag looks like "COPY 500"
+                        timer.rows = int(status.split()[-1])
+                        return timer.rows
 
+                    staging = f"{table}_staging"
+                    await driver.execute(
+                        f"CREATE TEMP TABLE IF NOT EXISTS {staging} "
+                        f"(LIKE {table} INCLUDING DEFAULTS) ON COMMIT DELETE ROWS"
+                    )
+                    await driver.copy_records_to_table(staging, records=records, columns=list(columns))
+                    timer.rows = await driver.fetchval(merge_sql.format(staging=staging), *merge_args)
+                    return timer.rows
 
+    async def delete_where(self, table: str, where_sql: str, params: Dict[str, Any]) -> int:
+        return await self.execute(_delete_sql(table, where_sql), params)
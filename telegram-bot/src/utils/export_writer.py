@@ -0,0 +1,62 @@
+import csv
+import datetime
+from decimal import Decimal
+from typing import Any, Dict, List, Sequence
+
+
+class CsvExportWriter:
+    extension = '.csv'
+
+    def __init__(self, path: str, columns: Sequence[str]) -> None:
+        self.columns = list(columns)
+        self._file = open(path, 'w', newline='', encoding='utf-8')
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(self.columns)
+
+    def write(self, rows: List[Dict[str, Any]]) -> None:
+        self._writer.writerows([row.get(c) for c in self.columns] for row in rows)
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class ParquetExportWriter:
+    """Writes one row group per chunk, so only the current chunk is held in memory."""
+    extension = '.parquet'
+
+    def __init__(self, path: str, columns: Sequence[str]) -> None:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self._pa = pa
+        self.columns = list(columns)
+        self.schema = pa.schema([(c, self._arrow_type(c)) for c in self.columns])
+        self._writer = pq.ParquetWriter(path, self.schema)
+
+    def _arrow_type(self, column: str):
+        if column == 'lcl_dttm':
+            return self._pa.timestamp('us')
+        if column == 'amount_lcy':
+            return self._pa.float64()
+        return self._pa.string()
+
+    @staticmethod
+    def _to_arrow_value(value: Any) -> Any:
+        if value is None or isinstance(value, (str, int, float, datetime.datetime)):
+            return value
+        if isinstance(value, Decimal):
+            return float(value)
+        return str(value)
+
+    def write(self, rows: List[Dict[str, Any]]) -> None:
+        arrays = {c: [self._to_arrow_value(row.get(c)) for row in rows] for c in self.columns}
+        self._writer.write_table(self._pa.Table.from_pydict(arrays, schema=self.schema))
+
+    def close(self) -> None:
+        self._writer.close()
+
+
+EXPORT_WRITERS = {
+    'csv': CsvExportWriter,
+    'parquet': ParquetExportWriter,
+}
@@ -0,0 +1,182 @@
+import asyncio
+import concurrent.futures
+import functools
+import logging
+import random
+import re
+import time
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Dict, Iterable, Iterator, Optional, Tuple, Union
+
+from prometheus_client import Counter, Histogram, start_http_server
+from prometheus_client.core import REGISTRY, CounterMetricFamily, GaugeMetricFamily
+
+from config.settings import METRICS_ADDR, METRICS_PORT, UPDATE_LOG_SAMPLE_RATE
+
+if TYPE_CHECKING:
+    from telegram import Update
+    from telegram.ext import ContextTypes
+
+
+HANDLER_SECONDS = Histogram(
+    'bot_handler_duration_seconds', 'Time spent in an update handler', ['handler', 'outcome']
+)
+DB_QUERY_SECONDS = Histogram(
+    'bot_db_query_duration_seconds', 'Duration of database helper calls', ['operation', 'query'],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+)
+DB_ROWS = Counter('bot_db_rows_total', 'Rows returned or written by database helper calls', ['operation', 'query'])
+DB_CHECKOUT_SECONDS = Histogram(
+    'bot_db_pool_checkout_seconds', 'Time spent waiting for a pooled database connection',
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0, 30.0),
+)
+OUTBOX_DELIVERY_SECONDS = Histogram(
+    'bot_outbox_delivery_seconds', 'Time from queueing a reply to Telegram accepting it',
+    buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0),
+)
+OUTBOX_MESSAGES = Counter('bot_outbox_messages_total', 'Queued replies by outcome', ['outcome'])
+TRANSACTION_PARSES = Counter(
+    'bot_transaction_parses_total', 'Transaction messages parsed, by result', ['result']
+)
+
+# Verb and first table of a statement; queries are static SQL, so this keeps label cardinality small
+_QUERY_RE = re.compile(r'\b(INSERT\s+INTO|DELETE\s+FROM|UPDATE|FROM)\s+([\w.]+)', re.IGNORECASE)
+_QUERY_VERBS = {'insert into': 'insert', 'delete from': 'delete', 'update': 'update', 'from': 'select'}
+
+
+@functools.lru_cache(maxsize=1024)
+def query_label(query: str) -> str:
+    """Short, bounded label for a statement, e.g. 'insert transactions' or 'select users'."""
+    m = _QUERY_RE.search(query)
+    if m is None:
+        return 'other'
+    verb = _QUERY_VERBS[' '.join(m.group(1).lower().split())]
+    return f'{verb} {m.group(2).lower()}'
+
+
+class QueryTimer:
+    """
+    Context manager timing one database helper call.
+    Set rows before leaving the block to also count returned/affected rows.
+    """
+
+    def __init__(self, operation: str, query: str) -> None:
+        self.operation = operation
+        self.label = query_label(query)
+        self.rows = 0
+
+    def __enter__(self) -> 'QueryTimer':
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        DB_QUERY_SECONDS.labels(self.operation, self.label).observe(time.perf_counter() - self._started)
+        if self.rows:
+            DB_ROWS.labels(self.operation, self.label).inc(self.rows)
+
+
+def instrument_handler(handler: Callable[..., Awaitable[Any]]) -> Callable[..., Awaitable[Any]]:
+    """Record the latency of an update handler, labelled by its name and whether it raised."""
+    name = handler.__name__
+
+    @functools.wraps(handler)
+    async def wrapper(update: 'Update', context: 'ContextTypes.DEFAULT_TYPE') -> Any:
+        started = time.perf_counter()
+        outcome = 'error'
+        try:
+            result = await handler(update, context)
+            outcome = 'ok'
+            return result
+        finally:
+            HANDLER_SECONDS.labels(name, outcome).observe(time.perf_counter() - started)
+
+    return wrapper
+
+
+async def log_update_sample(update: 'Update', context: 'ContextTypes.DEFAULT_TYPE') -> None:
+    """Log a fraction (UPDATE_LOG_SAMPLE_RATE) of incoming updates in full."""
+    if UPDATE_LOG_SAMPLE_RATE > 0 and random.random() < UPDATE_LOG_SAMPLE_RATE:
+        logging.info(f'Update: {update.to_dict()}')
+
+
+# Seconds a scrape waits for the event loop to snapshot the stats before exporting the previous snapshot
+SNAPSHOT_TIMEOUT = 2.0
+
+
+class StatsCollector:
+    """
+    Exposes stats() dicts of long-lived objects (pools, caches) at scrape time: the keys
+    named as counters of a source (totals that only grow) as counters, the rest as gauges.
+    The objects are not thread-safe, so once bound to the event loop every scrape, which
+    runs in the metrics server's thread, has the loop take the snapshot.
+    """
+
+    def __init__(self) -> None:
+        # name -> (stats callable, keys exported as counters)
+        self._sources: Dict[str, Tuple[Callable[[], Dict[str, Any]], frozenset]] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._last: Dict[str, Dict[str, Any]] = {}
+
+    def add(self, name: str, stats: Callable[[], Dict[str, Any]], counters: Iterable[str] = ()) -> None:
+        """Export stats() as bot_<name>_<key>; classes list their counter keys in COUNTERS."""
+        self._sources[name] = (stats, frozenset(counters))
+
+    def bind(self, loop: asyncio.AbstractEventLoop) -> None:
+        self._loop = loop
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """Read every source; call it on the thread that updates them."""
+        values = {}
+        for name, (stats, _) in self._sources.items():
+            try:
+                values[name] = stats()
+            except Exception as e:
+                logging.warning(f'Could not collect {name} stats: {e}')
+        self._last = values
+        return values
+
+    def _read(self) -> Dict[str, Dict[str, Any]]:
+        loop = self._loop
+        if loop is None or not loop.is_running():
+            return self.snapshot()
+        try:
+            if asyncio.get_running_loop() is loop:
+                return self.snapshot()
+        except RuntimeError:
+            pass
+        result: concurrent.futures.Future = concurrent.futures.Future()
+
+        def take() -> None:
+            if result.set_running_or_notify_cancel():
+                result.set_result(self.snapshot())
+
+        try:
+            loop.call_soon_threadsafe(take)
+            return result.result(SNAPSHOT_TIMEOUT)
+        except (RuntimeError, concurrent.futures.TimeoutError):
+            # Loop closing or too busy to answer in time
+            result.cancel()
+            logging.warning('Event loop did not snapshot the stats in time, exporting the previous values')
+            return self._last
+
+    def collect(self) -> Iterator[Union[CounterMetricFamily, GaugeMetricFamily]]:
+        for name, values in self._read().items():
+            counters = self._sources[name][1] if name in self._sources else frozenset()
+            for key, value in values.items():
+                if not isinstance(value, (int, float)) or isinstance(value, bool):
+                    continue
+                if key in counters:
+                    yield CounterMetricFamily(f'bot_{name}_{key}', f'{name} {key}', value=value)
+                else:
+                    yield GaugeMetricFamily(f'bot_{name}_{key}', f'{name} {key}', value=value)
+
+
+STATS = StatsCollector()
+REGISTRY.register(STATS)
+
+
+def start_metrics_server(port: int = METRICS_PORT, addr: str = METRICS_ADDR) -> None:
+    """Serve /metrics in Prometheus text format from a background thread; port 0 disables it."""
+    if not port:
+        return
+    start_http_server(port, addr=addr)
+    logging.info(f'Metrics endpoint listening on {addr}:{port}/metrics')
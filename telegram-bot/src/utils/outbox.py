@@ -0,0 +1,358 @@
+import asyncio
+import collections
+import heapq
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Deque, Dict, List, Optional, Set, Tuple
+
+import httpx
+from telegram import Bot, InlineKeyboardMarkup, Message
+from telegram.constants import MessageLimit
+from telegram.error import NetworkError, RetryAfter
+from telegram.ext import ContextTypes
+
+from config.settings import (
+    OUTBOX_CHAT_BURST,
+    OUTBOX_CHAT_RATE,
+    OUTBOX_COALESCE,
+    OUTBOX_DRAIN_TIMEOUT,
+    OUTBOX_GLOBAL_RATE,
+    OUTBOX_MAX_RETRIES,
+)
+from utils.metrics import OUTBOX_DELIVERY_SECONDS, OUTBOX_MESSAGES
+
+
+COALESCE_SEPARATOR = '\n\n'
+RETRY_INITIAL_DELAY = 0.5  # seconds, doubled per attempt
+PRUNE_INTERVAL = 60  # seconds between dropping the buckets of idle chats
+# Transport errors raised before the request left, so sending again cannot duplicate the message
+UNSENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+
+def _not_sent(error: NetworkError) -> bool:
+    """Whether the request failed before reaching Telegram (PTB chains the httpx error as the cause)."""
+    return isinstance(error.__cause__, UNSENT_ERRORS)
+
+
+class TokenBucket:
+    """rate tokens a second, of which up to burst are saved up while idle."""
+
+    def __init__(self, rate: float, burst: float, now: float) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now: float) -> float:
+        """Seconds until a token is available; 0 if one is available now."""
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self, now: float) -> None:
+        self._refill(now)
+        self.tokens -= 1
+
+    def is_full(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.burst
+
+
+@dataclass()
+class _Outgoing:
+    chat_id: int
+    # None for requests without text (documents)
+    text: Optional[str]
+    kwargs: Dict[str, Any]
+    coalesce: bool
+    method: str = 'send_message'
+    # (queued at, future) of every message merged into this one
+    waiters: List[Tuple[float, asyncio.Future]] = field(default_factory=list)
+    attempts: int = 0
+
+
+class Outbox:
+    """
+    Outgoing messages, sent in the background within Telegram's flood limits.
+
+    send() queues a message and returns a future of the sent Message (None if it could
+    not be delivered), so handlers finish without waiting on the Bot API; edit_text(),
+    edit_reply_markup() and send_document() queue edits and files the same way.
+    Answers to callback queries are the one Bot API call handlers make directly: they
+    are not chat messages and Telegram expects them within seconds. Every chat has its
+    own queue and token bucket (chat_rate messages a second, bursts of chat_burst) and
+    a global bucket caps all chats together at global_rate; chats take turns in the
+    order their next message is due. A chat has at most one message in
+    flight, so its replies arrive in order. Messages queued with coalesce=True (plain
+    confirmations) that wait for the same chat are merged into one, within Telegram's
+    length limit. A 429 holds back all sending for the retry_after Telegram asks for and
+    retries the message. Network errors that happened before the request went out
+    (no connection, pool exhausted) are retried with backoff up to max_retries times;
+    any other error drops the message, including timeouts, since Telegram may have
+    delivered a message whose response timed out and a retry would duplicate it.
+    """
+
+    COUNTERS = ('sent', 'coalesced', 'retries', 'dropped')
+
+    def __init__(
+        self,
+        bot: Bot,
+        global_rate: float = OUTBOX_GLOBAL_RATE,
+        chat_rate: float = OUTBOX_CHAT_RATE,
+        chat_burst: int = OUTBOX_CHAT_BURST,
+        coalesce: bool = OUTBOX_COALESCE,
+        max_retries: int = OUTBOX_MAX_RETRIES,
+    ) -> None:
+        self.bot = bot
+        self.global_rate = global_rate
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.coalesce = coalesce
+        self.max_retries = max_retries
+        self._queues: Dict[int, Deque[_Outgoing]] = {}
+        self._buckets: Dict[int, TokenBucket] = {}
+        self._global: Optional[TokenBucket] = None
+        # (due time, chat_id) of every chat with queued messages and none in flight
+        self._due: List[Tuple[float, int]] = []
+        self._scheduled: Set[int] = set()
+        self._in_flight: Set[int] = set()
+        self._tasks: Set[asyncio.Task] = set()
+        self._paused_until = 0.0
+        self._last_prune = 0.0
+        self._wakeup: Optional[asyncio.Event] = None
+        self._idle: Optional[asyncio.Event] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+        self.sent = 0
+        self.coalesced = 0
+        self.retries = 0
+        self.dropped = 0
+
+    def start(self) -> None:
+        loop = asyncio.get_running_loop()
+        self._global = TokenBucket(self.global_rate, self.global_rate, loop.time())
+        self._wakeup = asyncio.Event()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._dispatcher = loop.create_task(self._dispatch())
+
+    def send(self, chat_id: int, text: str, coalesce: bool = False, **kwargs: Any) -> 'asyncio.Future[Optional[Message]]':
+        """
+        Queue a message for chat_id; kwargs go to Bot.send_message. Only messages without
+        kwargs (e.g. no reply_markup) are merged when coalesce is set.
+        """
+        kwargs = {k: v for k, v in kwargs.items() if v is not None}
+        return self._queue(_Outgoing(chat_id, text, kwargs, coalesce and self.coalesce and not kwargs))
+
+    def edit_text(self, chat_id: int, message_id: int, text: str, **kwargs: Any) -> 'asyncio.Future[Optional[Message]]':
+        """Queue an edit of one of the bot's messages in chat_id; kwargs go to Bot.edit_message_text."""
+        kwargs = {k: v for k, v in kwargs.items() if v is not None}
+        return self._queue(_Outgoing(chat_id, text, {'message_id': message_id, **kwargs}, False, 'edit_message_text'))
+
+    def edit_reply_markup(
+        self, chat_id: int, message_id: int, reply_markup: Optional[InlineKeyboardMarkup] = None
+    ) -> 'asyncio.Future[Optional[Message]]':
+        """Queue replacing (or, without reply_markup, removing) the keyboard of one of the bot's messages."""
+        kwargs = {'message_id': message_id}
+        if reply_markup is not None:
+            kwargs['reply_markup'] = reply_markup
+        return self._queue(_Outgoing(chat_id, None, kwargs, False, 'edit_message_reply_markup'))
+
+    def send_document(self, chat_id: int, document: Any, **kwargs: Any) -> 'asyncio.Future[Optional[Message]]':
+        """
+        Queue a file for chat_id; kwargs go to Bot.send_document. The document is read when
+        the request is made, so a file path (pathlib.Path) must exist until the future is done.
+        """
+        kwargs = {k: v for k, v in kwargs.items() if v is not None}
+        return self._queue(_Outgoing(chat_id, None, {'document': document, **kwargs}, False, 'send_document'))
+
+    def _queue(self, outgoing: _Outgoing) -> 'asyncio.Future[Optional[Message]]':
+        loop = asyncio.get_running_loop()
+        chat_id = outgoing.chat_id
+        if self._dispatcher is None:
+            # Not started or already closed: send directly, without the queue's limits
+            task = loop.create_task(self._send_now(outgoing))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+            return task
+        future: 'asyncio.Future[Optional[Message]]' = loop.create_future()
+        outgoing.waiters.append((loop.time(), future))
+        self._queues.setdefault(chat_id, collections.deque()).append(outgoing)
+        self._idle.clear()
+        self._schedule(chat_id, loop.time())
+        return future
+
+    def _schedule(self, chat_id: int, due: float) -> None:
+        if chat_id in self._scheduled or chat_id in self._in_flight:
+            return
+        heapq.heappush(self._due, (due, chat_id))
+        self._scheduled.add(chat_id)
+        self._wakeup.set()
+
+    def _bucket(self, chat_id: int, now: float) -> TokenBucket:
+        bucket = self._buckets.get(chat_id)
+        if bucket is None:
+            bucket = self._buckets[chat_id] = TokenBucket(self.chat_rate, self.chat_burst, now)
+        return bucket
+
+    def _prune(self, now: float) -> None:
+        """Forget the buckets of chats that are idle long enough to have refilled them."""
+        self._last_prune = now
+        for chat_id in [c for c, b in self._buckets.items() if c not in self._queues and b.is_full(now)]:
+            del self._buckets[chat_id]
+
+    async def _dispatch(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            now = loop.time()
+            if now - self._last_prune > PRUNE_INTERVAL:
+                self._prune(now)
+            timeout: Optional[float] = None
+            if self._due:
+                timeout = max(self._due[0][0], self._paused_until) - now
+                if timeout <= 0:
+                    timeout = self._global.wait_time(now)
+                    if timeout <= 0:
+                        _, chat_id = heapq.heappop(self._due)
+                        self._scheduled.discard(chat_id)
+                        bucket = self._bucket(chat_id, now)
+                        chat_wait = bucket.wait_time(now)
+                        if chat_wait > 0:
+                            self._schedule(chat_id, now + chat_wait)
+                        else:
+                            self._global.take(now)
+                            bucket.take(now)
+                            self._start_send(chat_id)
+                        continue
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def _start_send(self, chat_id: int) -> None:
+        queue = self._queues[chat_id]
+        outgoing = queue.popleft()
+        if outgoing.coalesce:
+            while (
+                queue and queue[0].coalesce
+                and len(outgoing.text) + len(COALESCE_SEPARATOR) + len(queue[0].text) <= MessageLimit.MAX_TEXT_LENGTH
+            ):
+                merged = queue.popleft()
+                outgoing.text += COALESCE_SEPARATOR + merged.text
+                outgoing.waiters += merged.waiters
+                self.coalesced += 1
+                OUTBOX_MESSAGES.labels('coalesced').inc()
+        self._in_flight.add(chat_id)
+        task = asyncio.get_running_loop().create_task(self._send(outgoing))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _send(self, outgoing: _Outgoing) -> None:
+        loop = asyncio.get_running_loop()
+        chat_id = outgoing.chat_id
+        due = loop.time()
+        try:
+            message = await self._request(outgoing)
+        except RetryAfter as e:
+            # Flood control: hold every chat back as long as Telegram asks, then try again
+            logging.warning(f'Flood control hit sending to chat {chat_id}, pausing for {e.retry_after}s')
+            self._paused_until = max(self._paused_until, loop.time() + float(e.retry_after))
+            self._retry(outgoing)
+        except NetworkError as e:
+            if not _not_sent(e) or outgoing.attempts >= self.max_retries:
+                self._drop(outgoing, e)
+            else:
+                logging.warning(f'Error sending to chat {chat_id}, retrying: {e}')
+                due = loop.time() + RETRY_INITIAL_DELAY * 2 ** outgoing.attempts
+                outgoing.attempts += 1
+                self._retry(outgoing)
+        except Exception as e:
+            self._drop(outgoing, e)
+        else:
+            now = loop.time()
+            for queued_at, future in outgoing.waiters:
+                OUTBOX_DELIVERY_SECONDS.observe(now - queued_at)
+                if not future.done():
+                    future.set_result(message)
+            self.sent += 1
+            OUTBOX_MESSAGES.labels('sent').inc()
+        finally:
+            self._in_flight.discard(chat_id)
+            if self._queues.get(chat_id):
+                self._schedule(chat_id, due)
+            else:
+                self._queues.pop(chat_id, None)
+                if not self._queues and not self._in_flight:
+                    self._idle.set()
+
+    def _request(self, outgoing: _Outgoing) -> Awaitable[Any]:
+        kwargs = dict(outgoing.kwargs)
+        if outgoing.text is not None:
+            kwargs['text'] = outgoing.text
+        return getattr(self.bot, outgoing.method)(chat_id=outgoing.chat_id, **kwargs)
+
+    async def _send_now(self, outgoing: _Outgoing) -> Optional[Message]:
+        try:
+            message = await self._request(outgoing)
+        except Exception as e:
+            logging.error(f'Dropping message to chat {outgoing.chat_id}: {e}')
+            self.dropped += 1
+            OUTBOX_MESSAGES.labels('dropped').inc()
+            return None
+        self.sent += 1
+        OUTBOX_MESSAGES.labels('sent').inc()
+        return message
+
+    def _retry(self, outgoing: _Outgoing) -> None:
+        self.retries += 1
+        OUTBOX_MESSAGES.labels('retried').inc()
+        self._queues.setdefault(outgoing.chat_id, collections.deque()).appendleft(outgoing)
+
+    def _drop(self, outgoing: _Outgoing, error: Exception) -> None:
+        logging.error(f'Dropping message to chat {outgoing.chat_id}: {error}')
+        self.dropped += len(outgoing.waiters)
+        OUTBOX_MESSAGES.labels('dropped').inc(len(outgoing.waiters))
+        for _, future in outgoing.waiters:
+            if not future.done():
+                future.set_result(None)
+
+    async def close(self, timeout: float = OUTBOX_DRAIN_TIMEOUT) -> None:
+        """Send what is queued within timeout; anything left after that is dropped."""
+        if self._dispatcher is None:
+            return
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+        except asyncio.TimeoutError:
+            logging.warning(f'{self.stats()["queued"]} outgoing messages not sent before shutdown')
+        self._dispatcher.cancel()
+        self._dispatcher = None
+        for task in list(self._tasks):
+            task.cancel()
+        for queue in self._queues.values():
+            for outgoing in queue:
+                for _, future in outgoing.waiters:
+                    if not future.done():
+                        future.set_result(None)
+        self._queues.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'queued': sum(len(queue) for queue in self._queues.values()),
+            'chats': len(self._queues),
+            'in_flight': len(self._in_flight),
+            'sent': self.sent,
+            'coalesced': self.coalesced,
+            'retries': self.retries,
+            'dropped': self.dropped,
+        }
+
+
+def reply(
+    context: ContextTypes.DEFAULT_TYPE, chat_id: int, text: str, coalesce: bool = False, **kwargs: Any
+) -> 'asyncio.Future[Optional[Message]]':
+    """Queue a message on the application's Outbox without waiting for it to be sent."""
+    outbox: Outbox = context.bot_data['outbox']
+    return outbox.send(chat_id, text, coalesce=coalesce, **kwargs)
@@ -0,0 +1,281 @@
+import asyncio
+import json
+import logging
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from telegram.ext import Application, BasePersistence, PersistenceInput
+
+from config.settings import PERSISTENCE_MAX_LOADED_USERS, PERSISTENCE_UPDATE_INTERVAL
+from utils.db import AsyncPostgres
+from utils.update_processor import PerUserUpdateProcessor
+
+
+USER_DATA_UPSERT = (
+    "WITH written AS ({insert} ON CONFLICT (user_id, key) DO UPDATE SET value = excluded.value RETURNING 1) "
+    "SELECT count(*) FROM written"
+)
+CONVERSATION_UPSERT = (
+    "WITH written AS ({insert} ON CONFLICT (name, key) DO UPDATE SET state = excluded.state RETURNING 1) "
+    "SELECT count(*) FROM written"
+)
+
+ConversationKey = Tuple[int, ...]
+
+
+def _dumps(value: Any) -> Optional[str]:
+    try:
+        return json.dumps(value, sort_keys=True)
+    except (TypeError, ValueError):
+        return None
+
+
+class PostgresPersistence(BasePersistence):
+    """
+    Keeps user_data and the states of persistent ConversationHandlers in Postgres
+    (bot_user_data, bot_conversations), one JSON value per user_data key.
+
+    A user's data is loaded on the first update from that user, not at startup.
+    Application hands every touched user's data over once per update_interval;
+    only keys whose JSON differs from what was last written are upserted (or
+    deleted), in one batched statement per table. At most max_loaded_users users
+    are kept in memory: the least recently seen user with no update in flight and
+    no unwritten changes is dropped with Application.drop_user_data (the stored
+    rows stay) and is loaded again on their next update. Eviction needs the
+    Application, set as the application attribute once it is built.
+    bot_data and chat_data are not persisted; bot_data holds the shared services.
+    Values must be JSON-serializable; other values are skipped with a warning.
+    """
+
+    COUNTERS = ('loads', 'evictions', 'rows_written')
+
+    def __init__(
+        self,
+        db: AsyncPostgres,
+        update_interval: float = PERSISTENCE_UPDATE_INTERVAL,
+        max_loaded_users: int = PERSISTENCE_MAX_LOADED_USERS,
+    ) -> None:
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=True, callback_data=False),
+            update_interval=update_interval,
+        )
+        self.db = db
+        self.max_loaded_users = max_loaded_users
+        self.application: Optional[Application] = None
+        # user_id -> (the user's live user_data dict, {key: JSON as last written}), least recent first
+        self._loaded: 'OrderedDict[int, Tuple[Dict[str, Any], Dict[str, str]]]' = OrderedDict()
+        # Changes not written yet; None marks a deletion
+        self._dirty_users: Dict[int, Dict[str, Optional[str]]] = {}
+        self._dirty_conversations: Dict[Tuple[str, str], Optional[str]] = {}
+        self._writing: Set[int] = set()
+        # Users seen since their data was last handed over, i.e. with an update in flight or just handled
+        self._touched: Set[int] = set()
+        # Users dropped from the Application by _evict whose drop_user_data call has not come yet
+        self._evicted: Set[int] = set()
+        self._write_task: Optional[asyncio.Task] = None
+        self.loads = 0
+        self.evictions = 0
+        self.rows_written = 0
+
+    async def get_user_data(self) -> Dict[int, Dict[str, Any]]:
+        # Loaded per user in refresh_user_data
+        return {}
+
+    async def get_chat_data(self) -> Dict[int, Dict[str, Any]]:
+        return {}
+
+    async def get_bot_data(self) -> Dict[str, Any]:
+        return {}
+
+    async def get_callback_data(self) -> None:
+        return None
+
+    async def get_conversations(self, name: str) -> Dict[ConversationKey, object]:
+        # Only unfinished conversations are stored, so this stays small
+        rows = await self.db.fetch_all(
+            'SELECT key, state FROM bot_conversations WHERE name = :name', {'name': name}
+        )
+        return {tuple(json.loads(row['key'])): json.loads(row['state']) for row in rows}
+
+    async def refresh_user_data(self, user_id: int, user_data: Dict[str, Any]) -> None:
+        self._touched.add(user_id)
+        entry = self._loaded.get(user_id)
+        if entry is not None:
+            self._loaded.move_to_end(user_id)
+            return
+        try:
+            rows = await self.db.fetch_all(
+                'SELECT key, value FROM bot_user_data WHERE user_id = :u', {'u': user_id}
+            )
+        except Exception as e:
+            # Handle the update without stored data; the load is retried on the next update
+            logging.error(f'Error loading user_data of {user_id}: {e}')
+            return
+        written = {}
+        for row in rows:
+            user_data.setdefault(row['key'], json.loads(row['value']))
+            written[row['key']] = row['value']
+        self._loaded[user_id] = (user_data, written)
+        self.loads += 1
+        self._evict()
+
+    def _evict(self) -> None:
+        if self.application is None or len(self._loaded) <= self.max_loaded_users:
+            return
+        processor = self.application.update_processor
+        for user_id in list(self._loaded):
+            if len(self._loaded) <= self.max_loaded_users:
+                break
+            if (
+                user_id in self._touched or user_id in self._dirty_users or user_id in self._writing
+                or (isinstance(processor, PerUserUpdateProcessor) and processor.is_active(('user', user_id)))
+            ):
+                continue
+            del self._loaded[user_id]
+            # The Application lets go of the dict and calls drop_user_data on its next persistence run
+            self._evicted.add(user_id)
+            self.application.drop_user_data(user_id)
+            self.evictions += 1
+
+    async def update_user_data(self, user_id: int, data: Dict[str, Any]) -> None:
+        self._touched.discard(user_id)
+        entry = self._loaded.get(user_id)
+        # Without a snapshot (evicted or failed load) nothing is known to be deleted
+        written = entry[1] if entry is not None else {}
+        changes: Dict[str, Optional[str]] = {}
+        for key, value in data.items():
+            dumped = _dumps(value)
+            if not isinstance(key, str) or dumped is None:
+                logging.warning(f'Skipping user_data key {key!r} of {user_id}: not JSON-serializable')
+                continue
+            if written.get(key) != dumped:
+                changes[key] = dumped
+        if entry is not None:
+            changes.update({key: None for key in written if key not in data})
+        if not changes:
+            return
+        for key, dumped in changes.items():
+            if dumped is None:
+                written.pop(key, None)
+            else:
+                written[key] = dumped
+        self._dirty_users.setdefault(user_id, {}).update(changes)
+        self._schedule_write()
+
+    async def drop_user_data(self, user_id: int) -> None:
+        if user_id in self._evicted:
+            # Only evicted from memory, the stored data stays
+            self._evicted.discard(user_id)
+            entry = self._loaded.get(user_id)
+            if entry is not None:
+                # Back since the eviction: the Application skipped this run's update of the user it dropped
+                self.application.mark_data_for_update_persistence(user_ids=user_id)
+            return
+        self._touched.discard(user_id)
+        self._loaded.pop(user_id, None)
+        self._dirty_users.pop(user_id, None)
+        await self.db.execute('DELETE FROM bot_user_data WHERE user_id = :u', {'u': user_id})
+
+    async def update_conversation(self, name: str, key: ConversationKey, new_state: Optional[object]) -> None:
+        self._dirty_conversations[(name, json.dumps(list(key)))] = (
+            None if new_state is None else json.dumps(new_state)
+        )
+        self._schedule_write()
+
+    # chat_data, bot_data and callback_data are not stored (see store_data)
+    async def update_chat_data(self, chat_id: int, data: Dict[str, Any]) -> None:
+        pass
+
+    async def update_bot_data(self, data: Dict[str, Any]) -> None:
+        pass
+
+    async def update_callback_data(self, data: Any) -> None:
+        pass
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        pass
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: Dict[str, Any]) -> None:
+        pass
+
+    async def refresh_bot_data(self, bot_data: Dict[str, Any]) -> None:
+        pass
+
+    def _schedule_write(self) -> None:
+        # Application calls update_* for all touched users back to back; one task writes them together
+        if self._write_task is None or self._write_task.done():
+            self._write_task = asyncio.get_running_loop().create_task(self._write())
+
+    async def _write(self) -> None:
+        # Changes made while a batch is being written go out in the next batch
+        while self._dirty_users or self._dirty_conversations:
+            users, self._dirty_users = self._dirty_users, {}
+            conversations, self._dirty_conversations = self._dirty_conversations, {}
+            self._writing = set(users)
+            try:
+                await self._write_rows(users, conversations)
+            except Exception as e:
+                logging.error(
+                    f'Error writing persistence ({len(users)} users, {len(conversations)} conversations): {e}'
+                )
+                # Keep the changes for the next run unless newer ones arrived meanwhile
+                for user_id, changes in users.items():
+                    pending = self._dirty_users.setdefault(user_id, {})
+                    for key, dumped in changes.items():
+                        pending.setdefault(key, dumped)
+                for conversation, state in conversations.items():
+                    self._dirty_conversations.setdefault(conversation, state)
+                return
+            finally:
+                self._writing = set()
+
+    async def _write_rows(
+        self, users: Dict[int, Dict[str, Optional[str]]], conversations: Dict[Tuple[str, str], Optional[str]]
+    ) -> None:
+        upserts: List[Dict[str, Any]] = []
+        deleted_ids: List[int] = []
+        deleted_keys: List[str] = []
+        for user_id, changes in users.items():
+            for key, dumped in changes.items():
+                if dumped is None:
+                    deleted_ids.append(user_id)
+                    deleted_keys.append(key)
+                else:
+                    upserts.append({'user_id': user_id, 'key': key, 'value': dumped})
+        if upserts:
+            self.rows_written += await self.db.insert_rows('bot_user_data', upserts, wrap_sql=USER_DATA_UPSERT)
+        if deleted_ids:
+            self.rows_written += await self.db.execute(
+                'DELETE FROM bot_user_data WHERE (user_id, key) IN ('
+                'SELECT * FROM unnest(CAST(:ids AS bigint[]), CAST(:keys AS text[])))',
+                {'ids': deleted_ids, 'keys': deleted_keys}
+            )
+
+        states = [
+            {'name': name, 'key': key, 'state': state}
+            for (name, key), state in conversations.items() if state is not None
+        ]
+        ended = [(name, key) for (name, key), state in conversations.items() if state is None]
+        if states:
+            self.rows_written += await self.db.insert_rows('bot_conversations', states, wrap_sql=CONVERSATION_UPSERT)
+        if ended:
+            self.rows_written += await self.db.execute(
+                'DELETE FROM bot_conversations WHERE (name, key) IN ('
+                'SELECT * FROM unnest(CAST(:names AS text[]), CAST(:keys AS text[])))',
+                {'names': [name for name, _ in ended], 'keys': [key for _, key in ended]}
+            )
+
+    async def flush(self) -> None:
+        """Write everything still pending; called by Application.shutdown()."""
+        if self._write_task is not None:
+            await self._write_task
+        await self._write()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'loaded_users': len(self._loaded),
+            'dirty_users': len(self._dirty_users),
+            'loads': self.loads,
+            'evictions': self.evictions,
+            'rows_written': self.rows_written,
+        }
@@ -0,0 +1,243 @@
+import asyncio
+import logging
+import mmap
+import os
+import struct
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+from config.settings import TXN_SPOOL_COMPACT_BYTES, TXN_SPOOL_FSYNC, TXN_SPOOL_FSYNC_INTERVAL
+
+
+# Record header: payload length and CRC32 of the payload, little-endian
+HEADER = struct.Struct('<II')
+FSYNC_POLICIES = ('always', 'interval', 'never')
+# Longest record taken as the next intact one when skipping corrupt bytes, so garbage
+# lengths cannot make every candidate offset checksum megabytes
+RESYNC_MAX_LENGTH = 64 * 1024
+
+
+class CorruptRecord(ValueError):
+    def __init__(self, path: str, offset: int) -> None:
+        super().__init__(f'Spool {path}: corrupt record at offset {offset}')
+        self.offset = offset
+
+
+def _record_at(view: mmap.mmap, offset: int, size: int) -> Optional[Tuple[bytes, int]]:
+    """(payload, end offset) of the record at offset, or None if it is incomplete or corrupt."""
+    if offset + HEADER.size > size:
+        return None
+    length, crc = HEADER.unpack_from(view, offset)
+    end = offset + HEADER.size + length
+    if end > size:
+        return None
+    payload = view[offset + HEADER.size:end]
+    if zlib.crc32(payload) != crc:
+        return None
+    return payload, end
+
+
+def _next_record(view: mmap.mmap, offset: int, size: int) -> int:
+    """Offset of the first intact record after offset, or size if there is none."""
+    for start in range(offset + 1, size - HEADER.size + 1):
+        length, _ = HEADER.unpack_from(view, start)
+        if 0 < length <= RESYNC_MAX_LENGTH and _record_at(view, start, size) is not None:
+            return start
+    return size
+
+
+class Spool:
+    """
+    Append-only file of length-prefixed, checksummed records.
+
+    append_many() writes records and, with fsync='always', returns once they are on
+    disk; appends arriving while an fsync runs share the next one (group commit) and
+    the fsync itself runs in a thread. With 'interval' the file is synced every
+    fsync_interval seconds, so a crash loses at most that much; with 'never' only the
+    OS flushes it. Records are read back in order through mmap, and consume() marks
+    them done: the file is truncated once everything is consumed, or rewritten without
+    the consumed part once that exceeds compact_bytes and half the file. A torn record
+    at the end (a crash in the middle of an append) is cut off when the file is opened.
+    Corrupt bytes followed by intact records are kept: read() raises CorruptRecord when
+    it reaches them and skip_corrupt() returns them so the caller can set them aside.
+    """
+
+    COUNTERS = ('appends', 'syncs', 'compactions')
+
+    def __init__(
+        self,
+        path: str,
+        fsync: str = TXN_SPOOL_FSYNC,
+        fsync_interval: float = TXN_SPOOL_FSYNC_INTERVAL,
+        compact_bytes: int = TXN_SPOOL_COMPACT_BYTES,
+    ) -> None:
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f'Unknown spool fsync policy: {fsync}')
+        self.path = path
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+        self.compact_bytes = compact_bytes
+        self._fd: Optional[int] = None
+        # File offsets: end of the written records and start of the first unconsumed one
+        self._size = 0
+        self._consumed = 0
+        # Bytes ever written and ever synced; unlike offsets these survive truncation
+        self._written_total = 0
+        self._synced_total = 0
+        self._sync_task: Optional[asyncio.Task] = None
+        self._interval_task: Optional[asyncio.Task] = None
+        self.appends = 0
+        self.syncs = 0
+        self.compactions = 0
+
+    @property
+    def pending_bytes(self) -> int:
+        return self._size - self._consumed
+
+    def open(self) -> int:
+        """Open (or create) the file; returns the number of records left from a previous run."""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT | os.O_APPEND, 0o600)
+        size = os.fstat(self._fd).st_size
+        records = 0
+        end = 0
+        if size:
+            with mmap.mmap(self._fd, size, access=mmap.ACCESS_READ) as view:
+                while end < size:
+                    record = _record_at(view, end, size)
+                    if record is not None:
+                        end = record[1]
+                        records += 1
+                        continue
+                    resume = _next_record(view, end, size)
+                    if resume == size:
+                        break
+                    logging.warning(f'Spool {self.path}: {resume - end} corrupt bytes at offset {end}')
+                    end = resume
+        if end < size:
+            logging.warning(f'Spool {self.path}: cutting off {size - end} bytes of an incomplete record')
+            os.ftruncate(self._fd, end)
+        self._size = end
+        self._consumed = 0
+        if self.fsync == 'interval':
+            self._interval_task = asyncio.get_running_loop().create_task(self._run_periodic_sync())
+        return records
+
+    async def append_many(self, payloads: List[bytes]) -> None:
+        data = b''.join(HEADER.pack(len(p), zlib.crc32(p)) + p for p in payloads)
+        view = memoryview(data)
+        try:
+            while view:
+                written = os.write(self._fd, view)
+                view = view[written:]
+        except OSError:
+            # Drop a partly written record (e.g. disk full) so later appends stay readable
+            os.ftruncate(self._fd, self._size)
+            raise
+        self._size += len(data)
+        self._written_total += len(data)
+        self.appends += len(payloads)
+        if self.fsync == 'always':
+            await self._sync_to(self._written_total)
+
+    async def _sync_to(self, target: int) -> None:
+        while self._synced_total < target:
+            if self._sync_task is None:
+                self._sync_task = asyncio.get_running_loop().create_task(self._sync())
+            # A cancelled waiter must not cancel the fsync others are waiting for
+            await asyncio.shield(self._sync_task)
+
+    async def _sync(self) -> None:
+        target = self._written_total
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, os.fsync, self._fd)
+            self._synced_total = max(self._synced_total, target)
+            self.syncs += 1
+        finally:
+            self._sync_task = None
+
+    async def _run_periodic_sync(self) -> None:
+        while True:
+            await asyncio.sleep(self.fsync_interval)
+            try:
+                await self._sync_to(self._written_total)
+            except Exception as e:
+                logging.error(f'Error syncing spool {self.path}: {e}')
+
+    def read(self, limit: int) -> Tuple[List[bytes], int]:
+        """Up to limit unconsumed records and the offset to pass to consume() once they are done."""
+        offset = self._consumed
+        if offset >= self._size:
+            return [], offset
+        payloads = []
+        with mmap.mmap(self._fd, self._size, access=mmap.ACCESS_READ) as view:
+            while offset < self._size and len(payloads) < limit:
+                record = _record_at(view, offset, self._size)
+                if record is None:
+                    if payloads:
+                        break
+                    raise CorruptRecord(self.path, offset)
+                payload, offset = record
+                payloads.append(payload)
+        return payloads, offset
+
+    def skip_corrupt(self) -> Tuple[bytes, int]:
+        """
+        After read() raised CorruptRecord: the corrupt bytes up to the next intact record and
+        the offset to pass to consume() to skip them.
+        """
+        with mmap.mmap(self._fd, self._size, access=mmap.ACCESS_READ) as view:
+            end = _next_record(view, self._consumed, self._size)
+            return view[self._consumed:end], end
+
+    def consume(self, offset: int) -> None:
+        self._consumed = offset
+        # Offsets move when the file shrinks, so never while an fsync holds the descriptor
+        if self._sync_task is not None:
+            return
+        if self._consumed == self._size:
+            os.ftruncate(self._fd, 0)
+            self._size = self._consumed = 0
+        elif self._consumed >= self.compact_bytes and self._consumed >= self._size - self._consumed:
+            # At least half of the file is consumed, so copying the rest stays linear overall
+            self._compact()
+
+    def _compact(self) -> None:
+        """Rewrite the file without its consumed part and swap it in."""
+        tmp_path = self.path + '.tmp'
+        remaining = os.pread(self._fd, self._size - self._consumed, self._consumed)
+        tmp_fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        try:
+            view = memoryview(remaining)
+            while view:
+                view = view[os.write(tmp_fd, view):]
+            os.fsync(tmp_fd)
+        finally:
+            os.close(tmp_fd)
+        os.replace(tmp_path, self.path)
+        os.close(self._fd)
+        self._fd = os.open(self.path, os.O_RDWR | os.O_APPEND)
+        self._size = len(remaining)
+        self._consumed = 0
+        self.compactions += 1
+
+    async def close(self) -> None:
+        if self._interval_task is not None:
+            self._interval_task.cancel()
+        if self._fd is None:
+            return
+        if self.fsync != 'never':
+            await self._sync_to(self._written_total)
+        os.close(self._fd)
+        self._fd = None
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'size_bytes': self._size,
+            'pending_bytes': self.pending_bytes,
+            'appends': self.appends,
+            'syncs': self.syncs,
+            'compactions': self.compactions,
+        }
@@ -0,0 +1,80 @@
+import csv
+import os
+from typing import Any, Dict, Iterable, Iterator, List
+
+# Bytes inspected to guess the encoding and the delimiter of a CSV file
+SNIFF_BYTES = 64 * 1024
+CSV_ENCODINGS = ('utf-8-sig', 'cp1251')
+CSV_DELIMITERS = ',;\t|'
+
+SUPPORTED_EXTENSIONS = ('.csv', '.xlsx')
+
+
+def _detect_csv_format(path: str):
+    with open(path, 'rb') as f:
+        sample = f.read(SNIFF_BYTES)
+    # Drop a possibly truncated last line so a multi-byte character is never cut in half
+    if len(sample) == SNIFF_BYTES and b'\n' in sample:
+        sample = sample[:sample.rindex(b'\n')]
+
+    for encoding in CSV_ENCODINGS:
+        try:
+            text = sample.decode(encoding)
+            break
+        except UnicodeDecodeError:
+            continue
+    else:
+        raise ValueError('Unsupported file encoding, please upload a UTF-8 CSV file')
+
+    try:
+        dialect = csv.Sniffer().sniff(text, delimiters=CSV_DELIMITERS)
+    except csv.Error:
+        dialect = csv.excel
+    return encoding, dialect
+
+
+def iter_csv_rows(path: str) -> Iterator[Dict[str, Any]]:
+    encoding, dialect = _detect_csv_format(path)
+    with open(path, newline='', encoding=encoding) as f:
+        for row in csv.DictReader(f, dialect=dialect):
+            yield row
+
+
+def iter_xlsx_rows(path: str) -> Iterator[Dict[str, Any]]:
+    import openpyxl
+
+    # read_only streams rows from the sheet XML instead of loading the whole workbook
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        names = [str(name).strip() if name is not None else '' for name in header]
+        for values in rows:
+            if values is None or all(v is None for v in values):
+                continue
+            yield dict(zip(names, values))
+    finally:
+        workbook.close()
+
+
+def iter_statement_rows(path: str) -> Iterator[Dict[str, Any]]:
+    """Stream rows of a CSV/XLSX statement as {column header: value} dicts."""
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.csv':
+        return iter_csv_rows(path)
+    if extension == '.xlsx':
+        return iter_xlsx_rows(path)
+    raise ValueError(f'Unsupported file type: {extension or "unknown"}')
+
+
+def chunked(rows: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
@@ -0,0 +1,64 @@
+import asyncio
+from typing import Any, Awaitable, Dict, Hashable, Optional
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """
+    Processes updates of different users concurrently (up to max_concurrent_updates)
+    while updates of the same user run strictly one after another, in arrival order.
+    That keeps ConversationHandler state and per-user inserts race-free.
+    """
+
+    def __init__(self, max_concurrent_updates: int) -> None:
+        super().__init__(max_concurrent_updates)
+        # key -> [lock, number of updates holding or waiting for it]
+        self._locks: Dict[Hashable, list] = {}
+
+    @staticmethod
+    def _ordering_key(update: object) -> Optional[Hashable]:
+        if isinstance(update, Update):
+            if update.effective_user is not None:
+                return 'user', update.effective_user.id
+            if update.effective_chat is not None:
+                return 'chat', update.effective_chat.id
+        return None
+
+    async def process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        key = self._ordering_key(update)
+        if key is None:
+            await super().process_update(update, coroutine)
+            return
+
+        entry = self._locks.get(key)
+        if entry is None:
+            entry = self._locks[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            # Take the user's lock before a global slot, so a user with a backlog
+            # waits on their own queue instead of holding slots other users need
+            async with entry[0]:
+                await super().process_update(update, coroutine)
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._locks[key]
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        await coroutine
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    def is_active(self, key: Hashable) -> bool:
+        """Whether an update with this ordering key (e.g. ('user', user_id)) is being handled or waiting."""
+        return key in self._locks
+
+    @property
+    def active_keys(self) -> int:
+        return len(self._locks)
@@ -0,0 +1,132 @@
+import asyncio
+import concurrent.futures
+import logging
+from typing import Any, Callable, Dict, List, Optional, Set
+
+from config.settings import (
+    PARSER_POOL_KIND,
+    PARSER_POOL_WORKERS,
+    PARSER_POOL_MAX_PENDING,
+    PARSER_POOL_TIMEOUT,
+)
+
+
+def _noop() -> None:
+    pass
+
+
+class WorkerPoolBusy(Exception):
+    """Raised when the pool already has max_pending jobs queued or running, or every worker is stuck."""
+
+
+class WorkerPool:
+    """
+    Bounded process/thread pool for CPU-bound work called from handlers.
+    Jobs beyond max_pending are rejected instead of queueing without limit,
+    and the caller stops waiting for a job after timeout seconds. A job that
+    already started cannot be stopped, so it stays pending and keeps its worker
+    until it finishes; while every worker is held by such a job new work is
+    rejected, as it could only queue up behind them.
+    """
+
+    COUNTERS = ('completed', 'failed', 'timeouts', 'rejected')
+
+    def __init__(
+        self,
+        kind: str = PARSER_POOL_KIND,
+        max_workers: int = PARSER_POOL_WORKERS,
+        max_pending: int = PARSER_POOL_MAX_PENDING,
+        timeout: float = PARSER_POOL_TIMEOUT,
+        initializer: Optional[Callable[[], None]] = None,
+    ) -> None:
+        if kind not in ('process', 'thread'):
+            raise ValueError(f'Unknown worker pool kind: {kind}')
+        self.kind = kind
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.initializer = initializer
+        self._executor: Optional[concurrent.futures.Executor] = None
+        self.pending = 0
+        # Jobs that outlived their timeout and still hold a worker
+        self._abandoned: Set[concurrent.futures.Future] = set()
+        self.peak_pending = 0
+        self.completed = 0
+        self.failed = 0
+        self.timeouts = 0
+        self.rejected = 0
+
+    def _get_executor(self) -> concurrent.futures.Executor:
+        if self._executor is None:
+            if self.kind == 'process':
+                self._executor = concurrent.futures.ProcessPoolExecutor(
+                    max_workers=self.max_workers, initializer=self.initializer
+                )
+            else:
+                self._executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix='worker-pool', initializer=self.initializer
+                )
+        return self._executor
+
+    def start(self) -> List[concurrent.futures.Future]:
+        """
+        Spawn every worker now so the initializer cost is not paid by the first job.
+        The returned futures complete once the workers have run their initializer.
+        """
+        executor = self._get_executor()
+        return [executor.submit(_noop) for _ in range(self.max_workers)]
+
+    async def run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        if self.pending >= self.max_pending or len(self._abandoned) >= self.max_workers:
+            self.rejected += 1
+            raise WorkerPoolBusy(f'{self.pending} jobs already pending, {len(self._abandoned)} past their timeout')
+
+        loop = asyncio.get_running_loop()
+        job = self._get_executor().submit(fn, *args)
+        self.pending += 1
+        self.peak_pending = max(self.peak_pending, self.pending)
+        # Counted until the job itself is done, not until the caller stops waiting for it
+        job.add_done_callback(lambda done: self._call_soon(loop, self._job_done, done))
+        try:
+            result = await asyncio.wait_for(asyncio.wrap_future(job), self.timeout)
+            self.completed += 1
+            return result
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            # A job still queued is cancelled with the wait; a running one is not
+            if job.running():
+                self._abandoned.add(job)
+            raise
+        except Exception:
+            self.failed += 1
+            raise
+
+    @staticmethod
+    def _call_soon(loop: asyncio.AbstractEventLoop, callback: Callable[..., None], *args: Any) -> None:
+        """Run callback on loop, from whichever thread the executor completes jobs in."""
+        try:
+            loop.call_soon_threadsafe(callback, *args)
+        except RuntimeError:
+            # Loop already closed at shutdown, nothing left to count for
+            pass
+
+    def _job_done(self, job: concurrent.futures.Future) -> None:
+        self.pending -= 1
+        self._abandoned.discard(job)
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+            logging.info(f'Worker pool shut down: {self.stats()}')
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'pending': self.pending,
+            'abandoned': len(self._abandoned),
+            'peak_pending': self.peak_pending,
+            'completed': self.completed,
+            'failed': self.failed,
+            'timeouts': self.timeouts,
+            'rejected': self.rejected,
+        }
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The bot's modules import each other from telegram-bot/src, as when main.py runs there
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
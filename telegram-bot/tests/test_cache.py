@@ -0,0 +1,101 @@
+import asyncio
+
+import pytest
+
+from models.user_repository import UserRepository
+from utils import cache as cache_module
+from utils.cache import TTLCache
+
+
+class Clock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache_module, 'time', clock)
+    return clock
+
+
+def test_hit_and_miss(clock):
+    cache = TTLCache(maxsize=10, ttl=60)
+    cache.set('alice', {'user_uuid': 1})
+    assert cache.get('alice') == (True, {'user_uuid': 1})
+    assert cache.get('bob') == (False, None)
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_entries_expire_after_ttl(clock):
+    cache = TTLCache(maxsize=10, ttl=60)
+    cache.set('alice', 1)
+    clock.now += 59
+    assert cache.get('alice') == (True, 1)
+    clock.now += 2
+    assert cache.get('alice') == (False, None)
+    assert len(cache) == 0
+
+
+def test_negative_results_use_their_own_ttl(clock):
+    cache = TTLCache(maxsize=10, ttl=60, negative_ttl=5)
+    cache.set('nobody', None)
+    assert cache.get('nobody') == (True, None)
+    clock.now += 6
+    assert cache.get('nobody') == (False, None)
+
+
+def test_zero_negative_ttl_does_not_cache_misses(clock):
+    cache = TTLCache(maxsize=10, ttl=60, negative_ttl=0)
+    cache.set('nobody', None)
+    assert len(cache) == 0
+
+
+def test_least_recently_used_entry_is_evicted(clock):
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')
+    cache.set('c', 3)
+    assert cache.get('b') == (False, None)
+    assert cache.get('a') == (True, 1)
+    assert cache.get('c') == (True, 3)
+    assert cache.evictions == 1
+
+
+def test_invalidate_and_stats(clock):
+    cache = TTLCache(maxsize=10, ttl=60)
+    cache.set('a', 1)
+    cache.get('a')
+    cache.invalidate('a')
+    cache.get('a')
+    assert cache.stats() == {'size': 0, 'hits': 1, 'misses': 1, 'evictions': 0, 'hit_ratio': 0.5}
+
+
+def test_user_repository_reads_again_after_invalidate(clock):
+    class FakeDb:
+        def __init__(self) -> None:
+            self.row = {'user_uuid': 1, 'default_currency_code': 'USD'}
+            self.reads = 0
+
+        async def fetch_one(self, sql, params):
+            self.reads += 1
+            return dict(self.row)
+
+    db = FakeDb()
+    repo = UserRepository(db, cache=TTLCache(maxsize=10, ttl=60))
+
+    async def run():
+        first = await repo.get_by_telegram('alice')
+        db.row['default_currency_code'] = 'EUR'
+        cached = await repo.get_by_telegram('alice')
+        repo.invalidate('alice')
+        return first, cached, await repo.get_by_telegram('alice')
+
+    first, cached, fresh = asyncio.run(run())
+    assert cached['default_currency_code'] == 'USD'
+    assert fresh['default_currency_code'] == 'EUR'
+    assert db.reads == 2
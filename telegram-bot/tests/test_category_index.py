@@ -0,0 +1,88 @@
+import asyncio
+
+from models.category_index import CategoryIndex, CategoryService, CategoryTrie, category_key, is_typo
+
+
+def test_category_key_ignores_case_and_spacing():
+    assert category_key('  Eating   Out ') == 'eating out'
+    assert category_key('STRASSE') == category_key('straße')
+
+
+def test_is_typo_accepts_single_edits_only():
+    assert is_typo('food', 'fod')        # deletion
+    assert is_typo('food', 'foods')      # insertion
+    assert is_typo('food', 'fold')       # substitution
+    assert is_typo('food', 'fodo')       # adjacent swap
+    assert not is_typo('food', 'food')
+    assert not is_typo('food', 'fd')
+    assert not is_typo('food', 'doof')
+
+
+def test_trie_completes_prefixes():
+    trie = CategoryTrie()
+    for key in ('taxi', 'tax', 'travel', 'food'):
+        trie.add(key)
+    assert sorted(trie.complete('ta')) == ['tax', 'taxi']
+    assert trie.complete('x') == []
+    assert len(trie.complete('t', limit=2)) == 2
+
+
+def test_resolve_returns_the_most_used_spelling():
+    index = CategoryIndex()
+    index.add('Groceries', 5)
+    index.add('groceries', 2)
+    assert index.resolve('GROCERIES') == 'Groceries'
+    assert index.resolve('rent') is None
+    assert len(index) == 1
+
+
+def test_suggest_ranks_typos_before_completions_then_by_use():
+    index = CategoryIndex()
+    index.add('Food', 3)
+    index.add('Fuel', 1)
+    index.add('Foodstuff', 10)
+    index.add('Ford', 7)
+    # Both one edit away, the more used first
+    assert index.suggest('fod') == ['Ford', 'Food']
+    # The typo match ranks above the more used completion
+    assert index.suggest('foo') == ['Food', 'Foodstuff']
+    assert index.suggest('fuels') == ['Fuel']
+
+
+def test_suggest_respects_the_limit():
+    index = CategoryIndex()
+    for category in ('tax', 'taxi', 'tart', 'tank'):
+        index.add(category)
+    assert len(index.suggest('ta', limit=2)) == 2
+
+
+class FakeReportRepo:
+    def __init__(self, rows):
+        self.rows = rows
+        self.loads = 0
+
+    async def categories(self, user_uuid):
+        self.loads += 1
+        return self.rows
+
+
+def test_service_loads_once_records_and_invalidates():
+    repo = FakeReportRepo([{'category': 'Food', 'txn_count': 4}, {'category': None, 'txn_count': 1}])
+    service = CategoryService(repo)
+
+    async def run():
+        first = await service.normalize('u1', 'food')
+        second = await service.normalize('u1', 'Fod')
+        service.record('u1', ['Rent', None])
+        third = await service.normalize('u1', 'rent')
+        service.invalidate('u1')
+        fourth = await service.normalize('u1', 'rent')
+        return first, second, third, fourth
+
+    first, second, third, fourth = asyncio.run(run())
+    assert first == ('Food', [])
+    assert second == ('Fod', ['Food'])
+    assert third == ('Rent', [])
+    # Reloaded from the repository, which does not know Rent yet
+    assert fourth == ('rent', [])
+    assert repo.loads == 2
@@ -0,0 +1,50 @@
+import datetime
+
+from models.expectation_service import ExpectationIndex, ExpectedTransaction
+from models.transaction import Transaction
+
+
+DUE = datetime.datetime(2025, 1, 10)
+
+
+def _expected(category: str, recurring_uuid: str = 'r1', due: datetime.datetime = DUE) -> ExpectedTransaction:
+    return ExpectedTransaction(
+        expected_transaction_uuid=f'{recurring_uuid}-{due.date()}',
+        user_uuid='u',
+        category=category,
+        lcl_dttm=due,
+        amount_lcy=100.0,
+        currency_code='EUR',
+        recurring_uuid=recurring_uuid,
+        match_window_days=3,
+        amount_tolerance=0.1,
+    )
+
+
+def _transaction(category: str, day: int = 11, amount: float = 95.0) -> Transaction:
+    return Transaction(
+        user_uuid='u', category=category, lcl_dttm=datetime.datetime(2025, 1, day),
+        amount_lcy=amount, currency_code='EUR',
+    )
+
+
+def test_transactions_match_expectations_across_category_spellings():
+    index = ExpectationIndex()
+    index.add([_expected('Gym  Membership')])
+    assert index.claim(_transaction('gym membership')) is not None
+    assert len(index) == 0
+
+
+def test_only_transactions_within_window_and_tolerance_match():
+    index = ExpectationIndex()
+    index.add([_expected('Rent')])
+    assert index.claim(_transaction('Rent', day=20)) is None
+    assert index.claim(_transaction('Rent', amount=150.0)) is None
+    assert index.claim(_transaction('Rent')).recurring_uuid == 'r1'
+
+
+def test_remove_rule_drops_all_its_occurrences():
+    index = ExpectationIndex()
+    index.add([_expected('Rent'), _expected('Rent', due=DUE + datetime.timedelta(days=31)), _expected('Rent', 'r2')])
+    assert index.remove_rule('u', 'r1') == 2
+    assert len(index) == 1
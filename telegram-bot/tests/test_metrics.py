@@ -0,0 +1,42 @@
+import asyncio
+import threading
+
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+from utils.metrics import StatsCollector
+
+
+def test_counter_keys_are_exported_as_counters_and_the_rest_as_gauges():
+    collector = StatsCollector()
+    collector.add('pool', lambda: {'completed': 5, 'pending': 2, 'name': 'x', 'busy': True}, counters=('completed',))
+    metrics = {metric.name: metric for metric in collector.collect()}
+    # prometheus_client strips the _total suffix from counter family names
+    assert isinstance(metrics['bot_pool_completed'], CounterMetricFamily)
+    assert isinstance(metrics['bot_pool_pending'], GaugeMetricFamily)
+    assert sorted(metrics) == ['bot_pool_completed', 'bot_pool_pending']
+
+
+def test_failing_sources_are_skipped():
+    collector = StatsCollector()
+    collector.add('broken', lambda: 1 / 0)
+    collector.add('pool', lambda: {'pending': 2})
+    assert [metric.name for metric in collector.collect()] == ['bot_pool_pending']
+
+
+def test_scrapes_from_another_thread_read_the_stats_on_the_loop():
+    collector = StatsCollector()
+    threads = []
+
+    def stats():
+        threads.append(threading.current_thread())
+        return {'pending': 1}
+
+    collector.add('pool', stats)
+
+    async def run():
+        collector.bind(asyncio.get_running_loop())
+        return await asyncio.get_running_loop().run_in_executor(None, lambda: list(collector.collect()))
+
+    metrics = asyncio.run(run())
+    assert [metric.name for metric in metrics] == ['bot_pool_pending']
+    assert threads == [threading.main_thread()]
@@ -0,0 +1,173 @@
+import asyncio
+import pathlib
+from typing import Any, Dict, List, Tuple
+
+import httpx
+from telegram.error import BadRequest, NetworkError, TimedOut
+
+from utils.outbox import Outbox, TokenBucket
+
+
+def _error(error: Exception, cause: Exception) -> Exception:
+    """An error as PTB's HTTPXRequest raises it, chained to the httpx error."""
+    error.__cause__ = cause
+    return error
+
+
+class FakeBot:
+    """Records the Bot API calls made; errors queued in fail are raised by the next calls."""
+
+    def __init__(self) -> None:
+        self.calls: List[Tuple[str, Dict[str, Any]]] = []
+        self.fail: List[Exception] = []
+
+    async def _call(self, method: str, kwargs: Dict[str, Any]) -> str:
+        self.calls.append((method, kwargs))
+        if self.fail:
+            raise self.fail.pop(0)
+        return f'{method} #{len(self.calls)}'
+
+    async def send_message(self, **kwargs: Any) -> str:
+        return await self._call('send_message', kwargs)
+
+    async def edit_message_text(self, **kwargs: Any) -> str:
+        return await self._call('edit_message_text', kwargs)
+
+    async def edit_message_reply_markup(self, **kwargs: Any) -> str:
+        return await self._call('edit_message_reply_markup', kwargs)
+
+    async def send_document(self, **kwargs: Any) -> str:
+        return await self._call('send_document', kwargs)
+
+
+def _outbox(bot: FakeBot, **kwargs: Any) -> Outbox:
+    return Outbox(bot, global_rate=1000, chat_rate=1000, chat_burst=10, coalesce=True, **kwargs)
+
+
+def test_token_bucket_refills_at_its_rate():
+    bucket = TokenBucket(rate=2, burst=2, now=0)
+    bucket.take(0)
+    bucket.take(0)
+    assert bucket.wait_time(0) == 0.5
+    assert bucket.wait_time(0.5) == 0
+    assert not bucket.is_full(0.5)
+    assert bucket.is_full(10)
+    assert bucket.tokens == 2
+
+
+def test_confirmations_waiting_for_the_same_chat_are_merged():
+    bot = FakeBot()
+    outbox = _outbox(bot)
+
+    async def run():
+        outbox.start()
+        futures = [outbox.send(1, text, coalesce=True) for text in ('one', 'two', 'three')]
+        results = await asyncio.gather(*futures)
+        await outbox.close()
+        return results
+
+    results = asyncio.run(run())
+    assert bot.calls == [('send_message', {'chat_id': 1, 'text': 'one\n\ntwo\n\nthree'})]
+    assert results == ['send_message #1'] * 3
+    assert outbox.coalesced == 2
+
+
+def test_messages_with_a_keyboard_are_not_merged():
+    bot = FakeBot()
+    outbox = _outbox(bot)
+
+    async def run():
+        outbox.start()
+        await asyncio.gather(
+            outbox.send(1, 'one', coalesce=True),
+            outbox.send(1, 'two', coalesce=True, reply_markup='keyboard'),
+        )
+        await outbox.close()
+
+    asyncio.run(run())
+    assert [kwargs['text'] for _, kwargs in bot.calls] == ['one', 'two']
+    assert outbox.coalesced == 0
+
+
+def test_requests_that_never_left_are_retried():
+    bot = FakeBot()
+    bot.fail = [_error(NetworkError('connect failed'), httpx.ConnectError('refused'))]
+    outbox = _outbox(bot)
+
+    async def run():
+        outbox.start()
+        message = await outbox.send(1, 'hello')
+        await outbox.close()
+        return message
+
+    assert asyncio.run(run()) == 'send_message #2'
+    assert outbox.retries == 1
+
+
+def test_timed_out_requests_are_not_retried():
+    bot = FakeBot()
+    bot.fail = [_error(TimedOut('read timed out'), httpx.ReadTimeout('timed out'))]
+    outbox = _outbox(bot)
+
+    async def run():
+        outbox.start()
+        message = await outbox.send(1, 'hello')
+        await outbox.close()
+        return message
+
+    assert asyncio.run(run()) is None
+    assert len(bot.calls) == 1
+    assert (outbox.retries, outbox.dropped) == (0, 1)
+
+
+def test_unsent_requests_are_dropped_after_max_retries():
+    bot = FakeBot()
+    bot.fail = [_error(NetworkError('pool'), httpx.PoolTimeout('pool')) for _ in range(2)]
+    outbox = _outbox(bot, max_retries=1)
+
+    async def run():
+        outbox.start()
+        message = await outbox.send(1, 'hello')
+        await outbox.close()
+        return message
+
+    assert asyncio.run(run()) is None
+    assert len(bot.calls) == 2
+    assert (outbox.retries, outbox.dropped) == (1, 1)
+
+
+def test_edits_and_documents_go_through_the_queue():
+    bot = FakeBot()
+    outbox = _outbox(bot)
+    path = pathlib.Path('export.csv')
+
+    async def run():
+        outbox.start()
+        await asyncio.gather(
+            outbox.edit_text(1, 10, 'edited'),
+            outbox.edit_reply_markup(1, 10),
+            outbox.send_document(1, path, filename='export.csv', caption=None),
+        )
+        await outbox.close()
+
+    asyncio.run(run())
+    assert bot.calls == [
+        ('edit_message_text', {'chat_id': 1, 'message_id': 10, 'text': 'edited'}),
+        ('edit_message_reply_markup', {'chat_id': 1, 'message_id': 10}),
+        ('send_document', {'chat_id': 1, 'document': path, 'filename': 'export.csv'}),
+    ]
+    assert outbox.sent == 3
+
+
+def test_messages_sent_without_the_dispatcher_return_none_on_error():
+    bot = FakeBot()
+    bot.fail = [BadRequest('chat not found')]
+    outbox = _outbox(bot)
+
+    async def run():
+        failed = await outbox.send(1, 'hello')
+        sent = await outbox.send(1, 'hello again')
+        return failed, sent
+
+    assert asyncio.run(run()) == (None, 'send_message #2')
+    assert (outbox.sent, outbox.dropped) == (1, 1)
@@ -0,0 +1,196 @@
+import asyncio
+import datetime
+import json
+from typing import Any, Dict, List, Optional
+
+from telegram import Chat, Message, Update, User
+
+from utils.persistence import PostgresPersistence
+from utils.update_processor import PerUserUpdateProcessor
+
+
+class FakeDb:
+    """bot_user_data rows in a dict; records every statement's kind."""
+
+    def __init__(self, stored: Optional[Dict[int, Dict[str, Any]]] = None) -> None:
+        self.stored = {user_id: {k: json.dumps(v) for k, v in data.items()} for user_id, data in (stored or {}).items()}
+        self.calls: List[str] = []
+
+    async def fetch_all(self, query: str, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+        self.calls.append('select')
+        return [{'key': k, 'value': v} for k, v in self.stored.get(params['u'], {}).items()]
+
+    async def insert_rows(self, table: str, rows: List[Dict[str, Any]], wrap_sql: str = None) -> int:
+        self.calls.append(f'upsert {table}')
+        for row in rows:
+            self.stored.setdefault(row['user_id'], {})[row['key']] = row['value']
+        return len(rows)
+
+    async def execute(self, query: str, params: Dict[str, Any]) -> int:
+        self.calls.append('delete')
+        if 'ids' in params:
+            for user_id, key in zip(params['ids'], params['keys']):
+                self.stored.get(user_id, {}).pop(key, None)
+            return len(params['ids'])
+        return len(self.stored.pop(params['u'], {}))
+
+
+class FakeApplication:
+    def __init__(self) -> None:
+        self.update_processor = PerUserUpdateProcessor(8)
+        self.dropped: List[int] = []
+        self.marked: List[int] = []
+
+    def drop_user_data(self, user_id: int) -> None:
+        self.dropped.append(user_id)
+
+    def mark_data_for_update_persistence(self, chat_ids=None, user_ids=None) -> None:
+        self.marked.append(user_ids)
+
+
+def _persistence(db: FakeDb, max_loaded_users: int = 10) -> PostgresPersistence:
+    persistence = PostgresPersistence(db, update_interval=60, max_loaded_users=max_loaded_users)
+    persistence.application = FakeApplication()
+    return persistence
+
+
+async def _visit(persistence: PostgresPersistence, user_id: int, data: Dict[str, Any]) -> None:
+    """One handled update: the data is loaded, then handed back by the Application."""
+    await persistence.refresh_user_data(user_id, data)
+    await persistence.update_user_data(user_id, dict(data))
+
+
+def test_user_data_is_loaded_on_first_use():
+    db = FakeDb({1: {'import_dedupe': True}})
+    persistence = _persistence(db)
+
+    async def run():
+        data = {}
+        await persistence.refresh_user_data(1, data)
+        await persistence.refresh_user_data(1, data)
+        return data
+
+    assert asyncio.run(run()) == {'import_dedupe': True}
+    assert db.calls == ['select']
+
+
+def test_only_changed_keys_are_written():
+    db = FakeDb({1: {'a': 1, 'b': 2}})
+    persistence = _persistence(db)
+
+    async def run():
+        data = {}
+        await persistence.refresh_user_data(1, data)
+        await persistence.update_user_data(1, {'a': 1, 'c': 3})
+        await persistence.flush()
+
+    asyncio.run(run())
+    assert db.stored[1] == {'a': '1', 'c': '3'}
+    assert persistence.stats()['rows_written'] == 2
+
+
+def test_least_recently_seen_idle_user_is_evicted_through_the_application():
+    db = FakeDb()
+    persistence = _persistence(db, max_loaded_users=2)
+
+    async def run():
+        await _visit(persistence, 1, {})
+        await _visit(persistence, 2, {})
+        await _visit(persistence, 3, {})
+
+    asyncio.run(run())
+    assert persistence.application.dropped == [1]
+    assert persistence.stats()['loaded_users'] == 2
+
+
+def test_users_not_handed_back_yet_are_kept():
+    db = FakeDb()
+    persistence = _persistence(db, max_loaded_users=1)
+
+    async def run():
+        await persistence.refresh_user_data(1, {})
+        await persistence.refresh_user_data(2, {})
+        assert persistence.application.dropped == []
+        await persistence.update_user_data(1, {})
+        await persistence.refresh_user_data(3, {})
+
+    asyncio.run(run())
+    assert persistence.application.dropped == [1]
+
+
+def test_users_with_an_update_in_flight_are_kept():
+    db = FakeDb()
+    persistence = _persistence(db, max_loaded_users=1)
+    processor = persistence.application.update_processor
+    message = Message(1, datetime.datetime.now(), Chat(1, Chat.PRIVATE), from_user=User(1, 'user', False))
+
+    async def run():
+        await _visit(persistence, 1, {})
+        release = asyncio.Event()
+        in_flight = asyncio.ensure_future(processor.process_update(Update(1, message=message), release.wait()))
+        await asyncio.sleep(0)
+        await _visit(persistence, 2, {})
+        assert persistence.application.dropped == []
+        release.set()
+        await in_flight
+        await _visit(persistence, 3, {})
+
+    asyncio.run(run())
+    assert persistence.application.dropped == [1, 2]
+
+
+def test_users_with_unwritten_changes_are_kept():
+    db = FakeDb()
+    persistence = _persistence(db, max_loaded_users=1)
+
+    async def run():
+        await _visit(persistence, 1, {'k': 'v'})
+        # The write task has not run yet
+        await _visit(persistence, 2, {})
+        assert persistence.application.dropped == []
+        await persistence.flush()
+        await _visit(persistence, 3, {})
+
+    asyncio.run(run())
+    assert persistence.application.dropped == [1, 2]
+
+
+def test_eviction_keeps_the_stored_rows():
+    db = FakeDb({1: {'k': 'v'}})
+    persistence = _persistence(db, max_loaded_users=1)
+
+    async def run():
+        await _visit(persistence, 1, {})
+        await _visit(persistence, 2, {})
+        # The Application's next persistence run reports the drop it was asked for
+        await persistence.drop_user_data(1)
+
+    asyncio.run(run())
+    assert db.stored[1] == {'k': '"v"'}
+    assert 'delete' not in db.calls
+
+
+def test_user_back_before_the_drop_is_marked_for_the_next_update():
+    db = FakeDb()
+    persistence = _persistence(db, max_loaded_users=1)
+
+    async def run():
+        await _visit(persistence, 1, {})
+        await _visit(persistence, 2, {})
+        await persistence.refresh_user_data(1, {'k': 'v'})
+        await persistence.drop_user_data(1)
+
+    asyncio.run(run())
+    assert persistence.application.marked == [1]
+
+
+def test_drop_user_data_deletes_stored_rows():
+    db = FakeDb({1: {'k': 'v'}})
+    persistence = _persistence(db)
+
+    async def run():
+        await _visit(persistence, 1, {})
+        await persistence.drop_user_data(1)
+
+    asyncio.run(run())
+    assert 1 not in db.stored
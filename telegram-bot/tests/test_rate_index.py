@@ -0,0 +1,107 @@
+import asyncio
+import datetime
+import math
+
+import numpy as np
+
+from models.rate_service import RateIndex, RateService
+
+
+D = datetime.datetime
+
+
+def _at(*days: int) -> np.ndarray:
+    return np.array([D(2024, 1, day) for day in days], dtype='datetime64[us]')
+
+
+def test_lookup_finds_the_interval_in_force():
+    index = RateIndex()
+    index.add([
+        ('USD', 'EUR', D(2024, 1, 1), D(2024, 1, 10), 0.9),
+        ('USD', 'EUR', D(2024, 1, 10), None, 0.8),
+    ])
+    assert index.factors('USD', 'EUR', _at(1, 9, 10, 31)).tolist() == [0.9, 0.9, 0.8, 0.8]
+
+
+def test_timestamps_outside_every_interval_are_nan():
+    index = RateIndex()
+    index.add([('USD', 'EUR', D(2024, 1, 5), D(2024, 1, 10), 0.9)])
+    before, inside, after = index.factors('USD', 'EUR', _at(4, 5, 10)).tolist()
+    assert math.isnan(before) and inside == 0.9 and math.isnan(after)
+
+
+def test_later_interval_closes_the_open_one():
+    index = RateIndex()
+    index.add([('USD', 'EUR', D(2024, 1, 1), None, 0.9)])
+    index.add([('USD', 'EUR', D(2024, 1, 15), None, 0.8)])
+    assert index.factors('USD', 'EUR', _at(14, 15)).tolist() == [0.9, 0.8]
+    assert len(index) == 2
+
+
+def test_same_start_replaces_the_interval():
+    index = RateIndex()
+    index.add([('USD', 'EUR', D(2024, 1, 1), None, 0.9)])
+    index.add([('USD', 'EUR', D(2024, 1, 1), None, 0.95)])
+    assert index.factors('USD', 'EUR', _at(2)).tolist() == [0.95]
+    assert len(index) == 1
+
+
+def test_inverse_pair_and_same_currency():
+    index = RateIndex()
+    index.add([('EUR', 'USD', D(2024, 1, 1), None, 2.0)])
+    assert index.factors('USD', 'EUR', _at(2)).tolist() == [0.5]
+    assert index.factors('GBP', 'GBP', _at(2)).tolist() == [1.0]
+    assert math.isnan(index.factors('GBP', 'USD', _at(2))[0])
+
+
+def test_convert_mixes_currencies_and_timestamps():
+    index = RateIndex()
+    index.add([
+        ('USD', 'EUR', D(2024, 1, 1), D(2024, 1, 10), 0.9),
+        ('USD', 'EUR', D(2024, 1, 10), None, 0.8),
+    ])
+    result = index.convert([10, 10, 5, 7], ['USD', 'USD', 'EUR', 'JPY'], 'EUR', _at(2, 20, 2, 2))
+    assert result[:3].tolist() == [9.0, 8.0, 5.0]
+    assert math.isnan(result[3])
+
+
+class FakeDb:
+    """currencies and exchange_rates rows; honours the refresh's utc_valid_from_dttm >= :since."""
+
+    def __init__(self) -> None:
+        self.currencies = [
+            {'currency_num_code': 840, 'currency_code': 'USD'},
+            {'currency_num_code': 978, 'currency_code': 'EUR'},
+            {'currency_num_code': 826, 'currency_code': 'GBP'},
+        ]
+        self.rates = []
+
+    def add_rate(self, from_num: int, to_num: int, valid_from: datetime.datetime, rate: float) -> None:
+        self.rates.append({
+            'from_currency_code': from_num, 'to_currency_code': to_num, 'buyrate': rate, 'sellrate': rate,
+            'utc_valid_from_dttm': valid_from, 'utc_valid_to_dttm': None,
+        })
+
+    async def fetch_all(self, sql, params=None):
+        if 'FROM currencies' in sql:
+            return self.currencies
+        since = (params or {}).get('since')
+        return [r for r in self.rates if since is None or r['utc_valid_from_dttm'] >= since]
+
+
+def test_refresh_reports_only_new_intervals():
+    db = FakeDb()
+    db.add_rate(840, 978, D(2024, 1, 1), 0.9)
+    service = RateService(db)
+
+    async def run():
+        counts = [await service.refresh(), await service.refresh()]
+        # Another pair gets a rate with the same start after the last refresh
+        db.add_rate(826, 978, D(2024, 1, 1), 1.2)
+        counts.append(await service.refresh())
+        db.add_rate(840, 978, D(2024, 1, 5), 0.8)
+        counts += [await service.refresh(), await service.refresh(), await service.refresh(full=True)]
+        return counts
+
+    assert asyncio.run(run()) == [1, 0, 1, 1, 0, 3]
+    assert service.index.convert([10], ['USD'], 'EUR', D(2024, 1, 6))[0] == 8.0
@@ -0,0 +1,345 @@
+import asyncio
+import base64
+import json
+import os
+from typing import List
+
+from models.transaction import Transaction
+from models.transaction_spool import TransactionSpool, _encode
+from utils.spool import HEADER, CorruptRecord, Spool
+
+
+def _spool(tmp_path, **kwargs) -> Spool:
+    return Spool(str(tmp_path / 'test.spool'), fsync='never', **kwargs)
+
+
+def test_records_are_read_back_in_order(tmp_path):
+    spool = _spool(tmp_path)
+
+    async def run():
+        spool.open()
+        await spool.append_many([b'one', b'two'])
+        await spool.append_many([b'three'])
+        first, offset = spool.read(2)
+        spool.consume(offset)
+        rest, _ = spool.read(10)
+        await spool.close()
+        return first, rest
+
+    assert asyncio.run(run()) == ([b'one', b'two'], [b'three'])
+
+
+def test_records_survive_reopening(tmp_path):
+    async def run():
+        spool = _spool(tmp_path)
+        spool.open()
+        await spool.append_many([b'one', b'two'])
+        await spool.close()
+        spool = _spool(tmp_path)
+        backlog = spool.open()
+        payloads, _ = spool.read(10)
+        await spool.close()
+        return backlog, payloads
+
+    assert asyncio.run(run()) == (2, [b'one', b'two'])
+
+
+def test_torn_record_is_cut_off_on_open(tmp_path):
+    path = tmp_path / 'test.spool'
+
+    async def run():
+        spool = _spool(tmp_path)
+        spool.open()
+        await spool.append_many([b'one', b'two'])
+        await spool.close()
+        with open(path, 'ab') as f:
+            f.write(HEADER.pack(100, 0) + b'partial')
+        spool = _spool(tmp_path)
+        backlog = spool.open()
+        payloads, _ = spool.read(10)
+        await spool.close()
+        return backlog, payloads
+
+    assert asyncio.run(run()) == (2, [b'one', b'two'])
+    assert os.path.getsize(path) == 2 * HEADER.size + len(b'one') + len(b'two')
+
+
+def test_corrupt_record_is_not_read(tmp_path):
+    path = tmp_path / 'test.spool'
+
+    async def run():
+        spool = _spool(tmp_path)
+        spool.open()
+        await spool.append_many([b'one', b'two'])
+        await spool.close()
+        # Flip a byte of the second payload so its checksum no longer matches
+        data = bytearray(path.read_bytes())
+        data[-1] ^= 0xFF
+        path.write_bytes(bytes(data))
+        spool = _spool(tmp_path)
+        backlog = spool.open()
+        payloads, _ = spool.read(10)
+        await spool.close()
+        return backlog, payloads
+
+    assert asyncio.run(run()) == (1, [b'one'])
+
+
+def test_corrupt_bytes_before_intact_records_are_skipped_not_cut_off(tmp_path):
+    path = tmp_path / 'test.spool'
+
+    async def run():
+        spool = _spool(tmp_path)
+        spool.open()
+        await spool.append_many([b'one', b'two', b'three'])
+        await spool.close()
+        data = bytearray(path.read_bytes())
+        data[2 * HEADER.size + len(b'one')] ^= 0xFF
+        path.write_bytes(bytes(data))
+        spool = _spool(tmp_path)
+        backlog = spool.open()
+        first, offset = spool.read(10)
+        spool.consume(offset)
+        try:
+            spool.read(10)
+        except CorruptRecord:
+            skipped, offset = spool.skip_corrupt()
+        spool.consume(offset)
+        rest, _ = spool.read(10)
+        await spool.close()
+        return backlog, first, skipped, rest
+
+    backlog, first, skipped, rest = asyncio.run(run())
+    assert (backlog, first, rest) == (2, [b'one'], [b'three'])
+    assert len(skipped) == HEADER.size + len(b'two')
+
+
+def test_file_is_truncated_once_everything_is_consumed(tmp_path):
+    spool = _spool(tmp_path)
+
+    async def run():
+        spool.open()
+        await spool.append_many([b'one', b'two'])
+        _, offset = spool.read(10)
+        spool.consume(offset)
+        size = os.path.getsize(spool.path)
+        await spool.close()
+        return size
+
+    assert asyncio.run(run()) == 0
+    assert spool.pending_bytes == 0
+
+
+def test_consumed_part_is_compacted_away(tmp_path):
+    spool = _spool(tmp_path, compact_bytes=1)
+
+    async def run():
+        spool.open()
+        await spool.append_many([b'one', b'two', b'three'])
+        _, offset = spool.read(2)
+        spool.consume(offset)
+        size = os.path.getsize(spool.path)
+        payloads, _ = spool.read(10)
+        await spool.close()
+        return size, payloads
+
+    assert asyncio.run(run()) == (HEADER.size + len(b'three'), [b'three'])
+    assert spool.compactions == 1
+
+
+class RejectedError(Exception):
+    """Stands in for a DBAPIError whose driver error carries a SQLSTATE."""
+
+    def __init__(self, sqlstate: str) -> None:
+        super().__init__(f'sqlstate {sqlstate}')
+        self.orig = type('Orig', (), {'sqlstate': sqlstate})()
+
+
+class FakeRepo:
+    """
+    Stores transactions by id; rows in category 'bad' violate a constraint and the first
+    insert of a row on its own in category 'flaky' fails like a lost connection.
+    """
+
+    def __init__(self) -> None:
+        self.stored = {}
+        self.failures = 0
+        self.flaky_failed = False
+
+    async def insert_many(self, transactions: List[Transaction], skip_existing: bool = False) -> int:
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError('database is down')
+        if len(transactions) == 1 and transactions[0].category == 'flaky' and not self.flaky_failed:
+            self.flaky_failed = True
+            raise ConnectionError('connection lost')
+        if any(t.category == 'bad' for t in transactions):
+            raise RejectedError('23514')
+        new = [t for t in transactions if t.transaction_id not in self.stored]
+        for t in new:
+            self.stored[t.transaction_id] = t
+        return len(new)
+
+
+def _transaction_spool(tmp_path, repo: FakeRepo, ack_timeout: float = 1) -> TransactionSpool:
+    return TransactionSpool(repo, _spool(tmp_path), max_delay=0, ack_timeout=ack_timeout, retry_max=0.01)
+
+
+def test_transactions_are_acknowledged_once_inserted(tmp_path):
+    repo = FakeRepo()
+    spool = _transaction_spool(tmp_path, repo)
+
+    async def run():
+        await spool.start()
+        ok = await spool.submit_many([Transaction(category='Food', amount_lcy=1.0) for _ in range(3)])
+        await spool.close()
+        return ok
+
+    assert asyncio.run(run())
+    assert len(repo.stored) == 3
+    assert spool.spool.pending_bytes == 0
+
+
+def test_transactions_are_acknowledged_once_spooled_without_an_ack_timeout(tmp_path):
+    repo = FakeRepo()
+    repo.failures = 1000
+    spool = _transaction_spool(tmp_path, repo, ack_timeout=0)
+
+    async def run():
+        await spool.start()
+        ok = await asyncio.wait_for(spool.submit(Transaction(category='Food', amount_lcy=1.0)), 0.1)
+        pending = spool.spool.pending_bytes
+        repo.failures = 0
+        await spool.close()
+        return ok, pending
+
+    ok, pending = asyncio.run(run())
+    assert ok and pending > 0
+    assert len(repo.stored) == 1
+
+
+def test_transactions_that_do_not_fit_are_refused_before_spooling(tmp_path):
+    repo = FakeRepo()
+    spool = _transaction_spool(tmp_path, repo)
+
+    async def run():
+        await spool.start()
+        ok = await spool.submit_many([
+            Transaction(category='Food', amount_lcy=1.0),
+            Transaction(category='x' * 51, amount_lcy=1.0),
+        ])
+        await spool.close()
+        return ok
+
+    assert not asyncio.run(run())
+    assert repo.stored == {}
+    assert spool.spool.appends == 0
+
+
+def test_rows_the_database_rejects_go_to_the_dead_letter_file(tmp_path):
+    repo = FakeRepo()
+    spool = _transaction_spool(tmp_path, repo)
+    good = Transaction(category='Food', amount_lcy=1.0)
+    bad = Transaction(category='bad', amount_lcy=2.0)
+
+    async def run():
+        await spool.start()
+        ok = await spool.submit_many([good, bad])
+        await spool.close()
+        return ok
+
+    assert not asyncio.run(run())
+    assert list(repo.stored) == [good.transaction_id]
+    with open(spool.dead_letter_path, encoding='utf-8') as f:
+        lines = [json.loads(line) for line in f]
+    assert [line['transaction']['transaction_id'] for line in lines] == [bad.transaction_id]
+    assert 'sqlstate 23514' in lines[0]['error']
+    assert spool.rejected == 1
+
+
+def test_rows_are_dead_lettered_once_when_the_batch_is_retried(tmp_path):
+    repo = FakeRepo()
+    spool = _transaction_spool(tmp_path, repo)
+    bad = Transaction(category='bad', amount_lcy=1.0)
+    flaky = Transaction(category='flaky', amount_lcy=2.0)
+
+    async def run():
+        await spool.start()
+        ok = await spool.submit_many([bad, flaky])
+        await spool.close()
+        return ok
+
+    assert not asyncio.run(run())
+    assert list(repo.stored) == [flaky.transaction_id]
+    with open(spool.dead_letter_path, encoding='utf-8') as f:
+        assert [json.loads(line)['transaction']['transaction_id'] for line in f] == [bad.transaction_id]
+    assert (spool.inserted, spool.duplicates, spool.rejected, spool.retries) == (1, 0, 1, 1)
+
+
+def test_unreadable_records_go_to_the_dead_letter_file(tmp_path):
+    path = tmp_path / 'test.spool'
+    repo = FakeRepo()
+    first = Transaction(category='Food', amount_lcy=1.0)
+    last = Transaction(category='Fuel', amount_lcy=2.0)
+
+    async def run():
+        spool = _spool(tmp_path)
+        spool.open()
+        await spool.append_many([_encode(first), b'not json', b'corrupt', _encode(last)])
+        await spool.close()
+        data = bytearray(path.read_bytes())
+        data[len(data) - len(_encode(last)) - HEADER.size - 1] ^= 0xFF
+        path.write_bytes(bytes(data))
+        transaction_spool = _transaction_spool(tmp_path, repo)
+        await transaction_spool.start()
+        await transaction_spool.close()
+        return transaction_spool
+
+    transaction_spool = asyncio.run(run())
+    assert list(repo.stored) == [first.transaction_id, last.transaction_id]
+    with open(transaction_spool.dead_letter_path, encoding='utf-8') as f:
+        lines = [json.loads(line) for line in f]
+    assert base64.b64decode(lines[0]['data']) == b'not json'
+    assert base64.b64decode(lines[1]['data']).startswith(HEADER.pack(len(b'corrupt'), 0)[:4])
+    assert transaction_spool.rejected == 2
+
+
+def test_drainer_is_restarted_after_an_unexpected_error(tmp_path):
+    repo = FakeRepo()
+    spool = _transaction_spool(tmp_path, repo)
+    consume = spool.spool.consume
+    failures = [OSError('disk error')]
+
+    def failing_consume(offset):
+        if failures:
+            raise failures.pop()
+        consume(offset)
+
+    spool.spool.consume = failing_consume
+
+    async def run():
+        await spool.start()
+        ok = await spool.submit(Transaction(category='Food', amount_lcy=1.0))
+        await spool.close()
+        return ok
+
+    assert asyncio.run(run())
+    assert len(repo.stored) == 1
+    assert (spool.inserted, spool.duplicates) == (1, 1)
+    assert spool.spool.pending_bytes == 0
+
+
+def test_failed_inserts_stay_spooled_and_are_retried(tmp_path):
+    repo = FakeRepo()
+    repo.failures = 2
+    spool = _transaction_spool(tmp_path, repo)
+
+    async def run():
+        await spool.start()
+        ok = await spool.submit(Transaction(category='Food', amount_lcy=1.0))
+        await spool.close()
+        return ok
+
+    assert asyncio.run(run())
+    assert len(repo.stored) == 1
+    assert spool.retries == 2
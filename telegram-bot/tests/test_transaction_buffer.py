@@ -0,0 +1,79 @@
+import asyncio
+from typing import List
+
+from models.transaction import Transaction
+from models.transaction_buffer import TransactionBuffer
+
+
+class FakeRepo:
+    """Records the batches it is asked to insert; rows in category 'bad' fail like a constraint violation."""
+
+    def __init__(self) -> None:
+        self.batches: List[List[str]] = []
+        self.single: List[str] = []
+
+    async def insert_many(self, transactions: List[Transaction]) -> int:
+        self.batches.append([t.category for t in transactions])
+        if any(t.category == 'bad' for t in transactions):
+            raise ValueError('rejected')
+        return len(transactions)
+
+    async def insert(self, t: Transaction) -> bool:
+        self.single.append(t.category)
+        if t.category == 'bad':
+            raise ValueError('rejected')
+        return True
+
+
+def _transactions(*categories: str) -> List[Transaction]:
+    return [Transaction(category=c, amount_lcy=1.0) for c in categories]
+
+
+def test_concurrent_submits_share_one_insert():
+    repo = FakeRepo()
+
+    async def run():
+        buffer = TransactionBuffer(repo, max_size=10, max_delay=0.01)
+        return await asyncio.gather(*(buffer.submit(t) for t in _transactions('a', 'b', 'c')))
+
+    assert asyncio.run(run()) == [True, True, True]
+    assert repo.batches == [['a', 'b', 'c']]
+
+
+def test_full_batch_is_flushed_without_waiting_for_the_delay():
+    repo = FakeRepo()
+
+    async def run():
+        buffer = TransactionBuffer(repo, max_size=2, max_delay=60)
+        return await asyncio.wait_for(
+            asyncio.gather(*(buffer.submit(t) for t in _transactions('a', 'b'))), timeout=1
+        )
+
+    assert asyncio.run(run()) == [True, True]
+    assert repo.batches == [['a', 'b']]
+
+
+def test_failed_batch_is_retried_row_by_row():
+    repo = FakeRepo()
+
+    async def run():
+        buffer = TransactionBuffer(repo, max_size=10, max_delay=0.01)
+        return await asyncio.gather(*(buffer.submit(t) for t in _transactions('a', 'bad', 'c')))
+
+    assert asyncio.run(run()) == [True, False, True]
+    assert repo.single == ['a', 'bad', 'c']
+
+
+def test_close_flushes_pending_rows_and_later_submits_go_directly():
+    repo = FakeRepo()
+
+    async def run():
+        buffer = TransactionBuffer(repo, max_size=10, max_delay=60)
+        pending = asyncio.ensure_future(buffer.submit(_transactions('a')[0]))
+        await asyncio.sleep(0)
+        await buffer.close()
+        return await pending, await buffer.submit(_transactions('b')[0])
+
+    assert asyncio.run(run()) == (True, True)
+    assert repo.batches == [['a']]
+    assert repo.single == ['b']
@@ -0,0 +1,80 @@
+import asyncio
+import datetime
+from typing import List
+
+from telegram import Chat, Message, Update, User
+
+from utils.update_processor import PerUserUpdateProcessor
+
+
+def _update(update_id: int, user_id: int) -> Update:
+    message = Message(
+        update_id, datetime.datetime.now(), Chat(user_id, Chat.PRIVATE), from_user=User(user_id, 'user', False)
+    )
+    return Update(update_id, message=message)
+
+
+async def _handle(events: List[str], name: str, delay: float) -> None:
+    events.append(f'start {name}')
+    await asyncio.sleep(delay)
+    events.append(f'end {name}')
+
+
+def test_updates_of_one_user_run_in_order():
+    events: List[str] = []
+
+    async def run():
+        processor = PerUserUpdateProcessor(max_concurrent_updates=8)
+        await asyncio.gather(
+            processor.process_update(_update(1, 5), _handle(events, 'a', 0.02)),
+            processor.process_update(_update(2, 5), _handle(events, 'b', 0)),
+        )
+
+    asyncio.run(run())
+    assert events == ['start a', 'end a', 'start b', 'end b']
+
+
+def test_updates_of_different_users_run_concurrently():
+    events: List[str] = []
+
+    async def run():
+        processor = PerUserUpdateProcessor(max_concurrent_updates=8)
+        await asyncio.gather(
+            processor.process_update(_update(1, 5), _handle(events, 'a', 0.02)),
+            processor.process_update(_update(2, 6), _handle(events, 'b', 0)),
+        )
+
+    asyncio.run(run())
+    assert events == ['start a', 'start b', 'end b', 'end a']
+
+
+def test_active_keys_cover_running_and_waiting_updates():
+    async def run():
+        processor = PerUserUpdateProcessor(max_concurrent_updates=8)
+        release = asyncio.Event()
+        first = asyncio.ensure_future(processor.process_update(_update(1, 5), release.wait()))
+        second = asyncio.ensure_future(processor.process_update(_update(2, 5), asyncio.sleep(0)))
+        await asyncio.sleep(0)
+        during = (processor.is_active(('user', 5)), processor.is_active(('user', 6)), processor.active_keys)
+        release.set()
+        await asyncio.gather(first, second)
+        return during, (processor.is_active(('user', 5)), processor.active_keys)
+
+    during, after = asyncio.run(run())
+    assert during == (True, False, 1)
+    assert after == (False, 0)
+
+
+def test_updates_without_a_user_or_chat_are_not_ordered():
+    events: List[str] = []
+
+    async def run():
+        processor = PerUserUpdateProcessor(max_concurrent_updates=8)
+        await asyncio.gather(
+            processor.process_update(object(), _handle(events, 'a', 0.02)),
+            processor.process_update(object(), _handle(events, 'b', 0)),
+        )
+        return processor.active_keys
+
+    assert asyncio.run(run()) == 0
+    assert events == ['start a', 'start b', 'end b', 'end a']
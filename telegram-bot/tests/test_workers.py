@@ -0,0 +1,94 @@
+import asyncio
+import threading
+
+import pytest
+
+from models.transaction import Transaction
+from utils.workers import WorkerPool, WorkerPoolBusy
+
+
+def test_run_returns_the_result_and_counts_it():
+    async def run():
+        pool = WorkerPool(kind='thread', max_workers=2, max_pending=4, timeout=5)
+        try:
+            return await pool.run(sum, [1, 2, 3]), pool.stats()
+        finally:
+            pool.shutdown()
+
+    result, stats = asyncio.run(run())
+    assert result == 6
+    assert stats['completed'] == 1
+    assert stats['pending'] == 0
+
+
+def test_timed_out_job_stays_pending_until_it_finishes():
+    release = threading.Event()
+
+    async def run():
+        pool = WorkerPool(kind='thread', max_workers=1, max_pending=4, timeout=0.05)
+        try:
+            with pytest.raises(asyncio.TimeoutError):
+                await pool.run(release.wait, 5)
+            during = pool.stats()
+            release.set()
+            for _ in range(100):
+                if pool.pending == 0:
+                    break
+                await asyncio.sleep(0.01)
+            return during, pool.stats()
+        finally:
+            release.set()
+            pool.shutdown()
+
+    during, after = asyncio.run(run())
+    assert (during['pending'], during['abandoned'], during['timeouts']) == (1, 1, 1)
+    assert (after['pending'], after['abandoned']) == (0, 0)
+
+
+def test_work_is_rejected_while_every_worker_is_stuck():
+    release = threading.Event()
+
+    async def run():
+        pool = WorkerPool(kind='thread', max_workers=1, max_pending=4, timeout=0.05)
+        try:
+            with pytest.raises(asyncio.TimeoutError):
+                await pool.run(release.wait, 5)
+            with pytest.raises(WorkerPoolBusy):
+                await pool.run(sum, [1])
+            return pool.stats()
+        finally:
+            release.set()
+            pool.shutdown()
+
+    assert asyncio.run(run())['rejected'] == 1
+
+
+def test_work_beyond_max_pending_is_rejected():
+    release = threading.Event()
+
+    async def run():
+        pool = WorkerPool(kind='thread', max_workers=1, max_pending=2, timeout=5)
+        try:
+            jobs = [asyncio.ensure_future(pool.run(release.wait, 5)) for _ in range(2)]
+            await asyncio.sleep(0)
+            with pytest.raises(WorkerPoolBusy):
+                await pool.run(sum, [1])
+            release.set()
+            return await asyncio.gather(*jobs)
+        finally:
+            release.set()
+            pool.shutdown()
+
+    assert asyncio.run(run()) == [True, True]
+
+
+def test_long_messages_wait_for_the_pool_instead_of_overflowing_it():
+    async def run():
+        pool = WorkerPool(kind='thread', max_workers=2, max_pending=4, timeout=30)
+        try:
+            return await Transaction.afrom_entries(['March 5 100 food'] * 10, default_currency='USD', pool=pool)
+        finally:
+            pool.shutdown()
+
+    parsed = asyncio.run(run())
+    assert None not in parsed